@@ -0,0 +1,129 @@
+"""Vectorized modulation quality metrics of PSK symbols, e.g. from FSW.captureIQ.
+
+The functions only take and return NumPy arrays and plain values, so they can run in a worker
+process (concurrent.futures.ProcessPoolExecutor) while the next capture is in progress."""
+import numpy as np
+
+# number of points and phase of the first point in radians
+CONSTELLATIONS = {
+	'QPSK': (4, np.pi/4),
+	'8PSK': (8, 0.0),
+}
+# symbols summed per block when refining the carrier frequency estimate
+CARRIER_BLOCK = 64
+
+def lookup(constellation):
+	try:
+		return CONSTELLATIONS[constellation.upper()]
+	except KeyError:
+		raise ValueError("Unknown constellation %r, expected one of %r" % (constellation, sorted(CONSTELLATIONS)))
+
+def idealPoints(constellation='QPSK'):
+	"""
+	Returns the ideal points of a constellation, normalised to unit power.
+
+	Input:
+		constellation: string 'QPSK' or '8PSK'
+
+	Output:
+		NumPy array of complex points, indexed by symbol
+	"""
+	order, phase = lookup(constellation)
+	return np.exp(1j*(phase + 2*np.pi*np.arange(order)/order))
+
+def estimateCarrier(symbols, constellation='QPSK', symbolRate=1.0):
+	"""
+	Estimates the carrier frequency and phase offset of PSK symbols, blind to the data, by raising
+	the symbols to the constellation order to remove the modulation.
+
+	Input:
+		symbols: NumPy array of complex symbols, one sample per symbol
+		constellation: string 'QPSK' or '8PSK'
+		symbolRate: float symbols per second, 1.0 gives the frequency in cycles per symbol
+
+	Output:
+		(float frequency error in Hz, float phase offset in radians). The frequency is only unambiguous
+		within +/- symbolRate/(2*order), and the phase within +/- pi/order.
+	"""
+	order, phase = lookup(constellation)
+	powered = (np.asarray(symbols, dtype=np.complex128) * np.exp(-1j*phase)) ** order
+	n = np.arange(len(powered))
+	# coarse estimate from the rotation between neighbouring symbols
+	frequency = np.angle(np.vdot(powered[:-1], powered[1:])) / (2*np.pi*order)
+	powered = powered * np.exp(-2j*np.pi*order*frequency*n)
+	# refined by a line through the phases of block sums, which average out most of the noise
+	blocks = len(powered) // CARRIER_BLOCK
+	if blocks < 2:
+		return frequency*symbolRate, np.angle(powered.sum())/order
+	sums = powered[:blocks*CARRIER_BLOCK].reshape(blocks, CARRIER_BLOCK).sum(axis=1)
+	centers = np.arange(blocks)*CARRIER_BLOCK + (CARRIER_BLOCK - 1)/2.0
+	slope, intercept = np.polyfit(centers, np.unwrap(np.angle(sums)), 1)
+	frequency += slope / (2*np.pi*order)
+	return frequency*symbolRate, np.angle(np.exp(1j*intercept))/order
+
+def align(symbols, constellation='QPSK', symbolRate=1.0):
+	"""Removes the carrier offset and gain of the symbols and decides the symbol sent.
+	Returns (corrected symbols, symbol indices, ideal points of the indices, frequency error in Hz)."""
+	order, phase = lookup(constellation)
+	symbols = np.asarray(symbols, dtype=np.complex128)
+	frequency, offset = estimateCarrier(symbols, constellation, symbolRate)
+	corrected = symbols * np.exp(-1j*(2*np.pi*frequency/symbolRate*np.arange(len(symbols)) + offset))
+	corrected /= np.sqrt(np.mean(np.abs(corrected)**2))
+	indices = np.round((np.angle(corrected) - phase) * order/(2*np.pi)).astype(int) % order
+	ideal = idealPoints(constellation)[indices]
+	# least squares gain and residual phase against the decided points
+	corrected /= np.vdot(ideal, corrected) / len(corrected)
+	return corrected, indices, ideal, frequency
+
+def analyze(symbols, constellation='QPSK', symbolRate=1.0):
+	"""
+	Computes the modulation quality of one capture of PSK symbols.
+
+	Input:
+		symbols: NumPy array of complex symbols, one sample per symbol
+		constellation: string 'QPSK' or '8PSK'
+		symbolRate: float symbols per second, for the carrier frequency error in Hz
+
+	Output:
+		a python dictionary of
+			'mer': float modulation error ratio in dB
+			'evm': float RMS error vector magnitude in %
+			'evmpeak': float peak error vector magnitude in %
+			'phaseerror': float RMS phase error in degrees
+			'magnitudeerror': float RMS magnitude error in %
+			'carrierfreqerror': float carrier frequency error in Hz
+	"""
+	corrected, indices, ideal, frequency = align(symbols, constellation, symbolRate)
+	error = np.abs(corrected - ideal)**2
+	errorPower = np.mean(error)
+	return {
+		'mer': float(-10*np.log10(errorPower)),
+		'evm': float(100*np.sqrt(errorPower)),
+		'evmpeak': float(100*np.sqrt(error.max())),
+		'phaseerror': float(np.degrees(np.sqrt(np.mean(np.angle(corrected*np.conj(ideal))**2)))),
+		'magnitudeerror': float(100*np.sqrt(np.mean((np.abs(corrected) - 1)**2))),
+		'carrierfreqerror': float(frequency),
+	}
+
+def constellationStatistics(symbols, constellation='QPSK', symbolRate=1.0):
+	"""
+	Computes per-point statistics of one capture of PSK symbols, after removing the carrier offset and gain.
+
+	Input:
+		symbols: NumPy array of complex symbols, one sample per symbol
+		constellation: string 'QPSK' or '8PSK'
+		symbolRate: float symbols per second
+
+	Output:
+		a python dictionary of NumPy arrays, indexed like idealPoints(constellation)
+			'counts': integer number of symbols decided as each point
+			'centroids': complex mean of the symbols at each point (NaN for points never sent)
+			'spread': float RMS distance of the symbols from their centroid
+	"""
+	corrected, indices, ideal, frequency = align(symbols, constellation, symbolRate)
+	order = len(idealPoints(constellation))
+	counts = np.bincount(indices, minlength=order)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		centroids = (np.bincount(indices, corrected.real, order) + 1j*np.bincount(indices, corrected.imag, order)) / counts
+		spread = np.sqrt(np.bincount(indices, np.abs(corrected - centroids[indices])**2, order) / counts)
+	return {'counts': counts, 'centroids': centroids, 'spread': spread}
@@ -0,0 +1,3 @@
+__all__ = ["Constellation"]
+
+from .Constellation import analyze, constellationStatistics, estimateCarrier, idealPoints
@@ -0,0 +1,42 @@
+from .AsyncInstrument import AsyncWorker
+import logging
+logger = logging.getLogger(__name__)
+
+class AsyncComm(AsyncWorker):
+
+        def __init__(self, protocol, port, loop=None, **kwargs):
+                """Constructor. Opens a Comm (see Comm for the arguments) whose write and query can be awaited.
+                VISA calls block, so they run on a worker thread owned by this AsyncComm: commands to one
+                instrument stay in order while other instruments are served concurrently.
+
+                ~~~ Valid ranges ~~~
+                protocol: GPIB, serial, IP
+                port: String of port of IP address
+                loop: asyncio event loop, or None for the current event loop
+
+                """
+                super().__init__(self.open(protocol, port, **kwargs), loop)
+
+        def open(self, *args, **kwargs):
+                # imported here so that AsyncTelnetComm and AsyncSNMPComm do not require PyVISA
+                from .Comm import Comm
+                return Comm(*args, **kwargs)
+
+        @property
+        def comm(self):
+                return self.target
+
+        async def write(self, command):
+                await self.call(self.comm.write, command)
+
+        async def query(self, command):
+                return await self.call(self.comm.query, command)
+
+        async def writeAll(self, commands):
+                """Writes a list of commands as one batch (see Comm.batch), waiting for operation complete once."""
+                await self.call(self.writeBatch, commands)
+
+        def writeBatch(self, commands):
+                with self.comm.batch():
+                        for command in commands:
+                                self.comm.write(command)
@@ -0,0 +1,79 @@
+"""Runs blocking comms and instrument drivers on their own worker thread so that they can be awaited from an event loop."""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, functools, logging
+logger = logging.getLogger(__name__)
+
+class AsyncWorker(object):
+
+        def __init__(self, target, loop=None):
+                """
+                Wraps a blocking object. Every call is run on one worker thread owned by this wrapper,
+                so calls to the same object stay in order while different objects run concurrently.
+
+                Input:
+                        target: the blocking object, e.g. a Comm or an instrument driver
+                        loop: asyncio event loop, or None for the current event loop
+
+                Output:
+                        AsyncWorker object
+                """
+                self.target = target
+                self.loop = loop or asyncio.get_event_loop()
+                self.executor = ThreadPoolExecutor(max_workers=1)
+
+        @classmethod
+        def spawn(cls, loop=None):
+                """Returns an empty wrapper whose worker thread can be used before the target exists."""
+                worker = cls.__new__(cls)
+                AsyncWorker.__init__(worker, None, loop)
+                return worker
+
+        def call(self, function, *args, **kwargs):
+                """Returns a future for function(*args, **kwargs) run on the worker thread."""
+                return self.loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+        def close(self):
+                """Closes the wrapped object (if it has a close method) and stops the worker thread."""
+                if hasattr(self.target, 'close'):
+                        self.executor.submit(self.target.close).result()
+                self.executor.shutdown(wait=True)
+
+class AsyncInstrument(AsyncWorker):
+        """
+        Awaitable proxy for an instrument driver. Any driver method called through the proxy
+        returns an awaitable, e.g.
+
+                fsw = await AsyncInstrument.create(FSW, type="IP", port=FSW_IP, window="Spectrum")
+                slg = await AsyncInstrument.create(SLG, ip=SLG1_IP, port=5025)
+                await asyncio.gather(fsw.setFrequency(974e6), slg.setTransponder(victim, 1))
+
+        Attributes that are not methods are returned as they are.
+        """
+
+        @classmethod
+        async def create(cls, driver, *args, loop=None, **kwargs):
+                """
+                Constructs driver(*args, **kwargs) on a new worker thread, so several instruments
+                can connect and run their initial configuration concurrently.
+
+                Input:
+                        driver: instrument class, e.g. FSW or SLG
+                        loop: asyncio event loop, or None for the current event loop
+
+                Output:
+                        AsyncInstrument object
+                """
+                instrument = cls.spawn(loop)
+                instrument.target = await instrument.call(driver, *args, **kwargs)
+                logger.info("Created %s on its own worker thread" % type(instrument.target).__name__)
+                return instrument
+
+        def __getattr__(self, name):
+                attribute = getattr(self.target, name)
+                if not callable(attribute):
+                        return attribute
+                def method(*args, **kwargs):
+                        return self.call(attribute, *args, **kwargs)
+                method.__name__ = name
+                method.__doc__ = attribute.__doc__
+                return method
@@ -0,0 +1,31 @@
+from .AsyncComm import AsyncComm
+from .SNMPComm import SNMPComm
+import logging
+logger = logging.getLogger(__name__)
+
+class AsyncSNMPComm(AsyncComm):
+
+        def __init__(self, ip="192.168.10.1", port=161, loop=None, **kwargs):
+                """Constructor. Opens an SNMPComm (see SNMPComm for the arguments) whose write and query can be awaited.
+                Lists of OIDs are sent in one PDU, as with SNMPComm.
+
+                ~~~ Valid ranges ~~~
+                ip: String IP address
+                port: integer UDP port number
+                loop: asyncio event loop, or None for the current event loop
+
+                """
+                super().__init__(ip, port, loop=loop, **kwargs)
+
+        def open(self, *args, **kwargs):
+                return SNMPComm(*args, **kwargs)
+
+        async def writeAll(self, commands):
+                """Sets a list of OIDs with one SetRequest."""
+                await self.call(self.comm.write, list(commands))
+
+        async def bulk(self, oids, maxRepetitions=10, nonRepeaters=0):
+                return await self.call(self.comm.bulk, oids, maxRepetitions, nonRepeaters)
+
+        async def walk(self, oid, maxRepetitions=25):
+                return await self.call(self.comm.walk, oid, maxRepetitions)
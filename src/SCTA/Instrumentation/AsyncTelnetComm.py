@@ -0,0 +1,20 @@
+from .AsyncComm import AsyncComm
+from .TelnetComm import TelnetComm
+import logging
+logger = logging.getLogger(__name__)
+
+class AsyncTelnetComm(AsyncComm):
+
+        def __init__(self, ip, port=23, loop=None, **kwargs):
+                """Constructor. Opens a TelnetComm (see TelnetComm for the arguments) whose write and query can be awaited.
+
+                ~~~ Valid ranges ~~~
+                ip: String IP address
+                port: integer port number
+                loop: asyncio event loop, or None for the current event loop
+
+                """
+                super().__init__(ip, port, loop=loop, **kwargs)
+
+        def open(self, *args, **kwargs):
+                return TelnetComm(*args, **kwargs)
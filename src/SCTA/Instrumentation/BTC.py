@@ -1,5 +1,7 @@
 from . import Modulator
 from . import Comm
+from .InstrumentState import InstrumentState
+from .Cache import queryFor
 import logging
 import time
 from .ResourceManagers import PyvisaResourceManager
@@ -7,7 +9,7 @@ from ..System import Mode, Transponder
 
 logger = logging.getLogger(__name__)
 
-class BTC(Modulator):
+class BTC(Modulator, InstrumentState):
 	constellation={
 	1: ("QPSK", "1/4"),
 	2: ("QPSK", "1/3"),
@@ -35,7 +37,24 @@ class BTC(Modulator):
 		value=constellation[key]
 		reverse_const[value]=key
 
-	def __init__(self, id="BTC", type="GPIB", port="28", numMods=2):
+	# settings config writes for each modulator, formatted with the modulator number
+	MOD_CONFIG = [
+		"SOUR%d:DM:NOIS:AWGN:COUP ON",				#Sets bandwidth coupling ON
+		"SOUR%d:NOIS:AWGN ON",
+		"SOUR%d:NOIS:COUP ON",						#Enables bandwith coupling ON in AWGN/Impulsive noise Tab
+		"SOUR%d:DM:NOIS:AWGN:COUP ON",
+		"SOUR%d:DM:NOISE:AWGN OFF",					#Disables AWGN in DTV tab
+		"SOUR%d:NOIS:AWGN ON",						#Enables AWGN in AWGN/Impulsive noise tab
+		"SOUR%d:DM:TYPE DTV",						#Configures BTC to DTV mode
+		"SOUR%d:IQC:DVBS2:SOUR TEST",				#Configures BTC for Test mode
+		"SOUR%d:IQC:DVBS2:FECF NORM",				#Configures BTC FEC
+		"SOUR%d:IQC:DVBS2:TSP S187",				#Configures BTC for 187 byte packets for DVBS2
+		"SOUR%d:IQC:DVBS2:PRBS:SEQ P23_1",			#Configures packets to have PRBS 2^(23-1)
+	]
+	# further settings of each modulator read back by warm construction (fading, distortion, noise)
+	MOD_WARM_QUERIES = ["SOUR%d:FSIM:STAT?", "SOUR%d:DIST:TX?", "SOUR%d:NOISE:STAT?"]
+
+	def __init__(self, id="BTC", type="GPIB", port="28", numMods=2, warm=False, completion="opc"):
 		"""
 		Creates an BTC object, which starts a connection for reading and writing commands to the BTC.
 		With no inputs specified, it assumes the host computer's interface is GPIB at port 28.
@@ -44,20 +63,27 @@ class BTC(Modulator):
 			id: string
 			type: string interface type
 			port: string interface address/ port
+			numMods: integer number of modulators
+			warm: boolean, read the BTC's settings back in bulk and only write the ones that differ,
+			      instead of configuring it from scratch
+			completion: string 'opc' (the default) or 'status', how the comm waits for operation complete.
+			            'status' only for a BTC checked to report the OPC event as documented (see Comm)
 
 		Output:
 			BTC object
 
 		~~~ Valid ranges ~~~
-		type:        ['GPIB', 'IP']
+		type:        ['GPIB', 'IP', 'SOCKET']
 		port:        ['28' or '192.10.10.10']
 		cnr:         [0, 20] dB
 		"""
 
-		self.comm = Comm(protocol=type, port=port)
+		self.comm = Comm(protocol=type, port=port, completion=completion)
 		self.cnr=None
 		self.numMods=numMods
 		#super ().__init__(id=id)
+		if warm:
+			self.readSettings()
 		self.config()
 		
 
@@ -90,25 +116,56 @@ class BTC(Modulator):
 		"""
 		self.comm.write("&GTR")
 		logger.info("BTC device ID: %s" % (self.comm.query("*IDN?")) )
-		self.comm.write("SYST:DISP:UPD ON")
-		for mods in list(range(1, self.numMods+1)):
-			self.comm.write("SOUR%d:DM:NOIS:AWGN:COUP ON"% mods) 				#Sets bandwidth coupling ON
-			self.comm.write("SOUR%d:NOIS:AWGN ON" % mods)
-			self.comm.write("SOUR%d:NOIS:COUP ON")							#Enables bandwith coupling ON in AWGN/Impulsive noise Tab
-			self.comm.write("SOUR%d:DM:NOIS:AWGN:COUP ON" % mods)
-			self.comm.write("SOUR%d:DM:NOISE:AWGN OFF" % mods)				#Disables AWGN in DTV tab
-			self.comm.write("SOUR%d:NOIS:AWGN ON")							#Enables AWGN in AWGN/Impulsive noise tab
-			self.comm.write("SOUR%d:DM:TYPE DTV" % mods)					#Configures BTC to DTV mode 
-			self.comm.write("SOUR%d:IQC:DVBS2:SOUR TEST" % mods)			#Configures BTC for Test mode
-			self.comm.write("SOUR%d:IQC:DVBS2:FECF NORM" % mods)			#Configures BTC FEC 
-			self.comm.write("SOUR%d:IQC:DVBS2:TSP S187" % mods)			#Configures BTC for 187 byte packets for DVBS2
-			self.comm.write("SOUR%d:IQC:DVBS2:PRBS:SEQ P23_1" % mods)	#Configures packets to have PRBS 2^(23-1)
-			self.enableFading(False, mods)
-			self.enableDistortion(False, mods)
-			self.setNoiseState("OFF", mods)
-			self.setPhaseNoise(False, mods)
+		# queue the configuration so it is sent with as few operation-complete waits as possible
+		with self.comm.batch():
+			self.comm.write("SYST:DISP:UPD ON")
+			for mods in list(range(1, self.numMods+1)):
+				for command in self.MOD_CONFIG:
+					self.comm.write(command % mods)
+				self.enableFading(False, mods)
+				self.enableDistortion(False, mods)
+				self.setNoiseState("OFF", mods)
+				self.setPhaseNoise(False, mods)
 		logger.info("BTC configuration complete")
 
+	def readSettings(self):
+		"""
+		Reads the settings config writes with as few queries as possible and starts the state cache with them,
+		so config only writes the settings that differ. Only called by BTC __init__ with warm=True
+		WARNING: NOT A USER FUNCTION
+
+		Input:
+			None
+
+		Output:
+			None
+		"""
+		self.comm.enableStateCache()
+		queries = self.stateQueries()
+		for mods in list(range(1, self.numMods+1)):
+			queries.extend(query % mods for query in self.MOD_WARM_QUERIES)
+		self.comm.readBack(queries)
+		logger.info("Read back %d BTC settings" % len(queries))
+
+	def stateQueries(self):
+		"""
+		Returns the queries of the settings config writes for each modulator, which identify
+		a setup saved by saveState (see InstrumentState)
+
+		Input:
+			None
+
+		Output:
+			list of string SCPI queries
+		"""
+		queries = [queryFor("SYST:DISP:UPD ON")]
+		for mods in list(range(1, self.numMods+1)):
+			for command in self.MOD_CONFIG:
+				query = queryFor(command % mods)
+				if query not in queries:
+					queries.append(query)
+		return queries
+
 	def setTransponder(self, txpdr, modNumber):
 		"""
 		Sets the transponder settings to the SLG from the Modulator class.
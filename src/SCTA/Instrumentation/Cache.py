@@ -0,0 +1,340 @@
+"""Shadow copies of instrument settings and answers, used by the comm classes to skip redundant writes and queries."""
+from collections import OrderedDict
+import logging, re, time
+logger = logging.getLogger(__name__)
+
+VOWELS = "AEIOU"
+NODE = re.compile(r'^([A-Za-z_*]+)(\d*)$')
+
+def shortForm(node):
+        """Returns the SCPI short form of one header node, e.g. 'CHANnel2' -> 'CHAN2', 'FREQUENCY' -> 'FREQ'.
+        Mixed case nodes are abbreviated to their upper case letters. Upper case nodes follow the SCPI rule:
+        the first four letters, or three if the fourth is a vowel."""
+        match = NODE.match(node)
+        if match is None:
+                return node.upper()
+        name, suffix = match.groups()
+        if name != name.upper():
+                name = "".join(c for c in name if c.isupper() or c == '*')
+        elif len(name) > 4:
+                name = name[:3] if name[3] in VOWELS else name[:4]
+        return name.upper() + suffix
+
+def parseCommand(command):
+        """
+        Splits an SCPI command into its normalised header and argument string.
+
+        Input:
+                command: string, e.g. ':SENSe:FREQuency:CENTer 974e6' or 'MOD:CHAN1:SYMB?'
+
+        Output:
+                (string header, string arguments or None, boolean query), e.g. ('SENS:FREQ:CENT', '974e6', False)
+        """
+        command = command.strip()
+        parts = command.split(None, 1)
+        header = parts[0].lstrip(':')
+        arguments = parts[1].strip() if len(parts) > 1 else None
+        query = header.endswith('?')
+        header = header.rstrip('?')
+        if not header.startswith('*'):
+                header = ":".join(shortForm(node) for node in header.split(':'))
+        else:
+                header = header.upper()
+        return header, arguments, query
+
+# boolean words and the numbers instruments answer for them
+BOOLEANS = {"ON": "1", "OFF": "0"}
+
+def sameValue(a, b):
+        """Compares two SCPI values numerically when both are numbers, otherwise as case-insensitive strings
+        where ON/OFF equal 1/0 and unquoted mnemonics equal their short form, e.g. 'SINGLE' and 'SING'."""
+        try:
+                return float(a) == float(b)
+        except (TypeError, ValueError):
+                pass
+        a, b = [str(value).strip() for value in (a, b)]
+        if a.startswith(("'", '"')) or b.startswith(("'", '"')):
+                return a.strip("'\"").upper() == b.strip("'\"").upper()
+        a, b = [BOOLEANS.get(value.upper(), value.upper()) for value in (a, b)]
+        return (a == b) or (shortForm(a) == shortForm(b))
+
+def queryFor(command):
+        """Returns the query reading back the setting a command writes, e.g. 'SOUR:NOIS:COUP ON' -> 'SOUR:NOIS:COUP?'."""
+        return parseCommand(command)[0] + "?"
+
+class StateCache(object):
+
+        # commands after which every cached setting is unknown
+        INVALIDATE = set(["*RST", "*RCL", "SYST:PRES", "MMEM:LOAD:STAT", "SENS:ADJ:LEV", "ADJ:LEV",
+                "SENS:POW:ACH:PRES", "POW:ACH:PRES"])
+        # commands that do something every time they are sent, so they are never skipped
+        ACTIONS = set(["INST:CRE", "INIT", "INIT:IMM", "MMEM:STOR:STAT", "CALC:MARK:FUNC:POW:SEL"])
+        # commands that select a new channel without INST:SEL
+        SCOPE_CHANGES = set(["INST:CRE"])
+        # header that selects the channel (measurement window) the other settings belong to
+        SCOPE = "INST:SEL"
+
+        def __init__(self):
+                """
+                Shadow registers for an instrument: the last value written or read for each SCPI header.
+                Writes that would set a header to the value it already has are skipped.
+                Settings are kept per INST:SEL channel, and cleared by *RST, *RCL and loading a state file.
+                Call invalidate() after anyone changes the instrument by other means, e.g. the front panel.
+
+                Output:
+                        StateCache object
+                """
+                self.values = {}        # (scope, header) -> string value
+                self.scope = None
+                self.skipped = 0        # number of writes suppressed
+
+        def key(self, header):
+                if (header == self.SCOPE) or header.startswith('*'):
+                        return (None, header)
+                return (self.scope, header)
+
+        def write(self, command):
+                """Records a write and returns False if it can be skipped because nothing would change."""
+                if ';' in command:
+                        # concatenated commands are sent as they are and forget what they touch
+                        for part in command.split(';'):
+                                if part.strip():
+                                        self.forget(parseCommand(part)[0])
+                        return True
+                header, arguments, query = parseCommand(command)
+                if header in self.INVALIDATE:
+                        self.invalidate()
+                        return True
+                if header in self.SCOPE_CHANGES:
+                        self.forget(self.SCOPE)
+                if (arguments is None) or (header in self.ACTIONS) or header.startswith('*'):
+                        return True
+                return self.setValue(header, arguments)
+
+        def setValue(self, header, value):
+                """Records that header is being set to value and returns False if it already has that value.
+                Also used directly by comms without SCPI headers, e.g. with SNMP OIDs."""
+                key = self.key(header)
+                if (key in self.values) and sameValue(self.values[key], value):
+                        self.skipped += 1
+                        logger.debug("Skipped setting %s, it is already %s" % (header, self.values[key]))
+                        return False
+                self.values[key] = value
+                if header == self.SCOPE:
+                        self.scope = str(value).strip("'\"").upper()
+                # settings below a changed node (e.g. MOD:CHAN1:FORM:RATE after MOD:CHAN1:FORM) may be reset by it
+                for other in [other for other in self.values if other[0] == key[0] and other[1].startswith(header + ':')]:
+                        del self.values[other]
+                # and a setting coupled again (e.g. SENS:BAND:RES:AUTO ON) gets a value chosen by the instrument
+                if header.endswith(':AUTO'):
+                        self.values.pop((key[0], header[:-len(':AUTO')]), None)
+                return True
+
+        def recordValue(self, header, value):
+                """Records a value read back from the instrument."""
+                self.values[self.key(header)] = value
+                if header == self.SCOPE:
+                        self.scope = str(value).strip("'\"").upper()
+
+        def read(self, command, result):
+                """Records the answer to a query without parameters."""
+                if ';' in command:
+                        return
+                header, arguments, query = parseCommand(command)
+                if (arguments is not None) or header.startswith('*') or (header in self.ACTIONS):
+                        return
+                self.recordValue(header, result)
+
+        def get(self, command):
+                """Returns the cached value of a header, or None."""
+                return self.values.get(self.key(parseCommand(command)[0]))
+
+        def forget(self, header):
+                for key in [key for key in self.values if key[1] == header]:
+                        del self.values[key]
+                if header == self.SCOPE:
+                        self.scope = None
+
+        def invalidate(self, command=None):
+                """Forgets the value of one command's header, or of everything if command is None."""
+                if command is None:
+                        self.values.clear()
+                        self.scope = None
+                        logger.debug("State cache cleared")
+                else:
+                        self.forget(parseCommand(command)[0])
+
+def pattern(header):
+        """Returns a header without its numeric suffixes, e.g. 'MOD:CHAN3:SYMB' -> 'MOD:CHAN:SYMB'."""
+        return ":".join(NODE.sub(r'\1', node) for node in header.split(':'))
+
+class QueryCache(object):
+
+        # commands after which every cached answer except the common (*) queries is stale
+        INVALIDATE = StateCache.INVALIDATE
+        SCOPE = StateCache.SCOPE
+        SCOPE_CHANGES = StateCache.SCOPE_CHANGES
+
+        def __init__(self):
+                """
+                Answers to selected queries, each kept for a time to live (TTL) and up to a number of entries.
+                Only queries registered with add() are cached. A write to a header forgets the cached
+                answers of that header and the headers below it, and answers are kept per INST:SEL channel.
+
+                Output:
+                        QueryCache object
+                """
+                self.rules = {}         # header pattern -> (ttl seconds or None, size)
+                self.entries = {}       # (scope, header) -> OrderedDict of arguments -> (time, answer)
+                self.scope = None
+                self.hits = 0
+                self.misses = 0
+
+        def add(self, command, ttl=None, size=16):
+                """
+                Starts caching the answers to a query.
+
+                Input:
+                        command: string query, numeric suffixes match any channel, e.g. 'MOD:CHAN:SYMB?'
+                        ttl: float seconds an answer stays valid, None keeps it until a write invalidates it
+                        size: integer number of answers kept per header, e.g. for queries with different arguments
+                """
+                self.rules[pattern(parseCommand(command)[0])] = (ttl, size)
+
+        def key(self, header):
+                if (header == self.SCOPE) or header.startswith('*'):
+                        return (None, header)
+                return (self.scope, header)
+
+        def get(self, command):
+                """Returns the cached answer to a query, or None if it must be sent to the instrument."""
+                header, arguments, query = parseCommand(command)
+                rule = self.rules.get(pattern(header))
+                if (rule is None) or not query:
+                        return None
+                answers = self.entries.get(self.key(header), {})
+                if arguments in answers:
+                        stored, answer = answers[arguments]
+                        if (rule[0] is None) or (time.perf_counter() - stored < rule[0]):
+                                answers.move_to_end(arguments)
+                                self.hits += 1
+                                logger.debug("Answered %s from the query cache" % repr(command))
+                                return answer
+                        del answers[arguments]
+                self.misses += 1
+                return None
+
+        def put(self, command, answer):
+                """Stores the answer to a query, if the query is cached."""
+                header, arguments, query = parseCommand(command)
+                rule = self.rules.get(pattern(header))
+                if (rule is None) or not query:
+                        return
+                answers = self.entries.setdefault(self.key(header), OrderedDict())
+                answers[arguments] = (time.perf_counter(), answer)
+                answers.move_to_end(arguments)
+                while len(answers) > rule[1]:
+                        answers.popitem(last=False)
+
+        def write(self, command):
+                """Forgets the answers a write may change."""
+                for part in command.split(';'):
+                        if not part.strip():
+                                continue
+                        header, arguments, query = parseCommand(part)
+                        if header in self.INVALIDATE:
+                                self.invalidate()
+                        elif (header == self.SCOPE) and (arguments is not None):
+                                self.scope = arguments.strip("'\"").upper()
+                        elif header in self.SCOPE_CHANGES:
+                                self.scope = None
+                        else:
+                                self.forget(header)
+
+        def forget(self, header):
+                for key in [key for key in self.entries if (key[1] == header) or key[1].startswith(header + ':')]:
+                        del self.entries[key]
+
+        def invalidate(self, command=None):
+                """Forgets the answers to one command's header, or all answers except the common (*) queries."""
+                if command is not None:
+                        self.forget(parseCommand(command)[0])
+                        return
+                for key in [key for key in self.entries if not key[1].startswith('*')]:
+                        del self.entries[key]
+                self.scope = None
+
+        def stats(self):
+                """Returns a dictionary of 'hits', 'misses' and 'entries' (the number of answers cached)."""
+                return {'hits': self.hits, 'misses': self.misses,
+                        'entries': sum(len(answers) for answers in self.entries.values())}
+
+class LevelCache(object):
+
+        def __init__(self, frequencyBin=10e6, tolerance=3.0):
+                """
+                Input levels (reference level, attenuation) found by an analyzer's auto level, so they can be
+                set again for the same channel instead of running another auto-ranging sweep.
+                Levels are kept per measurement window and frequency bin, for nominal input powers within
+                tolerance of the power they were found at.
+
+                Input:
+                        frequencyBin: float Hz, center frequencies in the same bin share their levels
+                        tolerance: float dB, largest difference of nominal power at which levels are reused
+
+                Output:
+                        LevelCache object
+                """
+                self.frequencyBin = frequencyBin
+                self.tolerance = tolerance
+                self.entries = {}       # (window, frequency bin) -> list of [nominal power or None, levels]
+                self.hits = 0
+                self.misses = 0
+
+        def key(self, window, frequency):
+                return (window, int(round(frequency / self.frequencyBin)))
+
+        def find(self, window, frequency, power):
+                for entry in self.entries.get(self.key(window, frequency), []):
+                        if (entry[0] is None) or (power is None) or (abs(entry[0] - power) <= self.tolerance):
+                                return entry
+                return None
+
+        def get(self, window, frequency, power=None):
+                """
+                Returns the levels found for a channel, or None if auto level must run.
+
+                Input:
+                        window: string measurement window, e.g. 'VSA'
+                        frequency: float center frequency in Hz
+                        power: float nominal input power in dBm, None matches any
+                """
+                entry = self.find(window, frequency, power)
+                if entry is None:
+                        self.misses += 1
+                        return None
+                self.hits += 1
+                logger.debug("Reusing input levels %r at %.2f MHz" % (entry[1], frequency/1e6))
+                return dict(entry[1])
+
+        def put(self, window, frequency, power, levels):
+                """Stores the levels (dictionary of setting -> value) auto level found for a channel."""
+                entry = self.find(window, frequency, power)
+                if entry is None:
+                        self.entries.setdefault(self.key(window, frequency), []).append([power, dict(levels)])
+                else:
+                        entry[0], entry[1] = power, dict(levels)
+
+        def discard(self, window, frequency, power=None):
+                """Forgets the levels of a channel, e.g. after they overloaded the input."""
+                entry = self.find(window, frequency, power)
+                if entry is not None:
+                        self.entries[self.key(window, frequency)].remove(entry)
+
+        def clear(self):
+                self.entries.clear()
+
+        def stats(self):
+                """Returns a dictionary of 'hits', 'misses' and 'entries' (the number of channels with levels)."""
+                return {'hits': self.hits, 'misses': self.misses,
+                        'entries': sum(len(entries) for entries in self.entries.values())}
@@ -1,50 +1,355 @@
 # Comm class behaves differently under simulation
 from .ResourceManagers import PyvisaResourceManager, VisaIOError
-import logging
+from .Cache import StateCache, QueryCache, parseCommand
+from .SCPI import joinCommands, pollUntil, checkEventStatus, blockHeader, readBlock, ESR_OPC, STB_ESB
+from .Tracing import trace
+from contextlib import contextmanager
+from collections import deque
+import numpy as np
+import logging, time
 logger = logging.getLogger(__name__)
 
 class Comm(object):
 
-        def __init__(self, protocol, port, rm=PyvisaResourceManager(), config={}):
+        # Longest program message sent when flushing a batch of writes
+        BATCH_MAX_LENGTH = 1024
+        # Number of per-command completion times kept in completionTimes
+        COMPLETION_HISTORY = 1000
+        # Most bytes asked of pyvisa in one read of a binary block
+        BLOCK_CHUNK_SIZE = 1 << 20
+
+        def __init__(self, protocol, port, rm=PyvisaResourceManager(), config={}, completion="opc"):
                 """Constructor.
 
                 ~~~ Valid ranges ~~~
-                protocol: GPIB, serial, IP
-                port: String of port of IP address
+                protocol: GPIB, serial, IP, SOCKET (raw SCPI over TCP, e.g. Simulation.InstrumentServer)
+                port: String of port of IP address, for SOCKET 'ip' or 'ip::port' (port 5025 by default)
+                completion: 'opc' polls *OPC? (the default, see pollOperationComplete),
+                            'status' waits on the status byte (service request or serial poll with backoff),
+                            for drivers whose instrument has been checked to report the OPC event as documented
 
                 """
                 self.protocol=protocol
                 self.port=port
+                self.completion=completion
+                # polling backoff used when a service request cannot be waited on
+                self.pollInterval=0.001
+                self.pollBackoff=2.0
+                self.pollMaxInterval=0.1
+                self.completionTimeout=None     # seconds, None waits forever
+                self.completionTimes=deque(maxlen=self.COMPLETION_HISTORY)     # (command, seconds) pairs
+                self.statusEnabled=False
 
                 # translate into pyvisa port notation
                 if protocol == "GPIB":
                         port="GPIB::"+str(port)+"::INSTR"
                 if protocol == "IP":
                         port="TCPIP0::"+port+"::INSTR"
+                if protocol == "SOCKET":
+                        if "::" not in port:
+                                port=port+"::5025"
+                        port="TCPIP0::"+port+"::SOCKET"
 
                 self.instrument=rm.open_resource(port)#, kwargs=config)
+                if protocol == "SOCKET":
+                        # raw sockets have no end-of-message signal, so messages are terminated by newlines
+                        self.instrument.read_termination="\n"
+                        self.instrument.write_termination="\n"
                 logger.info("Connected to instrument at port %s" % str(port))
+                self.name = str(port)   # resource name used in traces
                 #self.instrument.timeout=2000
+                self.pending = None     # writes queued by batch(), None when not batching
+                self.cache = None       # StateCache of the instrument's settings, see enableStateCache()
+                self.queryCache = None  # QueryCache of slow-changing answers, see enableQueryCache()
+
+        def isSCPI(self):
+                return self.protocol in ("GPIB", "IP", "SOCKET")
+
+        def header(self, command):
+                """Returns the header a command is traced under: the SCPI short form, or the first word of other commands."""
+                if self.isSCPI():
+                        return parseCommand(command)[0]
+                return command.split(None, 1)[0] if command.strip() else ""
         
         def write(self, command):
-                self.instrument.write(command)
-                logger.info("Wrote %s" % repr(command))
-                if (self.protocol == "GPIB") or (self.protocol == "IP"):
-                        self.scpiCompleteOperation()
-                        logger.debug("Write operation complete")
+                if self.queryCache is not None:
+                        self.queryCache.write(command)
+                if (self.cache is not None) and not self.cache.write(command):
+                        logger.debug("Skipped %s, setting unchanged" % repr(command))
+                        return
+                if (self.pending is not None) and self.isSCPI():
+                        self.pending.append(command)
+                        logger.debug("Queued %s" % repr(command))
+                        return
+                start = time.perf_counter()
+                try:
+                        self.instrument.write(command)
+                        logger.info("Wrote %s" % repr(command))
+                        opc = 0.0
+                        if self.isSCPI():
+                                opc = self.scpiCompleteOperation(command)
+                                logger.debug("Write operation complete")
+                except BaseException:
+                        self.discard([command])
+                        raise
+                trace(self.name, self.header(command), start, opc, sent=len(command) + 1)
 
         def query(self, command):
+                if self.queryCache is not None:
+                        result = self.queryCache.get(command)
+                        if result is not None:
+                                return result
+                self.flush()
+                start = time.perf_counter()
                 result= self.instrument.query(command)
+                trace(self.name, self.header(command) + '?', start, sent=len(command) + 1, received=len(result))
                 logger.info("Queried %s" % repr(command))
                 logger.debug("query result = %s" % result)
                 result= result.replace("\n","")
+                if self.cache is not None:
+                        self.cache.read(command, result)
+                if self.queryCache is not None:
+                        self.queryCache.put(command, result)
                 return result   
 
-        def scpiCompleteOperation(self):
+        def readBack(self, queries):
+                """
+                Reads many settings with as few round trips as possible, concatenating the queries into messages
+                of up to BATCH_MAX_LENGTH characters, and primes the state and query caches with the answers,
+                e.g. to attach to an instrument that is already set up without writing its settings again.
+
+                Input:
+                        queries: list of string SCPI queries without arguments, e.g. ['FREQ?', 'POW?']
+
+                Output:
+                        list of string answers, in the order of queries
+                """
+                answers = []
+                for message in joinCommands(queries, self.BATCH_MAX_LENGTH):
+                        answers.extend(self.query(message).split(';'))
+                if len(answers) != len(queries):
+                        raise ValueError("Got %d answers to %d queries" % (len(answers), len(queries)))
+                for query, answer in zip(queries, answers):
+                        if self.cache is not None:
+                                self.cache.read(query, answer)
+                        if self.queryCache is not None:
+                                self.queryCache.put(query, answer)
+                logger.debug("Read back %d settings" % len(queries))
+                return answers
+
+        def readInto(self, view):
+                """Fills a memoryview with the next bytes from the instrument."""
+                received = 0
+                while received < len(view):
+                        data = self.instrument.read_bytes(min(len(view) - received, self.BLOCK_CHUNK_SIZE), break_on_termchar=False)
+                        view[received:received + len(data)] = data
+                        received += len(data)
+
+        def queryBinary(self, command, dtype='<f4', buffer=None):
+                """
+                Sends a query answered with an IEEE 488.2 binary block, e.g. 'TRAC:DATA? TRACE1' after 'FORM REAL,32',
+                and reads the block's data straight into a buffer without converting it to text.
+
+                Input:
+                        command: string SCPI query
+                        dtype: NumPy data type of the block's values, e.g. '<f4' for REAL,32 or 'u1' for a file
+                        buffer: bytearray, memoryview or NumPy array to read into, reused between calls to avoid
+                                allocating, or None to allocate one the size of the block
+
+                Output:
+                        NumPy array viewing the data in the buffer (it changes when the buffer is read into again)
+                """
+                self.flush()
+                start = time.perf_counter()
+                self.instrument.write(command)
+                buffer, length = readBlock(self.readInto, buffer)
+                trace(self.name, self.header(command) + '?', start, sent=len(command) + 1, received=length)
+                logger.info("Queried %s" % repr(command))
+                logger.debug("query result = %d byte block" % length)
+                dtype = np.dtype(dtype)
+                return np.frombuffer(buffer, dtype=dtype, count=length // dtype.itemsize)
+
+        def writeBinary(self, command, data):
+                """
+                Sends a command with an IEEE 488.2 binary block as its last argument, e.g. writeBinary("MMEM:DATA 'cal.dat',", data)
+
+                Input:
+                        command: string SCPI command up to the block
+                        data: bytes, bytearray, memoryview or C-contiguous NumPy array
+                """
+                self.flush()
+                payload = memoryview(data).cast('B')
+                start = time.perf_counter()
+                head = command.encode('ascii') + b' ' + blockHeader(len(payload))
+                self.instrument.write_raw(head + payload + b'\n')
+                logger.info("Wrote %s with a %d byte block" % (repr(command), len(payload)))
+                opc = 0.0
+                if self.isSCPI():
+                        opc = self.scpiCompleteOperation(command)
+                trace(self.name, self.header(command), start, opc, sent=len(head) + len(payload) + 1)
+
+        def enableStateCache(self):
+                """Starts skipping writes that would not change the instrument's settings (see Cache.StateCache)."""
+                if self.cache is None:
+                        self.cache = StateCache()
+                return self.cache
+
+        def enableQueryCache(self, queries={}):
+                """Starts answering the given queries from a cache (see Cache.QueryCache).
+
+                Input:
+                        queries: dictionary of string query -> float TTL seconds (None until a write invalidates it),
+                                 e.g. {'*IDN?': None, 'SENS:DDEM:SRAT?': 60}. More can be added with queryCache.add().
+                """
+                if self.queryCache is None:
+                        self.queryCache = QueryCache()
+                for query, ttl in queries.items():
+                        self.queryCache.add(query, ttl)
+                return self.queryCache
+
+        def cachedValue(self, command):
+                """Returns the value the state cache holds for a command's setting, e.g. 'MOD:CHAN1:SOUR',
+                or None if it is unknown or the cache is off. Drivers ask this rather than the cache itself
+                so that sessions recorded with a primed cache replay the same way (see Recorder)."""
+                if self.cache is None:
+                        return None
+                return self.cache.get(command)
+
+        def invalidate(self, command=None):
+                """Forgets the cached value of one command's setting, or of all settings.
+                Call this after the instrument was changed without this comm, e.g. from the front panel."""
+                if self.cache is not None:
+                        self.cache.invalidate(command)
+                if self.queryCache is not None:
+                        self.queryCache.invalidate(command)
+
+        def discard(self, commands):
+                """Forgets the settings the state cache recorded for writes that did not reach the instrument,
+                e.g. the queue of a batch that raised, so they are not skipped when written again."""
+                if self.cache is None:
+                        return
+                for command in commands:
+                        for part in command.split(';'):
+                                if part.strip():
+                                        self.cache.invalidate(part)
+
+        @contextmanager
+        def batch(self):
+                """Queues all writes made inside the with-block and sends them as concatenated
+                SCPI messages when the block exits, waiting for operation complete only once.
+                A query inside the block first flushes the queued writes, so ordering is kept.
+                Nested batches join the outermost one. Only applies to GPIB and IP instruments.
+                If the block raises an exception, the writes still queued are discarded.
+
+                Usage:
+                        with fsw.comm.batch():
+                                fsw.setFrequency(974e6)
+                                fsw.setSpan(60e6)
+                """
+                if self.pending is not None:
+                        yield self
+                        return
+                self.pending = []
+                try:
+                        yield self
+                        self.flush()
+                except BaseException:
+                        self.discard(self.pending)
+                        raise
+                finally:
+                        self.pending = None
+
+        def flush(self):
+                """Sends the writes queued by batch() and waits once for all of them to complete."""
+                if not self.pending:
+                        return
+                commands = self.pending[:]
+                del self.pending[:]
+                start = time.perf_counter()
+                sent = 0
+                try:
+                        for message in joinCommands(commands, self.BATCH_MAX_LENGTH):
+                                self.instrument.write(message)
+                                sent += len(message) + 1
+                                logger.info("Wrote %s" % repr(message))
+                        opc = self.scpiCompleteOperation("batch of %d writes" % len(commands))
+                except BaseException:
+                        self.discard(commands)
+                        raise
+                trace(self.name, "(batch)", start, opc, sent=sent)
+                logger.debug("Batch of %d writes complete" % len(commands))
+
+        def scpiCompleteOperation(self, command=None):
                 """For SCPI commands only! Some commands will take the instrument a long time to run.
-                Instead of setting an arbitrarily long timeout, poll the operation complete status until it returns true.
+                Instead of setting an arbitrarily long timeout, wait for the operation complete event.
+                The time spent waiting is appended to completionTimes along with the command, and returned."""
+                start = time.perf_counter()
+                if self.completion == "opc":
+                        self.pollOperationComplete()
+                else:
+                        self.waitOperationComplete(command)
+                elapsed = time.perf_counter() - start
+                self.completionTimes.append((command, elapsed))
+                logger.debug("Operation complete after %.3f sec" % elapsed)
+                return elapsed
+
+        def enableStatusReporting(self):
+                """Routes the Operation Complete event to the status byte: *ESE 1 sets the
+                Event Status Bit on OPC and *SRE 32 asserts a service request for it."""
+                self.instrument.write("*ESE 1")
+                self.instrument.write("*SRE 32")
+                self.instrument.query("*ESR?")  # clear any stale events
+                self.statusEnabled = True
+
+        def waitOperationComplete(self, command=None):
+                """Sends *OPC and waits until the instrument sets the Operation Complete event.
+                GPIB instruments are waited on with a service request, instruments that support
+                serial polls are polled through the status byte, and everything else (raw sockets
+                included, which have no serial poll) polls *ESR?.
+                Polls back off from pollInterval to pollMaxInterval so long operations don't flood the bus."""
+                if not self.statusEnabled:
+                        self.enableStatusReporting()
+                self.instrument.write("*OPC")
+                if (self.protocol == "GPIB") and hasattr(self.instrument, "wait_for_srq"):
+                        self.waitServiceRequest()
+                        esr = int(self.instrument.query("*ESR?"))
+                elif (self.protocol != "SOCKET") and hasattr(self.instrument, "read_stb"):
+                        self.poll(lambda: self.instrument.read_stb() & STB_ESB)
+                        esr = int(self.instrument.query("*ESR?"))
+                else:
+                        status = {}
+                        def opc():
+                                status["esr"] = int(self.instrument.query("*ESR?"))
+                                return status["esr"] & ESR_OPC
+                        self.poll(opc)
+                        esr = status["esr"]
+                checkEventStatus(esr, command)
+
+        def waitServiceRequest(self):
+                """Blocks on the GPIB service request event until the instrument asserts SRQ."""
+                start = time.perf_counter()
+                while True:
+                        try:
+                                self.instrument.wait_for_srq(timeout=1000)     # ms, rechecks completionTimeout every second
+                        except VisaIOError as error:
+                                if error.abbreviation != "VI_ERROR_TMO":
+                                        raise error
+                                elapsed = time.perf_counter() - start
+                                if (self.completionTimeout is not None) and (elapsed > self.completionTimeout):
+                                        raise TimeoutError("No service request after %.3f sec" % elapsed)
+                                logger.debug("Still waiting for service request after %.3f sec" % elapsed)
+                        else:
+                                break
+
+        def poll(self, condition):
+                return pollUntil(condition, interval=self.pollInterval, backoff=self.pollBackoff,
+                        maxInterval=self.pollMaxInterval, timeout=self.completionTimeout)
+
+        def pollOperationComplete(self):
+                """Polls the operation complete status until it returns true.
                 Similar to the ESR query poll suggested in R&S SFU documentation except at a much higher level.
-                Resorted to this instead because ESR poll did not work as documented..."""
+                Resorted to this instead because ESR poll did not work as documented on our instruments,
+                which is why it is the default completion and 'status' has to be asked for."""
                 while True:
                         try:
                                 opc = int(self.instrument.query("*OPC?"))
@@ -56,4 +361,3 @@ class Comm(object):
                         else:
                                 if opc == 1:
                                         break
-
@@ -30,6 +30,21 @@ class DM240XR(Modulator):
 		self.type=type
 		super().__init__(id=id)
 
+	def setTransponder(self, txpdr):
+		"""
+		Sets the transponder settings with a single SNMP SetRequest.
+		Only the broadcast standard and constellation are implemented on the DM240XR so far.
+
+		Input:
+			txpdr: Transponder object
+
+		Output:
+			None
+		"""
+		with self.comm.batch():
+			self.setBroadcastStandard(txpdr.getBroadcastStandard())
+			self.setConstellation(txpdr.getConstellation())
+
 	def setBroadcastStandard(self, bcstd):
 		"""
 		Sets the broadcast standard
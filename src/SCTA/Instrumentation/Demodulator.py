@@ -4,18 +4,19 @@ import logging
 logger = logging.getLogger(__name__)
 
 class Demodulator(Transponder):
-	def __init__(self, id="demod"):
+	def __init__(self, id="demod", **transponder):
 		"""
 		Creates a Demodulator object. Used as a template to inherit from for Demdulator equipment.
 		It has an attribute for storing the current output power.
 
 		Input:
 			id: string
+			transponder: Transponder keyword arguments the settings start from, e.g. freq=974e6
 
 		Output:
 			Demodulator object
 		"""
-		super().__init__( id=id)
+		super().__init__(id=id, **transponder)
 		
 
 	def getTransponder(self):
@@ -0,0 +1,115 @@
+"""Runs the same driver call on many instruments in parallel threads."""
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import logging, threading, time
+logger = logging.getLogger(__name__)
+
+# outcome of one call: value is None when error is set
+CallResult = namedtuple('CallResult', ['instrument', 'value', 'error', 'elapsed'])
+
+class ExecutorError(RuntimeError):
+        """Raised by InstrumentExecutor when raiseErrors is set and at least one call failed.
+        results holds the CallResult of every instrument, including the ones that succeeded."""
+        def __init__(self, message, results):
+                super().__init__(message)
+                self.results = results
+
+# guards giving comms that do not carry a lock their own
+_locksLock = threading.Lock()
+
+def commLock(comm):
+        """Returns the lock that serialises access to comm. SNMPComm has its own, other comms are given
+        one as their lock attribute, so it goes away with the comm."""
+        lock = getattr(comm, 'lock', None)
+        if lock is not None:
+                return lock
+        with _locksLock:
+                lock = getattr(comm, 'lock', None)
+                if lock is None:
+                        lock = comm.lock = threading.RLock()
+                return lock
+
+class InstrumentExecutor(object):
+
+        def __init__(self, maxWorkers=8, raiseErrors=False):
+                """
+                Creates a thread pool for driver calls. Calls to instruments that share a comm object
+                (e.g. the modulators of one BTC) are serialised, everything else runs in parallel.
+
+                Input:
+                        maxWorkers: integer number of threads
+                        raiseErrors: if True, map() and starmap() raise ExecutorError when any call failed
+
+                Output:
+                        InstrumentExecutor object
+                """
+                self.maxWorkers = maxWorkers
+                self.raiseErrors = raiseErrors
+                self.pool = ThreadPoolExecutor(max_workers=maxWorkers)
+
+        def __enter__(self):
+                return self
+
+        def __exit__(self, *exc):
+                self.shutdown()
+
+        def shutdown(self):
+                self.pool.shutdown(wait=True)
+
+        def call(self, instrument, method, args, kwargs):
+                comm = getattr(instrument, 'comm', None)
+                start = time.perf_counter()
+                try:
+                        if comm is None:
+                                value = getattr(instrument, method)(*args, **kwargs)
+                        else:
+                                with commLock(comm):
+                                        value = getattr(instrument, method)(*args, **kwargs)
+                except Exception as e:
+                        logger.warning("%s.%s failed on %r: %r" % (type(instrument).__name__, method, getattr(instrument, 'id', instrument), e))
+                        return CallResult(instrument, None, e, time.perf_counter() - start)
+                return CallResult(instrument, value, None, time.perf_counter() - start)
+
+        def starmap(self, method, calls):
+                """
+                Calls a driver method with different arguments per instrument.
+
+                Input:
+                        method: string method name, e.g. 'setTransponder'
+                        calls: list of (instrument, args) or (instrument, args, kwargs) tuples
+
+                Output:
+                        list of CallResult, in the order of calls
+                """
+                start = time.perf_counter()
+                futures = []
+                for entry in calls:
+                        instrument, args = entry[0], tuple(entry[1])
+                        kwargs = entry[2] if len(entry) > 2 else {}
+                        futures.append(self.pool.submit(self.call, instrument, method, args, kwargs))
+                results = [future.result() for future in futures]
+                elapsed = time.perf_counter() - start
+                logger.info("Ran %s on %d instruments in %.3f sec (%.3f sec sequentially)" % (method, len(results), elapsed, sum(result.elapsed for result in results)))
+                failed = [result for result in results if result.error is not None]
+                if failed and self.raiseErrors:
+                        raise ExecutorError("%s failed on %d of %d instruments" % (method, len(failed), len(results)), results)
+                return results
+
+        def map(self, method, instruments, *args, **kwargs):
+                """
+                Calls the same driver method with the same arguments on every instrument.
+
+                Input:
+                        method: string method name, e.g. 'loadConfigFile'
+                        instruments: list of driver objects
+
+                Output:
+                        list of CallResult, in the order of instruments
+                """
+                return self.starmap(method, [(instrument, args, kwargs) for instrument in instruments])
+
+def runAll(method, instruments, *args, **kwargs):
+        """Runs a driver method on every instrument in parallel and returns the list of values.
+        Raises ExecutorError if any of the calls failed."""
+        with InstrumentExecutor(maxWorkers=max(1, len(instruments)), raiseErrors=True) as executor:
+                return [result.value for result in executor.map(method, instruments, *args, **kwargs)]
@@ -1,16 +1,68 @@
 from . import Demodulator
 from . import Comm
+from .Cache import LevelCache
+from .InstrumentState import InstrumentState
+from ..utils.spectrum import frequencyAxis, stitch, channelPowers, signalToNoise
+from contextlib import contextmanager
+import numpy as np
 import logging
+import math
 import time
 
 # Setup debug logging
 logger = logging.getLogger(__name__)
 
-class FSW(Demodulator):
+class FSW(Demodulator, InstrumentState):
 
 	WINDOWS = ['Spectrum', 'VSA']
-
-	def __init__(self, id="FSW", type="GPIB", port="30", window="VSA"):
+	# widest span getChannelPowers measures in one sweep, and the number of points of each sweep
+	TRACE_MAX_SPAN = 1e9
+	TRACE_POINTS = 32001
+	# getChannelPowers' resolution bandwidth as a fraction of the narrowest channel (about the RBW the FSW
+	# couples to getSpectrumChannelPower's span), and the least number of sweep points per RBW
+	CHANNEL_RBW = 0.02
+	POINTS_PER_RBW = 2
+	# span of getSpectrumSNR's sweep, and the guard band between the carrier and the noise regions, in symbol rates
+	SNR_SPAN = 3
+	SNR_GUARD = 0.25
+	# VSA window showing the Constellation I/Q result, whose trace captureIQ reads
+	IQ_WINDOW = 4
+	# VSA statistics read by getAllMeasurements, as (result name, CALC:MARK:FUNC:DDEM:STAT node)
+	VSA_STATISTICS = [('mer', 'SNR'), ('power', 'MPOW'), ('phaseerror', 'PERR'), ('carrierfreqerror', 'CFER')]
+	# queries answered from the comm's query cache when it is enabled, with their time to live in seconds
+	# (None keeps an answer until a write to the same header or a reset)
+	CACHED_QUERIES = {
+		'*IDN?': None,
+		'SENS:DDEM:SRAT?': 60,
+		'SENS:DDEM:TFIL:ALPH?': 60,
+		'SENS:DDEM:FORM?': 60,
+		'SENS:DDEM:PSK:NST?': 60,
+	}
+	# settings of each window that identify a setup saved by saveState, together with the
+	# measurement channels (see InstrumentState and stateAnswers)
+	STATE_QUERIES = ['FORM?', 'SENS:SWE:POIN?', 'SENS:SWE:COUN?', 'INP:ATT:AUTO?',
+		'INP:GAIN:STAT?', 'INP:EATT:STAT?', 'INP:EATT:AUTO?', 'INIT:CONT?']
+	STATE_EXTENSION = '.dfl'
+	# settings of each window read back by attach
+	WARM_QUERIES = {
+		'VSA': ['SENS:FREQ:CENT?', 'SENS:DDEM:SRAT?', 'SENS:DDEM:TFIL:ALPH?', 'SENS:SWE:COUN?',
+			'INP:GAIN:STAT?', 'INP:EATT:STAT?', 'INP:EATT:AUTO?', 'INIT:CONT?'],
+		'Spectrum': ['SENS:FREQ:CENT?', 'SENS:FREQ:SPAN?', 'SENS:SWE:TIME?',
+			'INP:GAIN:STAT?', 'INP:EATT:STAT?', 'INP:EATT:AUTO?', 'INIT:CONT?'],
+	}
+	# measurements of the current sweep() block, None outside of one
+	heldMeasurements = None
+	# settings chosen by auto level, read back and kept in the level cache
+	LEVEL_SETTINGS = ['DISP:TRAC:Y:SCAL:RLEV', 'INP:ATT']
+	# STAT:QUES:POW:COND bits meaning the input levels do not fit the signal
+	POWER_OVERLOAD = 0x01		# RF input overload
+	POWER_UNDERLOAD = 0x02		# IF underrange
+	POWER_IF_OVERLOAD = 0x04
+	window = None			# window last selected by selectWindow
+	nominalPower = None		# expected input power in dBm, see setNominalPower
+	levelCache = None		# LevelCache of auto level results, see enableLevelCache
+
+	def __init__(self, id="FSW", type="GPIB", port="30", window="VSA", recall=False, warm=False, queryCache=False, levelCache=False, completion="opc"):
 		"""
 		Creates an FSW object, which starts a connection for reading and writing commands to the FSW.
 		With no inputs specified, it assumes the host computer's interface is GPIB at port 30.
@@ -19,17 +71,34 @@ class FSW(Demodulator):
 			id: string
 			type: string interface type
 			port: string interface address/ port
+			window: string 'VSA' or 'Spectrum'
+			recall: boolean, reuse the FSW's setup or a saved state file of it instead of resetting (see configureFor)
+			warm: boolean, attach to an FSW that already has the window: its settings are read back in bulk
+			      instead of reset and written again (see attach)
+			queryCache: boolean, answer CACHED_QUERIES from a cache. Only for scripts that are the FSW's
+			            sole user, as changes made from the front panel read stale until the answers expire
+			levelCache: boolean, reuse the input levels auto level found before (see enableLevelCache).
+			            Only for scripts that call setNominalPower whenever the input power changes
+			completion: string 'opc' (the default) or 'status', how the comm waits for operation complete.
+			            'status' only for a FSW checked to report the OPC event as documented (see Comm)
 
 		Output:
-			SFU object
+			FSW object
 
 		~~~ Valid ranges ~~~
-		type:        ['GPIB', 'IP']
+		type:        ['GPIB', 'IP', 'SOCKET']
 		port:        ['28' or '192.10.10.10']
 		"""
-		self.comm = Comm(protocol=type, port=port)
-		super().__init__(id=id)
-		self.configureFor(window)
+		self.comm = Comm(protocol=type, port=port, completion=completion)
+		# skip writes of unchanged settings, e.g. the INST:SEL before nearly every call
+		self.comm.enableStateCache()
+		if queryCache:
+			self.comm.enableQueryCache(self.CACHED_QUERIES)
+		if levelCache:
+			self.enableLevelCache()
+		transponder = self.attach(window) if warm else None
+		super().__init__(id=id, **(transponder or {}))
+		self.configureFor(window, recall, warm=(transponder is not None))
 
 	def __del__(self):
 		# self.close()
@@ -48,23 +117,31 @@ class FSW(Demodulator):
 		"""
 		self.comm.instrument.close()
 	
-	def configureFor(self, type='VSA'):
+	def configureFor(self, type='VSA', recall=False, warm=False):
 		"""
 		Configures FSW for either VSA or Spectrum mode.
 		WARNING: Overwrites all previous configurations!
 
 		Input:
 			type: string 'VSA' or 'Spectrum'
+			recall: boolean, if True the setup is only rebuilt when the FSW does not already have it
+			        and has no state file of it (see InstrumentState.restoreSetup), instead of after every *RST
+			warm: boolean, if True the FSW already has the window (see attach) and is not set up again
 
 		Output:
 			None
 		"""
 		logger.info("FSW device ID: %s" % (self.comm.query("*IDN?")) )
-		self.reset()	# reset all previous configurations
-		
+		if warm:
+			logger.info("Attached to the FSW's %s window" % type)
+		elif recall:
+			logger.info("FSW setup %s" % self.restoreSetup(type, lambda: self.setupWindows(type)))
+		else:
+			self.setupWindows(type)
+		self.selectWindow(type)
+
 		# Spectrum mode already configured by default
 		if (type=="Spectrum"):
-			self.selectWindow(type)
 			self.setConstellation = super().setConstellation
 			self.getConstellation = super().getConstellation
 			self.setSymbolRate = super().setSymbolRate
@@ -75,8 +152,6 @@ class FSW(Demodulator):
 
 		# Must create a VSA window
 		if (type=="VSA"):
-			self.createNewWindow(type)
-			self.selectWindow(type)
 			self.setConstellation = self.setVSAConstellation
 			self.getConstellation = self.getVSAConstellation
 			self.setSymbolRate = self.setVSASymbolRate
@@ -86,6 +161,55 @@ class FSW(Demodulator):
 			self.getPower = self.getVSAChannelPower
 		logger.info("FSW configuration complete")
 
+	def attach(self, type='VSA'):
+		"""
+		Reads back the settings of a window the FSW already has, with as few queries as possible,
+		so the caches know them and unchanged settings are not written again
+
+		Input:
+			type: string 'VSA' or 'Spectrum'
+
+		Output:
+			dictionary of Transponder keyword arguments ('freq', and 'symb' and 'roll' for VSA),
+			or None if the FSW does not have the window
+		"""
+		if ("'%s'" % type) not in self.comm.query("INST:LIST?"):
+			logger.info("FSW has no %s window to attach to" % type)
+			return None
+		self.selectWindow(type)
+		queries = self.WARM_QUERIES[type]
+		answers = dict(zip(queries, self.comm.readBack(queries)))
+		transponder = {'freq': float(answers['SENS:FREQ:CENT?'])}
+		if type == 'VSA':
+			transponder['symb'] = float(answers['SENS:DDEM:SRAT?'])
+			transponder['roll'] = float(answers['SENS:DDEM:TFIL:ALPH?'])*100
+		return transponder
+
+	def stateAnswers(self):
+		"""
+		Reads the FSW's measurement channels and, as its settings are kept per channel,
+		the STATE_QUERIES of each of the windows configureFor creates that it has
+
+		Output:
+			list of string answers
+		"""
+		channels = self.comm.query("INST:LIST?")
+		answers = [channels]
+		for type in sorted(self.WARM_QUERIES):
+			if ("'%s'" % type) in channels:
+				self.selectWindow(type)
+				answers.extend(super().stateAnswers())
+		return answers
+
+	def setupWindows(self, type='VSA'):
+		"""Resets the FSW and creates the windows of configureFor"""
+		# send the reset and window setup as one batch with a single operation-complete wait
+		with self.comm.batch():
+			self.reset()	# reset all previous configurations
+			if (type=="VSA"):
+				self.createNewWindow(type)
+			self.selectWindow(type)
+
 	def setVSAConstellation(self, mod):
 		"""
         Sets the constellation
@@ -140,9 +264,9 @@ class FSW(Demodulator):
         """
 		super().setSymbolRate(rate)
 		self.selectWindow('VSA')
-		if self.getSymbolRate() != rate:
-			self.comm.write("SENS:DDEM:SRAT %d" % rate)
-			logger.info("Set symbol rate: %.2f MBaud" % (rate/1e6))
+		# the comm's state cache skips the write if the symbol rate is unchanged
+		self.comm.write("SENS:DDEM:SRAT %d" % rate)
+		logger.info("Set symbol rate: %.2f MBaud" % (rate/1e6))
 
 	def getVSASymbolRate(self):
 		"""
@@ -164,9 +288,8 @@ class FSW(Demodulator):
 	def setVSAAlpha(self, alpha):
 		super().setAlpha(alpha)
 		self.selectWindow('VSA')
-		if self.getAlpha() != alpha:
-			self.comm.write("SENS:DDEM:TFIL:ALPH %.2f" % (alpha/100))
-			logger.info("Set roll-off factor: %.2f" % alpha)
+		self.comm.write("SENS:DDEM:TFIL:ALPH %.2f" % (alpha/100))
+		logger.info("Set roll-off factor: %.2f" % alpha)
 
 	def getVSAAlpha(self):
 		self.selectWindow('VSA')
@@ -178,9 +301,8 @@ class FSW(Demodulator):
 
 	def setFrequency(self, freq):
 		super().setFrequency(freq)
-		if self.getFrequency() != freq:
-			self.comm.write("SENS:FREQ:CENT %.2f" % freq)
-			logger.info("Set frequency: %.2f MHz" % (freq/1e6))
+		self.comm.write("SENS:FREQ:CENT %.2f" % freq)
+		logger.info("Set frequency: %.2f MHz" % (freq/1e6))
 
 	def getFrequency(self):
 		freq=float(self.comm.query("SENS:FREQ:CENT?"))
@@ -263,6 +385,14 @@ class FSW(Demodulator):
 		Output:
 			float channel power in dBm
 		"""
+		self.setupSpectrumChannelPower()
+		self.sweepAtLevel(preamp)
+		pwr = self.fetchSpectrumChannelPower()
+		logger.info("Got Spectrum Channel Power: %.2f dBm" % pwr)
+		return pwr
+
+	def setupSpectrumChannelPower(self):
+		"""Configures the Spectrum window's channel power measurement of the current transponder, up to the sweep"""
 		self.selectWindow("Spectrum")
 		symb = super().getSymbolRate()
 		alpha=super().getAlpha()
@@ -273,16 +403,10 @@ class FSW(Demodulator):
 		self.setDetector("RMS")
 		self.adjustSetting()
 		self.setSweepTime()
-		self.autoLevel()
-		# to fix RF Overload bug, force the preamp off and turn on auto electronic attenuator
-		# this must be done after Auto Level, because Auto Level will undo electronic attenuator settings
-		self.setPreAmpState(preamp)
-		self.setElectronicAttenuatorState(True)
-		self.setElectronicAttenuatorAuto(True)
-		self.setContinousSweep(False)
-		pwr = float(self.comm.query("CALC:MARK:FUNC:POW:RES? CPOW"))
-		logger.info("Got Spectrum Channel Power: %.2f dBm" % pwr)
-		return pwr
+
+	def fetchSpectrumChannelPower(self):
+		"""Reads the channel power of the last sweep in dBm"""
+		return float(self.comm.query("CALC:MARK:FUNC:POW:RES? CPOW"))
 
 	def getSpectrumChannelPower(self):
 		power = self.getSpectrumChannelPower_preamp()
@@ -290,6 +414,99 @@ class FSW(Demodulator):
 			power = self.getSpectrumChannelPower_preamp(preamp=True)
 		return power
 
+	def getTrace(self, trace=1, buffer=None):
+		"""
+		Fetches a trace of the Spectrum window as binary 32-bit floats
+
+		Input:
+			trace: integer trace number
+			buffer: bytearray or float32 NumPy array of at least 4 bytes per sweep point to read the trace into,
+			        reused by callers fetching many traces, or None to allocate one
+
+		Output:
+			(frequencies, levels): NumPy arrays of float Hz and float dBm per sweep point
+		"""
+		self.selectWindow('Spectrum')
+		center = float(self.comm.query("SENS:FREQ:CENT?"))
+		span = self.getSpan()
+		self.comm.write("FORM REAL,32")
+		levels = self.comm.queryBinary("TRAC:DATA? TRACE%d" % trace, dtype='<f4', buffer=buffer)
+		return frequencyAxis(center, span, len(levels)), levels
+
+	def captureIQ(self, n_samples, buffer=None):
+		"""
+		Captures n_samples symbols in the VSA window and fetches their I/Q values as one binary block,
+		for analysis on the host with SCTA.Analysis, so one capture can feed many metrics
+
+		Input:
+			n_samples: integer number of symbols (the VSA result length)
+			buffer: complex64 NumPy array of at least n_samples values (or a bytearray of 8 bytes per symbol),
+			        reused between captures to avoid allocating, or None to allocate one
+
+		Output:
+			complex64 NumPy array of the symbols, viewing the buffer (it changes with the next capture into it)
+		"""
+		self.selectWindow('VSA')
+		with self.comm.batch():
+			self.comm.write("SENS:DDEM:RLEN %d SYM" % n_samples)
+			# one point per symbol, at the decision instants
+			self.comm.write("SENS:DDEM:PRAT 1")
+			self.comm.write("FORM REAL,32")
+			self.setSweepAverage(1)
+			self.sweepAtLevel()
+		symbols = self.comm.queryBinary("TRAC%d:DATA? TRACE1" % self.IQ_WINDOW, dtype='<c8', buffer=buffer)
+		logger.info("Captured %d symbols" % len(symbols))
+		return symbols
+
+	def getChannelPowers(self, transponders, preamp=False):
+		"""
+		Measures the channel power of many carriers from one wide sweep, or a few stitched sweeps when
+		the carriers span more than TRACE_MAX_SPAN, instead of one full measurement per carrier.
+		Each carrier's bandwidth is its symbol rate times (1 + roll-off), like getSpectrumChannelPower.
+		The RBW is set to CHANNEL_RBW of the narrowest carrier, so adjacent carriers do not smear into
+		each other's channels, and the span of each sweep is cut to keep POINTS_PER_RBW points per RBW.
+		The center frequency, span and RBW coupling of the Spectrum window are restored afterwards.
+
+		Input:
+			transponders: list of Transponder objects
+			preamp: boolean pre-amplifier state
+
+		Output:
+			list of float channel powers in dBm, in the order of transponders
+		"""
+		centers = np.array([txpdr.getFrequency() for txpdr in transponders], dtype=float)
+		bandwidths = np.array([txpdr.getSymbolRate()*(1+(txpdr.getAlpha()/100)) for txpdr in transponders], dtype=float)
+		margin = bandwidths.max()/2
+		start = (centers - bandwidths/2).min() - margin
+		stop = (centers + bandwidths/2).max() + margin
+		frequency = super().getFrequency()
+		self.selectWindow("Spectrum")
+		previousSpan = self.getSpan()
+		self.setDetector("RMS")
+		self.comm.write("SENS:SWE:POIN %d" % self.TRACE_POINTS)
+		# the FSW rounds the RBW to one of its filters, so the spans follow the one it chose
+		self.comm.write("SENS:BAND:RES %.2f" % (bandwidths.min()*self.CHANNEL_RBW))
+		rbw = float(self.comm.query("SENS:BAND:RES?"))
+		maxSpan = min(self.TRACE_MAX_SPAN, rbw*(self.TRACE_POINTS - 1)/self.POINTS_PER_RBW)
+		sweeps = int(math.ceil((stop - start)/maxSpan))
+		span = (stop - start)/sweeps
+		segments = []
+		try:
+			for sweep in range(sweeps):
+				self.setFrequency(start + span*(sweep + 0.5))
+				self.setSpan(span)
+				self.setContinousSweep(True)
+				self.sweepAtLevel(preamp)
+				segments.append(self.getTrace())
+		finally:
+			self.comm.write("SENS:BAND:RES:AUTO ON")
+			self.setSpan(previousSpan)
+			self.setFrequency(frequency)
+		frequencies, levels = stitch(segments)
+		powers = channelPowers(frequencies, levels, centers, bandwidths, rbw)
+		logger.info("Got %d channel powers from %d sweeps at %.0f kHz RBW" % (len(powers), sweeps, rbw/1e3))
+		return [float(power) for power in powers]
+
 	def setDetector(self, detector="RMS"):
 		self.selectWindow('Spectrum')
 		self.comm.write("DET %s" % detector)
@@ -306,9 +523,94 @@ class FSW(Demodulator):
 		sweep=self.comm.query("SENS:SWE:TIME?")
 		return float(sweep)
 
+	def enableLevelCache(self, frequencyBin=10e6, tolerance=3.0):
+		"""
+		Makes autoLevel reuse the reference level and attenuation it found before for the same window,
+		frequency bin and nominal power, instead of running another auto-ranging sweep.
+		Reused levels that overload or underrange the input are replaced by a fresh auto level (see sweepAtLevel).
+
+		Input:
+			frequencyBin: float Hz, center frequencies in the same bin share their levels, None always runs auto level
+			tolerance: float dB, largest difference of nominal power at which levels are reused
+
+		Output:
+			None
+		"""
+		self.levelCache = None if frequencyBin is None else LevelCache(frequencyBin, tolerance)
+
+	def setNominalPower(self, power):
+		"""
+		Sets the input power expected for the following measurements, which keys the level cache
+
+		Input:
+			power: float dBm, or None if unknown (levels are then reused at any power, so scripts
+			       with an enabled level cache set it before every change of input power)
+
+		Output:
+			None
+		"""
+		self.nominalPower = power
+
 	def autoLevel(self):
+		"""
+		Sets the reference level and attenuation for the current window and frequency, from the level cache
+		when they were found before, otherwise with an auto-ranging sweep whose result is then cached.
+
+		Output:
+			True if the levels came from the level cache
+		"""
+		if self.levelCache is None:
+			self.comm.write("SENS:ADJ:LEV")
+			return False
+		frequency = super().getFrequency()
+		levels = self.levelCache.get(self.window, frequency, self.nominalPower)
+		if levels is not None:
+			for setting in self.LEVEL_SETTINGS:
+				self.comm.write("%s %s" % (setting, levels[setting]))
+			return True
 		self.comm.write("SENS:ADJ:LEV")
-		
+		levels = dict((setting, self.comm.query(setting + "?")) for setting in self.LEVEL_SETTINGS)
+		self.levelCache.put(self.window, frequency, self.nominalPower, levels)
+		return False
+
+	def levelFits(self):
+		"""
+		Checks the last sweep for an overloaded or underranged input
+
+		Output:
+			boolean, False if the input levels must be adjusted
+		"""
+		condition = int(self.comm.query("STAT:QUES:POW:COND?"))
+		return not (condition & (self.POWER_OVERLOAD | self.POWER_UNDERLOAD | self.POWER_IF_OVERLOAD))
+
+	def sweepAtLevel(self, preamp=False):
+		"""
+		Levels the input with autoLevel and runs one single sweep, sent as one batch.
+		If levels reused from the level cache do not fit the signal, they are dropped and
+		the sweep is repeated after a fresh auto level.
+
+		Input:
+			preamp: boolean pre-amplifier state
+
+		Output:
+			None
+		"""
+		for attempt in range(2):
+			with self.comm.batch():
+				cached = self.autoLevel()
+				# Auto Level is overlapped, so wait for it before the settings that follow
+				self.comm.write("*WAI")
+				# to fix RF Overload bug, force the preamp off and turn on auto electronic attenuator
+				# this must be done after Auto Level, because Auto Level will undo electronic attenuator settings
+				self.setPreAmpState(preamp)
+				self.setElectronicAttenuatorState(True)
+				self.setElectronicAttenuatorAuto(True)
+				self.setContinousSweep(False)
+			if not cached or self.levelFits():
+				return
+			logger.info("Cached input levels overload or underrange the input, running auto level")
+			self.levelCache.discard(self.window, super().getFrequency(), self.nominalPower)
+
 
 	def adjustSetting(self):
 		self.comm.write("SENSe:POWer:ACHannel:PRESet CPOW")
@@ -330,6 +632,7 @@ class FSW(Demodulator):
 			None
 		"""
 		self.comm.write("INST:SEL %s" % type)
+		self.window = type
 		if type == 'VSA':
 			# only need freq, symb, const
 			# txpdr = self.getTransponder()
@@ -364,38 +667,114 @@ class FSW(Demodulator):
 	def getAllMeasurements(self, avg=100):
 		"""
 		Gets MER, Power, Phase error, and Carrier frequency error in the FSW's VSA mode
+		The setup is sent as one batch and the statistics are read with one concatenated query.
+		Inside a sweep() block, the measurements of that sweep are returned instead.
 
 		Input:
-			None
+			avg: integer number of sweeps averaged
 
 		Output:
 			a python dictionary of 'mer', 'power', 'phaseerror', and 'carrierfreqerror'
 		"""
+		if self.heldMeasurements is not None:
+			return dict(self.heldMeasurements)
 		self.selectWindow('VSA')
 		# self.setSymbolRate(symb)
 		logger.info("symb = %.2f" % self.getSymbolRate())
 		# self.setFrequency(freq)
-		self.setSweepAverage(avg)
-		self.autoLevel()
-		# to fix RF Overload bug, force the preamp off and turn on auto electronic attenuator
-		# this must be done after Auto Level, because Auto Level will undo electronic attenuator settings
-		self.setPreAmpState(False)
-		self.setElectronicAttenuatorState(True)
-		self.setElectronicAttenuatorAuto(True)
-		self.setContinousSweep(False)
-		mer=float(self.comm.query("CALC2:MARK:FUNC:DDEM:STAT:SNR? AVG"))
-		pwr=float(self.comm.query("CALC2:MARK:FUNC:DDEM:STAT:MPOWER? AVG"))
-		phaseerror=float(self.comm.query("CALC2:MARK:FUNC:DDEM:STAT:PERR? AVG"))
-		carrierfreqerror=float(self.comm.query("CALC2:MARK:FUNC:DDEM:STAT:CFER? AVG"))
-		measurements = { 
-			'mer':mer,
-			'power':pwr,
-			'phaseerror':phaseerror,
-			'carrierfreqerror':carrierfreqerror
-		}
+		with self.comm.batch():
+			self.setSweepAverage(avg)
+			self.sweepAtLevel()
+		measurements = self.fetchAllMeasurements()
 		logger.debug("Got All VSA measurements: %r" % measurements)
 		return measurements
 
+	def fetchAllMeasurements(self):
+		"""Reads the VSA statistics of the last sweep with one query, as a dictionary like getAllMeasurements"""
+		answers = self.comm.query(";:".join("CALC2:MARK:FUNC:DDEM:STAT:%s? AVG" % statistic for name, statistic in self.VSA_STATISTICS))
+		return dict((name, float(answer)) for (name, statistic), answer in zip(self.VSA_STATISTICS, answers.split(';')))
+
+	def stream(self, measurement='vsa', interval=None, count=None, dataLogger=None, avg=100, preamp=False):
+		"""
+		Configures a measurement once, then triggers single sweeps and yields the result of each
+		as soon as the sweep completes, without repeating the setup of getAllMeasurements or
+		getSpectrumChannelPower for every point.
+
+		Input:
+			measurement: string 'vsa' (the dictionary of getAllMeasurements), one of its keys
+			             ('mer', 'power', 'phaseerror', 'carrierfreqerror'), or 'channelpower' (Spectrum window)
+			interval: float seconds from one sweep's start to the next, None sweeps back to back
+			count: integer number of results, None streams until the generator is closed
+			dataLogger: DataLogger each result is pushed to, or None. CSV loggers get the values
+			            (in the order of VSA_STATISTICS for 'vsa'), JSON loggers a dictionary.
+			avg: integer number of sweeps averaged per VSA result
+			preamp: boolean pre-amplifier state
+
+		Output:
+			generator of (float time.time() at sweep completion, result) pairs
+
+		Usage:
+			for timestamp, mer in fsw.stream('mer', interval=1.0, count=3600):
+				print(timestamp, mer)
+		"""
+		names = [name for name, statistic in self.VSA_STATISTICS]
+		if measurement == 'channelpower':
+			self.setupSpectrumChannelPower()
+			self.sweepAtLevel(preamp)
+			fetch = self.fetchSpectrumChannelPower
+		elif (measurement == 'vsa') or (measurement in names):
+			self.selectWindow('VSA')
+			with self.comm.batch():
+				self.setSweepAverage(avg)
+				self.sweepAtLevel(preamp)
+			fetch = self.fetchAllMeasurements
+		else:
+			raise ValueError("Unknown measurement %r, expected 'vsa', 'channelpower' or one of %r" % (measurement, names))
+		logger.info("Streaming %s measurements" % measurement)
+		start = time.perf_counter()
+		sweeps = 0
+		while (count is None) or (sweeps < count):
+			if sweeps:
+				if interval is not None:
+					remaining = start + sweeps*interval - time.perf_counter()
+					if remaining > 0:
+						time.sleep(remaining)
+				# returns once the sweep is complete
+				self.comm.write("INIT:IMM")
+			timestamp = time.time()
+			result = fetch()
+			if measurement in names:
+				result = result[measurement]
+			sweeps += 1
+			if dataLogger is not None:
+				if dataLogger.getFileFormat().lower() == 'json':
+					dataLogger.push(dict(result) if isinstance(result, dict) else {measurement: result})
+				else:
+					dataLogger.push([result[name] for name in names] if isinstance(result, dict) else [result])
+			yield timestamp, result
+
+	@contextmanager
+	def sweep(self, avg=100):
+		"""
+		Measures once, then answers getAllMeasurements and the getters built on it (getMER,
+		getVSAChannelPower, getPhaseError, getCarrierFrequencyError) inside the with-block from
+		that one sweep. Nested blocks share the outer sweep.
+
+		Usage:
+			with fsw.sweep(avg=100):
+				mer = fsw.getMER()
+				power = fsw.getPower()
+		"""
+		if self.heldMeasurements is not None:
+			yield dict(self.heldMeasurements)
+			return
+		measurements = self.getAllMeasurements(avg)
+		self.heldMeasurements = measurements
+		try:
+			yield dict(measurements)
+		finally:
+			self.heldMeasurements = None
+
 	def getVSAChannelPower(self, avg=100):
 		"""
 		Gets a power measurement in FSW's VSA mode
@@ -466,21 +845,44 @@ class FSW(Demodulator):
 			self.comm.write("INIT:CONT OFF")
 			self.comm.write("INIT:IMM")
 
-	def getSpectrumSNR(self):
-		txp=self.getSpectrumChannelPower()
+	def getSpectrumSNR(self, noiseRegions=None, preamp=None):
+		"""
+		Gets the carrier to noise ratio in FSW's Spectrum mode from a single sweep: the signal plus noise
+		power in the occupied bandwidth and the noise density beside the carrier are both computed from one
+		binary trace. The noise beside the carrier must be the noise inside it, e.g. from a noise generator
+		wider than the span.
+
+		Input:
+			noiseRegions: list of (start, stop) frequency offsets from the center in Hz where the trace shows
+			              only noise, None for both sides of the carrier beyond SNR_GUARD symbol rates of guard band
+			preamp: boolean pre-amplifier state, None turns it on only when the channel power is below -60 dBm
+			        (which then takes a second sweep)
+
+		Output:
+			float carrier to noise ratio in dB
+		"""
 		symb = super().getSymbolRate()
-		#self.comm.write("CALC:MARK:FUNC:POW:SEL CPOW")
-		self.comm.write("SENS:POW:ACH:BWID:CHAN1 %.2f" % (symb))
+		bandwidth = symb*(1+(super().getAlpha()/100))
+		if noiseRegions is None:
+			edge = bandwidth/2 + self.SNR_GUARD*symb
+			noiseRegions = [(-self.SNR_SPAN*symb/2, -edge), (edge, self.SNR_SPAN*symb/2)]
+		self.selectWindow("Spectrum")
+		self.setSpan(symb*self.SNR_SPAN)
 		self.setContinousSweep(True)
-		self.adjustSetting()
+		self.setDetector("RMS")
 		self.setSweepTime()
-		self.autoLevel()
-		#time.sleep(self.sweeptime*2)
-		self.setContinousSweep(False)
-		noise = float(self.comm.query("CALC:MARK:FUNC:POW:RES? CPOW"))
-		logger.info("Got Spectrum Noise Channel Power: %.2f dBm" % pwr)
-		snr=txp-noise
-		return snr
+		self.sweepAtLevel(bool(preamp))
+		rbw = float(self.comm.query("SENS:BAND:RES?"))
+		frequencies, levels = self.getTrace()
+		center = (frequencies[0] + frequencies[-1])/2
+		results = signalToNoise(frequencies, levels, center, bandwidth, noiseRegions, rbw)
+		if (preamp is None) and (results['power'] < -60):
+			self.sweepAtLevel(True)
+			frequencies, levels = self.getTrace()
+			results = signalToNoise(frequencies, levels, center, bandwidth, noiseRegions, rbw)
+		logger.info("Got Spectrum Channel Power: %.2f dBm, noise: %.2f dBm/Hz" % (results['power'], results['noisedensity']))
+		logger.info("Got Spectrum SNR: %.2f dB" % results['snr'])
+		return results['snr']
 
 	def getSpectrumChannelPowerNoise_preamp(self, preamp=False):
 		"""
@@ -502,13 +904,7 @@ class FSW(Demodulator):
 		self.setDetector("RMS")
 		self.adjustSetting()
 		self.setSweepTime()
-		self.autoLevel()
-		# to fix RF Overload bug, force the preamp off and turn on auto electronic attenuator
-		# this must be done after Auto Level, because Auto Level will undo electronic attenuator settings
-		self.setPreAmpState(preamp)
-		self.setElectronicAttenuatorState(True)
-		self.setElectronicAttenuatorAuto(True)
-		self.setContinousSweep(False)
+		self.sweepAtLevel(preamp)
 		pwr = float(self.comm.query("CALC:MARK:FUNC:POW:RES? CPOW"))
 		logger.info("Got Spectrum Channel Power: %.2f dBm" % pwr)
 		return pwr
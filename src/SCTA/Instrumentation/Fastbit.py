@@ -7,18 +7,23 @@ logger = logging.getLogger(__name__)
 
 class Fastbit(object):
 
-	def __init__(self, id="Fastbit", type="GPIB", port="15"):
+	def __init__(self, id="Fastbit", type="GPIB", port="15", warm=False):
 		"""Constructor.
 
 		~~~ Valid ranges ~~~
 		type:        [GPIB, IP]
 		port:        [1-32]
+		warm:        if True, settings are read first and only the ones that differ are written
 		"""
 		self.comm = Comm(protocol=type, port=port)
-		self.setInterface("SERIAL")
-		self.setPattern("PRBS")
-		self.setPayload("PN23")
-		self.comm.write("RESULT_MODE TOTAL")
+		if not (warm and self.getInterface() == "SERIAL"):
+			self.setInterface("SERIAL")
+		if not (warm and self.getPattern() == "PRBS"):
+			self.setPattern("PRBS")
+		if not (warm and self.getPayload() == "PN23"):
+			self.setPayload("PN23")
+		if not (warm and self.comm.query("RESULT_MODE?").replace("RESULT_MODE ", "") == "TOTAL"):
+			self.comm.write("RESULT_MODE TOTAL")
 	
 	def __del__(self):
 		self.close()
@@ -0,0 +1,123 @@
+"""Saving and recalling the setup of SCPI instruments, so a configured instrument is not reset and rebuilt on every connection."""
+import hashlib, logging, re
+from .SCPI import joinCommands
+logger = logging.getLogger(__name__)
+
+QUOTED = re.compile(r'"([^"]*)"|\'([^\']*)\'')
+
+class InstrumentState(object):
+        """Mixin for SCPI drivers with a self.comm. Setups are saved to instrument state files (MMEM:STOR:STAT)
+        or registers (*SAV), and identified by a fingerprint of the answers to STATE_QUERIES."""
+
+        # queries whose answers identify the instrument's setup: drivers override this with the settings
+        # their setup writes, as a fingerprint of *IDN? alone is the same whatever the instrument is set to
+        STATE_QUERIES = ['*IDN?']
+        # extension the instrument gives state files, as listed by MMEM:CAT?
+        STATE_EXTENSION = ''
+        # prefix of the state files saved by restoreSetup
+        STATE_PREFIX = 'SCTA'
+
+        def stateQueries(self):
+                """Returns the queries identifying the setup, STATE_QUERIES unless the driver's depend on its options"""
+                return self.STATE_QUERIES
+
+        def stateAnswers(self):
+                """
+                Answers stateQueries() with as few queries as the comm's message length allows. The answers are not
+                kept in the comm's caches, as drivers may override this to read settings of other windows or channels.
+
+                Output:
+                        list of string answers
+                """
+                return [self.comm.query(message) for message in joinCommands(self.stateQueries(), self.comm.BATCH_MAX_LENGTH)]
+
+        def fingerprint(self):
+                """
+                Reads the setup of the instrument (see stateAnswers)
+
+                Output:
+                        string of 12 hex digits, equal for instruments answering the state queries the same
+                """
+                answers = ";".join(self.stateAnswers())
+                digest = hashlib.sha1((type(self).__name__ + '\n' + answers).encode('utf-8')).hexdigest()[:12]
+                logger.debug("Setup fingerprint %s" % digest)
+                return digest
+
+        def saveState(self, name):
+                """
+                Saves the instrument's current setup
+
+                Input:
+                        name: string state file name (without extension) or integer register number for *SAV
+
+                Output:
+                        None
+                """
+                if isinstance(name, int):
+                        self.comm.write("*SAV %d" % name)
+                else:
+                        self.comm.write("MMEM:STOR:STAT 1,'%s'" % name)
+                logger.info("Saved instrument state %r" % name)
+
+        def recallState(self, name):
+                """
+                Recalls a setup saved by saveState. The comm's caches are invalidated by the recall.
+
+                Input:
+                        name: string state file name (without extension) or integer register number for *RCL
+
+                Output:
+                        None
+                """
+                if isinstance(name, int):
+                        self.comm.write("*RCL %d" % name)
+                else:
+                        self.comm.write("MMEM:LOAD:STAT 1,'%s%s'" % (name, self.STATE_EXTENSION))
+                logger.info("Recalled instrument state %r" % name)
+
+        def listStates(self):
+                """
+                Lists the state files in the instrument's current directory
+
+                Output:
+                        list of string file names without STATE_EXTENSION
+                """
+                answer = self.comm.query("MMEM:CAT?")
+                names = [double or single for double, single in QUOTED.findall(answer)]
+                names = [name.split(',')[0].strip() for name in names]
+                extension = self.STATE_EXTENSION
+                return [name[:len(name) - len(extension)] for name in names if name and name.lower().endswith(extension.lower())]
+
+        def restoreSetup(self, setup, configure):
+                """
+                Brings the instrument to a setup as cheaply as possible. The setup is saved to a state file
+                named after the setup and its fingerprint, so later connections can check and recall it:
+                nothing is sent if the instrument's fingerprint already matches, the state file is recalled if one
+                exists, and only otherwise is configure() run (followed by saving the new state file).
+                A state file is only taken to have been recalled when the fingerprint then matches its name, so of
+                several state files of the setup (e.g. saved before a firmware update changed an answer) the
+                matching one is used.
+
+                Input:
+                        setup: string name of the setup, e.g. 'VSA'
+                        configure: function taking no arguments that sets the instrument up from scratch
+
+                Output:
+                        string 'current', 'recalled' or 'configured', saying what was done
+                """
+                prefix = "%s_%s_%s_" % (self.STATE_PREFIX, type(self).__name__, setup)
+                saved = [name for name in self.listStates() if name.startswith(prefix)]
+                if saved:
+                        current = self.fingerprint()
+                        if prefix + current in saved:
+                                logger.info("Instrument already has setup %r" % setup)
+                                return 'current'
+                        for name in sorted(saved):
+                                self.recallState(name)
+                                if prefix + self.fingerprint() == name:
+                                        return 'recalled'
+                                logger.warning("State file %r does not give its setup" % name)
+                        logger.warning("No state file gives setup %r, configuring from scratch" % setup)
+                configure()
+                self.saveState(prefix + self.fingerprint())
+                return 'configured'
@@ -123,26 +123,34 @@ class MDM6100(Modulator):
 		bcstd = txpdr.getBroadcastStandard()
 		const = txpdr.getConstellation()
 		code_rate = txpdr.getCodeRate()
-		self.setBroadcastStandard(bcstd, modNumber)
-		self.setConstellationCodeRate(const, code_rate, modNumber)
-		# set this transponder's parameters to corresponding input parameters
-		self.setFrequency(txpdr.getFrequency(), modNumber)
-		self.setSymbolRate(txpdr.getSymbolRate(), modNumber)
-		self.setAlpha(txpdr.getAlpha(), modNumber)
-		self.setPilots(txpdr.getPilots(), modNumber)
-		self.setScramblingCode(txpdr.getScramblingCode(), modNumber)
+		# all parameters go out in one SetRequest and are read back with one GetRequest
+		with self.comm.batch():
+			self.setBroadcastStandard(bcstd, modNumber)
+			self.setConstellationCodeRate(const, code_rate, modNumber)
+			# set this transponder's parameters to corresponding input parameters
+			self.setFrequency(txpdr.getFrequency(), modNumber)
+			self.setSymbolRate(txpdr.getSymbolRate(), modNumber)
+			self.setAlpha(txpdr.getAlpha(), modNumber)
+			self.setPilots(txpdr.getPilots(), modNumber)
+			self.setScramblingCode(txpdr.getScramblingCode(), modNumber)
 
 	def getTransponder(self, modNumber):
+		"""
+		Gets the transponder settings of a modulator with a single SNMP GetRequest.
+		"""
+		OIDs=[
+		".1.3.6.1.4.1.9633.24.1.3.1.3.1.3.1",			# constellation and code rate
+		".1.3.6.1.4.1.9633.24.1.3.1.4.1.5.%d" % modNumber,	# frequency
+		".1.3.6.1.4.1.9633.24.1.3.1.4.1.8.1",			# symbol rate
+		".1.3.6.1.4.1.9633.24.1.3.1.4.1.7.1",			# roll-off factor
+		".1.3.6.1.4.1.9633.24.1.3.1.3.1.5.1",			# pilots, 1 = off, 2 = on
+		".1.3.6.1.4.1.9633.24.1.3.1.4.1.10.%d" % modNumber	# scrambling code
+		]
+		modcod, freq, symRate, alpha, pilots, scrambling = self.comm.query(OIDs)
 		bcstd=self.getBroadcastStandard(modNumber)
-		modCod=self.getConstellationCodeRate(modNumber)
-		mod=modCod[0]
-		fec=modCod[1]
-		freq=self.getFrequency(modNumber)
-		symRate=self.getSymbolRate(modNumber)
-		alpha=self.getAlpha(modNumber)
-		pilots=self.getPilots(modNumber)
-		scrambling=self.getScramblingCode(modNumber)
-		txpdr=Transponder(bcstd=bcstd, mod=mod, fec=fec, freq=freq, symb=symRate, roll=alpha, scramb=scrambling, pilots=pilots)
+		mod, fec = self.constellation[int(modcod)]
+		txpdr=Transponder(bcstd=bcstd, mod=mod, fec=fec, freq=float(freq), symb=int(symRate), roll=float(alpha), scramb=int(scrambling), pilots=(int(pilots) == 2))
+		logger.info("Got transponder of modulator %d: %s %s %s, %f MHz, %f MBaud" % (modNumber, bcstd, mod, fec, float(freq)/1e6, float(symRate)/1e6))
 		return txpdr
 
 
@@ -4,18 +4,19 @@ import logging
 logger = logging.getLogger(__name__)
 
 class Modulator(Transponder):
-	def __init__(self, id="mod"):
+	def __init__(self, id="mod", **transponder):
 		"""
 		Creates a Modulator object. Used as a template to inherit from for Modulator equipment.
 		It has an attribute for storing the current output power.
 
 		Input:
 			id: string
+			transponder: Transponder keyword arguments the settings start from, e.g. freq=974e6
 
 		Output:
 			Modulator object
 		"""
-		super().__init__( id=id)
+		super().__init__(id=id, **transponder)
 		self.power = -30
 
 	def getTransponder(self):
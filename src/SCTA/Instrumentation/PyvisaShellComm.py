@@ -1,34 +1,42 @@
 # Comm class behaves differently under simulation
 from .ResourceManagers import PyvisaResourceManager, VisaIOError, TelnetResourceManager, TelnetIOError
-from ..utils.misc import ceildiv
-import logging
+from .Tracing import trace
+import logging, re, time
 logger = logging.getLogger(__name__)
 
 class PyvisaShellComm(object):
 
-        def __init__(self, protocol, port, config={}, prompt="root@jester", cwd="~"):
+        # most bytes taken from a serial port's receive buffer per read
+        CHUNK_SIZE = 65536
+
+        def __init__(self, protocol, port, config={}, prompt="root@jester", cwd="~", rm=None):
                 """Constructor.
 
                 ~~~ Valid ranges ~~~
                 protocol: GPIB, serial, IP
                 port: String of port of IP address
+                rm: resource manager to use instead of the protocol's default
 
                 """
                 self.protocol=protocol
                 self.port=port
                 self.prompt = prompt
                 self.cwd_prompt = prompt + ":" + cwd + "# "
+                # the prompt for the next command: the prompt text, the working directory and "# " at the end of the buffer
+                self.promptPattern = re.compile(re.escape(prompt.encode('utf-8')) + b'[^\n]*[#$] ?$')
+                self.buffer = bytearray()       # received bytes not yet parsed
+                self.scanned = 0                # bytes of the buffer already searched for a line ending
 
                 # translate into pyvisa port notation
                 baud_rate = None
                 if protocol == "GPIB":
-                        rm=PyvisaResourceManager()
+                        rm=rm or PyvisaResourceManager()
                         port="GPIB::"+str(port)+"::INSTR"
                 if protocol == "IP":
-                        rm=TelnetResourceManager()
+                        rm=rm or TelnetResourceManager()
                         port="TCPIP0::"+port+"::INSTR"
                 if protocol == "Serial":
-                        rm=PyvisaResourceManager()
+                        rm=rm or PyvisaResourceManager()
                         port="ASRL"+str(port)+"::INSTR"
                         if config:
                                 baud_rate = config["baud"]
@@ -37,47 +45,49 @@ class PyvisaShellComm(object):
                 if baud_rate:
                         self.instrument.baud_rate = baud_rate
                 logger.info("Connected to instrument at port %s" % str(port))
+                self.name = str(port)   # resource name used in traces
                 self.instrument.timeout=5000
         
         def query(self, command):
-                # write command
-                self.instrument.write(command)
-                logger.info("Wrote %s" % repr(command))
-                # check echo is consistent
-                char_width = 80 # default shell width
-                # logger.debug("cwd_prompt: %r" % self.cwd_prompt)
-                command_length = len(self.cwd_prompt + command)
-                num_lines = ceildiv(command_length, char_width) # handles when command length fills the shell width exactly
-                # logger.debug("num_lines = %d" % num_lines)
-                echo = ""
-                while not echo:
-                        for i in list(range(num_lines)):
-                                echo += self.read_line()
-                        if self.prompt in echo:
-                                echo = echo.split("# ")[1]
-                                # logger.debug("stripped echo: %r" % echo)
-                                echo = echo.replace("\r","")
-                                echo = echo.replace("\n","")
-                command = command.replace("\r","")
-                command = command.replace("\n","")
-                echo = echo.replace("\r","")
-                echo = echo.replace("\n","")
-                # logger.debug("command:\n%r" % command)
-                # logger.debug("echo:\n%r" % echo)
-                assert echo == command
-                # read and return the output
+                """Runs a shell command and returns its output with lines joined by '\n', or None on timeout."""
+                start = time.perf_counter()
                 try:
                         logger.info("timeout set to: %f sec" % (float(self.instrument.timeout)/1000))
-                        output = self.read_until(self.prompt)
-                        # output = output.replace("\r","")
-                        # for most one-liner outputs, remove the \n
-                        if output:
-                                if output[-1] == '\n':
-                                        output = output[:-1]
+                        output = "\n".join(self.iterQuery(command))
                 except VisaIOError as error:
+                        trace(self.name, self.header(command) + " (timeout)", start, sent=len(command) + 1)
                         output = None
                 return output
 
+        def iterQuery(self, command):
+                """
+                Runs a shell command and yields its output one line at a time as it arrives,
+                so long-running commands and large dumps can be processed while they are read.
+
+                Input:
+                        command: string shell command
+
+                Output:
+                        generator of strings, one per output line without line endings
+                """
+                # write command
+                start = time.perf_counter()
+                self.instrument.write(command)
+                logger.info("Wrote %s" % repr(command))
+                # check echo is consistent
+                echo = self.read_echo(command)
+                assert echo == self.strip(command), "echo %r does not match command %r" % (echo, command)
+                # read the output until the prompt for the next command
+                received = 0
+                for line in self.iter_until(self.promptPattern):
+                        received += len(line) + 1
+                        yield line
+                trace(self.name, self.header(command), start, sent=len(command) + 1, received=received)
+
+        def header(self, command):
+                """Returns the header a command is traced under, the command's first word."""
+                return command.split(None, 1)[0] if command.strip() else ""
+
         def write(self, command):
                 # write command must also read output to flush stdout - to do this use self.query
                 self.query(command)
@@ -86,36 +96,83 @@ class PyvisaShellComm(object):
         def write_raw(self, command):
                 self.instrument.write(command)
 
+        def strip(self, text):
+                return text.replace("\r", "").replace("\n", "")
+
+        def read_chunk(self):
+                """Appends whatever the instrument has received, at least one byte, to the buffer.
+                Serial ports are drained in one call instead of one read per line, which avoids input overruns."""
+                if hasattr(self.instrument, 'read_very_eager'):
+                        # telnetlib connection
+                        data = self.instrument.read_very_eager() or self.instrument.read_some()
+                elif hasattr(self.instrument, 'bytes_in_buffer'):
+                        # serial port: take everything waiting, or block for the next byte
+                        data = self.instrument.read_bytes(max(1, min(self.instrument.bytes_in_buffer, self.CHUNK_SIZE)))
+                elif hasattr(self.instrument, 'read_raw'):
+                        data = self.instrument.read_raw()
+                else:
+                        data = (self.instrument.read() + "\n").encode('utf-8')
+                logger.debug("Read %d bytes" % len(data))
+                self.buffer.extend(data)
+
         def read_line(self):
-                result = self.instrument.read()
-                logger.info("Read %s" % repr(result))
-                result = result.replace("\n", "")
-                result = result.replace("\r", "")
-                return result
+                """Returns the next complete line from the buffer without its line ending."""
+                while True:
+                        end = self.buffer.find(b'\n', self.scanned)
+                        if end >= 0:
+                                break
+                        self.scanned = len(self.buffer)
+                        self.read_chunk()
+                line = self.buffer[:end].decode('utf-8', 'replace')
+                del self.buffer[:end + 1]
+                self.scanned = 0
+                logger.debug("Read %s" % repr(line))
+                return line.replace("\r", "")
+
+        def read_echo(self, command):
+                """Reads the echo of command, which the terminal may have wrapped over several lines."""
+                expected = len(self.strip(command))
+                echo = ""
+                while True:
+                        echo += self.read_line()
+                        if self.prompt in echo:
+                                echo = echo.split("# ", 1)[1]
+                        if len(echo) >= expected:
+                                return echo
+
+        def iter_until(self, pattern):
+                """Yields output lines until the buffer holds just a line matching pattern, the prompt
+                for the next command, which is kept as cwd_prompt. Raises VisaIOError if it times out."""
+                try:
+                        while True:
+                                end = self.buffer.find(b'\n', self.scanned)
+                                if end >= 0:
+                                        line = self.buffer[:end].decode('utf-8', 'replace').replace("\r", "")
+                                        del self.buffer[:end + 1]
+                                        self.scanned = 0
+                                        yield line
+                                        continue
+                                self.scanned = len(self.buffer)
+                                if pattern.match(self.buffer):
+                                        self.cwd_prompt = self.buffer.decode('utf-8', 'replace')
+                                        del self.buffer[:]
+                                        self.scanned = 0
+                                        logger.debug("Shell command complete")
+                                        return
+                                self.read_chunk()
+                except VisaIOError as error:
+                        if error.abbreviation == "VI_ERROR_TMO":
+                                logger.error("Parsing for shell command prompt failed!\nbuffer = %s" % repr(bytes(self.buffer)))
+                                logger.error("pyvisa.errors.VisaIOError: %s" % error.description)
+                        raise error
 
         def read_until(self, prompt):
-                """For shell commands only. Reads and appends each line to the output until it reaches
-                the prompt for next command. Returns the appended output. Raises a timeout error if it
-                fails to parse the prompt for next command."""
+                """For shell commands only. Reads the output until it reaches the prompt for next command.
+                Returns the output. Raises a timeout error if it fails to parse the prompt for next command."""
+                pattern = re.compile(re.escape(prompt.encode('utf-8')) + b'[^\n]*$')
                 output = ""
-                command_complete = False
-                while not command_complete:
-                        try:
-                                line = self.read_line()
-                        except VisaIOError as error:
-                                if error.abbreviation == "VI_ERROR_TMO":
-                                        logger.error("Parsing for shell command prompt failed!\noutput = %s" % repr(output))
-                                        logger.error("pyvisa.errors.VisaIOError: %s" % error.description)
-                                raise error
-                        else:
-                                if prompt in line:
-                                        command_complete = True
-                                        logger.debug("Shell command complete")
-                                        self.cwd_prompt = line
-                                        # logger.debug("cwd_prompt is %r" % line)
-                                else:
-                                        output += line
-                                        output += "\n"
+                for line in self.iter_until(pattern):
+                        output += line + "\n"
                 return output
 
         def read_all(self):
@@ -140,6 +197,3 @@ class PyvisaShellComm(object):
                                         raise
                         else:
                                 print(line)
-
-
-
@@ -0,0 +1,314 @@
+"""Records the traffic of instrument comms to a session file and replays it without the instruments."""
+from contextlib import contextmanager
+from collections import deque, defaultdict
+import numpy as np
+import base64, builtins, gzip, json, logging, sys, threading, time
+logger = logging.getLogger(__name__)
+
+# comm classes that record() and replay() stand in for
+COMM_CLASSES = ["Comm", "TelnetComm", "SNMPComm", "SSHComm", "PyvisaShellComm"]
+# comm methods whose calls are recorded and replayed
+OPERATIONS = ["write", "query", "queryAll", "get", "bulk", "walk", "flush", "readBack",
+        "queryBinary", "writeBinary", "run", "cachedValue"]
+# comm attributes drivers read, recorded when the comm is opened and set on its stand-in on replay
+ATTRIBUTES = ["BATCH_MAX_LENGTH"]
+# operations taking a buffer to read into, with its argument position. The buffer is not recorded,
+# it is filled with the recorded data on replay.
+BUFFERS = {"queryBinary": 2}
+
+def encode(value):
+        """Returns a JSON-able form of binary data: NumPy arrays keep their data type, other buffers become bytes."""
+        if isinstance(value, np.ndarray):
+                return {'array': base64.b64encode(np.ascontiguousarray(value).tobytes()).decode('ascii'), 'dtype': value.dtype.str}
+        if isinstance(value, (bytes, bytearray, memoryview)):
+                return {'bytes': base64.b64encode(bytes(value)).decode('ascii')}
+        return repr(value)
+
+def decode(value):
+        """Returns binary data recorded by encode() as a NumPy array or bytes, and anything else unchanged."""
+        if isinstance(value, dict) and ('array' in value):
+                return np.frombuffer(base64.b64decode(value['array']), dtype=value['dtype']).copy()
+        if isinstance(value, dict) and ('bytes' in value):
+                return base64.b64decode(value['bytes'])
+        return value
+
+def normalise(value):
+        """Returns value as it reads back from the session file, e.g. tuples become lists."""
+        return json.loads(json.dumps(value, default=encode))
+
+def splitBuffer(name, args, kwargs):
+        """Separates the buffer argument of an operation in BUFFERS from the arguments that are recorded."""
+        if name not in BUFFERS:
+                return args, kwargs, None
+        kwargs = dict(kwargs)
+        buffer = kwargs.pop('buffer', None)
+        if len(args) > BUFFERS[name]:
+                buffer = args[BUFFERS[name]]
+                args = args[:BUFFERS[name]]
+        return args, kwargs, buffer
+
+class ReplayError(RuntimeError):
+        """Raised when a replayed script does something the recorded session did not,
+        and in place of errors raised while recording that are not built-in exceptions."""
+
+class SessionRecorder(object):
+
+        def __init__(self, path):
+                """
+                Writes a session file: gzipped JSON lines, one per comm operation, with keys
+                'c' (comm number), 'op', 'a' (arguments), 'r' (result), 'e' (error), 't' (start, seconds
+                since the session began) and 'd' (latency in seconds). Each comm starts with an 'open'
+                line holding its class name 'cls', constructor arguments 'a', keyword arguments 'k'
+                and the values of its ATTRIBUTES 'v'.
+
+                Input:
+                        path: string file name, e.g. 'NetAnDemo.session.gz'
+
+                Output:
+                        SessionRecorder object
+                """
+                self.path = path
+                self.file = gzip.open(path, 'wt')
+                self.lock = threading.Lock()
+                self.start = time.perf_counter()
+                self.comms = 0
+
+        def log(self, entry):
+                with self.lock:
+                        if self.file.closed:
+                                return  # e.g. a driver closing its comm after the session ended
+                        self.file.write(json.dumps(entry, default=encode, separators=(',', ':')) + '\n')
+
+        def open(self, comm, args, kwargs):
+                """Wraps a newly constructed comm so that its operations are recorded."""
+                with self.lock:
+                        number = self.comms
+                        self.comms += 1
+                attributes = dict((name, getattr(comm, name)) for name in ATTRIBUTES if hasattr(comm, name))
+                self.log({'c': number, 'op': 'open', 'cls': type(comm).__name__, 'a': args, 'k': kwargs,
+                        'v': attributes, 't': time.perf_counter() - self.start})
+                return RecordingComm(comm, self, number)
+
+        def close(self):
+                with self.lock:
+                        self.file.close()
+                logger.info("Recorded %d comms to %s" % (self.comms, self.path))
+
+class RecordingComm(object):
+        """
+        Stands in for a comm and records each write, query and response with its latency.
+        Everything else, e.g. enableStateCache() or lock, is passed through to the comm.
+        """
+
+        def __init__(self, comm, recorder, number):
+                self.comm = comm
+                self.recorder = recorder
+                self.number = number
+
+        def __getattr__(self, name):
+                attribute = getattr(self.comm, name)
+                if name not in OPERATIONS:
+                        return attribute
+                def method(*args, **kwargs):
+                        return self.call(name, attribute, args, kwargs)
+                method.__name__ = name
+                method.__doc__ = attribute.__doc__
+                return method
+
+        def call(self, name, function, args, kwargs):
+                start = time.perf_counter()
+                recordedArgs, recordedKwargs, buffer = splitBuffer(name, args, kwargs)
+                entry = {'c': self.number, 'op': name, 'a': recordedArgs, 'k': recordedKwargs, 't': start - self.recorder.start}
+                try:
+                        result = function(*args, **kwargs)
+                except Exception as e:
+                        entry['e'] = [type(e).__name__, str(e)]
+                        raise
+                else:
+                        entry['r'] = result
+                        return result
+                finally:
+                        entry['d'] = time.perf_counter() - start
+                        self.recorder.log(entry)
+
+        @contextmanager
+        def batch(self):
+                # writes made in the block are recorded one by one, the flush at the end of the block as 'flush'
+                with self.comm.batch():
+                        yield self
+                        start = time.perf_counter()
+                self.recorder.log({'c': self.number, 'op': 'flush', 'a': [], 'k': {}, 'r': None,
+                        't': start - self.recorder.start, 'd': time.perf_counter() - start})
+
+class ReplayResource(object):
+        """Stands in for comm.instrument, which drivers only use to close the connection."""
+        def close(self):
+                pass
+
+class ReplayComm(object):
+
+        def __init__(self, entries, realtime=False, attributes={}):
+                """
+                Answers a script's comm operations with the ones recorded in a session, in order.
+
+                Input:
+                        entries: list of recorded entries of one comm, without its 'open' entry
+                        realtime: if True, each operation takes as long as it did when recorded,
+                                  otherwise it returns immediately
+                        attributes: dictionary of the comm's ATTRIBUTES recorded by its 'open' entry
+
+                Output:
+                        ReplayComm object
+                """
+                self.__dict__.update(attributes)
+                self.entries = deque(entries)
+                self.realtime = realtime
+                self.instrument = ReplayResource()
+                self.cache = None
+                self.queryCache = None
+                self.pending = None
+
+        def __getattr__(self, name):
+                if name not in OPERATIONS:
+                        raise AttributeError(name)
+                def method(*args, **kwargs):
+                        return self.replay(name, args, kwargs)
+                method.__name__ = name
+                return method
+
+        def replay(self, name, args, kwargs={}):
+                args, kwargs, buffer = splitBuffer(name, args, kwargs)
+                if not self.entries:
+                        raise ReplayError("%s%r was not recorded, the session has ended" % (name, tuple(args)))
+                entry = self.entries.popleft()
+                if (entry['op'] != name) or (entry['a'] != normalise(list(args))) or (entry['k'] != normalise(kwargs)):
+                        raise ReplayError("Expected %s%r, but the script called %s%r" % (entry['op'], tuple(entry['a']), name, tuple(args)))
+                if self.realtime:
+                        time.sleep(entry['d'])
+                if 'e' in entry:
+                        errorType, message = entry['e']
+                        error = getattr(builtins, errorType, None)
+                        if isinstance(error, type) and issubclass(error, Exception):
+                                raise error(message)
+                        raise ReplayError("%s: %s" % (errorType, message))
+                result = decode(entry['r'])
+                if (buffer is not None) and isinstance(result, np.ndarray):
+                        # fill the script's buffer like the comm would, and return a view of it
+                        view = memoryview(buffer).cast('B')
+                        if result.nbytes > len(view):
+                                raise ValueError("%d byte block does not fit in a %d byte buffer" % (result.nbytes, len(view)))
+                        view[:result.nbytes] = result.tobytes()
+                        result = np.frombuffer(buffer, dtype=result.dtype, count=len(result))
+                return result
+
+        @contextmanager
+        def batch(self):
+                yield self
+                self.replay('flush', [])
+
+        def close(self):
+                pass
+
+        # the caches ran while recording, so the recorded traffic already reflects them
+        def enableStateCache(self):
+                pass
+
+        def enableQueryCache(self, queries={}):
+                pass
+
+        def invalidate(self, command=None):
+                pass
+
+def load(path):
+        """Returns the entries of a session file as a list of dictionaries."""
+        with gzip.open(path, 'rt') as file:
+                return [json.loads(line) for line in file if line.strip()]
+
+def summarize(path):
+        """
+        Splits the run time of a recorded session into time spent waiting on instruments and everything else.
+
+        Input:
+                path: string session file name
+
+        Output:
+                dictionary with 'calls', 'wall' (seconds from the first to the last operation),
+                'instrument' (seconds inside comm operations), 'overhead' (wall - instrument)
+                and 'operations' (op name -> {'calls', 'seconds'})
+        """
+        entries = [entry for entry in load(path) if entry['op'] != 'open']
+        operations = defaultdict(lambda: {'calls': 0, 'seconds': 0.0})
+        for entry in entries:
+                operations[entry['op']]['calls'] += 1
+                operations[entry['op']]['seconds'] += entry['d']
+        wall = max([entry['t'] + entry['d'] for entry in entries] or [0.0]) - min([entry['t'] for entry in entries] or [0.0])
+        instrument = sum(entry['d'] for entry in entries)
+        return {'calls': len(entries), 'wall': wall, 'instrument': instrument, 'overhead': wall - instrument,
+                'operations': dict(operations)}
+
+@contextmanager
+def patchComms(factory):
+        """Replaces the comm classes in every loaded SCTA.Instrumentation module with factory(cls, args, kwargs)."""
+        patched = []
+        for module in list(sys.modules.values()):
+                if not getattr(module, '__name__', '').startswith(__package__):
+                        continue
+                for name in COMM_CLASSES:
+                        cls = getattr(module, name, None)
+                        if isinstance(cls, type) and (cls.__name__ == name):
+                                def construct(*args, _cls=cls, **kwargs):
+                                        return factory(_cls, args, kwargs)
+                                setattr(module, name, construct)
+                                patched.append((module, name, cls))
+        try:
+                yield
+        finally:
+                for module, name, cls in patched:
+                        setattr(module, name, cls)
+
+@contextmanager
+def record(path):
+        """
+        Records the traffic of every comm the drivers construct inside the with-block, e.g.
+
+                with record('NetAnDemo.session.gz'):
+                        fsw = FSW(type="IP", port=FSW_IP)
+                        ...
+                print(summarize('NetAnDemo.session.gz'))
+        """
+        recorder = SessionRecorder(path)
+        try:
+                with patchComms(lambda cls, args, kwargs: recorder.open(cls(*args, **kwargs), args, kwargs)):
+                        yield recorder
+        finally:
+                recorder.close()
+
+@contextmanager
+def replay(path, realtime=False):
+        """
+        Runs the with-block against a recorded session instead of the instruments. Comms are matched
+        to the recording by class and constructor arguments, in the order they were constructed.
+        Raises ReplayError when the block sends something the recording did not.
+
+        Input:
+                path: string session file name
+                realtime: if True, operations take as long as they did when recorded,
+                          otherwise they return immediately, leaving only Python's own run time
+        """
+        opens = defaultdict(deque)     # (class name, arguments) -> comm numbers, in construction order
+        attributes = {}                 # comm number -> recorded ATTRIBUTES
+        entries = defaultdict(list)
+        for entry in load(path):
+                if entry['op'] == 'open':
+                        opens[(entry['cls'], json.dumps([entry['a'], entry['k']], sort_keys=True))].append(entry['c'])
+                        attributes[entry['c']] = entry.get('v', {})
+                else:
+                        entries[entry['c']].append(entry)
+        def factory(cls, args, kwargs):
+                key = (cls.__name__, json.dumps(normalise([list(args), kwargs]), sort_keys=True))
+                if not opens[key]:
+                        raise ReplayError("No %s%r was recorded" % (cls.__name__, tuple(args)))
+                number = opens[key].popleft()
+                return ReplayComm(entries[number], realtime, attributes[number])
+        with patchComms(factory):
+                yield
@@ -2,7 +2,7 @@ from ..Simulation.Parameters import simLevel, isSimulation
 from ..utils.misc import singleton
 from telnetlib import Telnet
 import paramiko
-import logging
+import logging, select, socket, threading, time
 logger = logging.getLogger(__name__)
 
 # If it is a simulation, do not import pyvisa
@@ -16,42 +16,193 @@ except ImportError:
 		logger.error("PyVISA is not installed. Equipment classes will not work!")
 		raise
 
-class RealTelnetResourceManager(object):
+class PooledConnection(object):
+	"""
+	Stands in for a connection held by a ConnectionPool. Attribute access is forwarded to the pool's
+	current connection for the key, so comms holding this object keep working when the pool
+	replaces a dead or evicted session. A call that fails because the session died reconnects,
+	and is retried once on the fresh connection if it is in the pool's Retry set (calls that can be
+	repeated safely, like writes). Other calls, e.g. reads whose request went out on the dead session,
+	raise the error.
+	Comms sharing this object hold lock across each exchange (e.g. a query and its answer),
+	so their messages do not interleave.
+	"""
+	def __init__(self, pool, key):
+		self._pool = pool
+		self._key = key
+		self.lock = threading.RLock()
+
+	def __getattr__(self, name):
+		attribute = getattr(self._pool.connection(self._key), name)
+		if not callable(attribute):
+			return attribute
+		def method(*args, **kwargs):
+			try:
+				return attribute(*args, **kwargs)
+			except self._pool.DeadErrors as error:
+				if isinstance(error, socket.timeout):
+					raise
+				logger.warning("Connection to %s failed (%r), reconnecting" % (self._pool.describe(self._key), error))
+				connection = self._pool.reconnect(self._key)
+				if name not in self._pool.Retry:
+					raise
+				return getattr(connection, name)(*args, **kwargs)
+		return method
+
+	def unwrap(self):
+		"""Returns the pooled connection itself, for state that must be changed in place (e.g. telnetlib's buffers)"""
+		return self._pool.connection(self._key)
+
+	def close(self):
+		self._pool.release(self._key)
+
+class ConnectionPool(object):
+	"""
+	Thread-safe cache of open connections, one per key. Connections that have been idle for
+	probeInterval seconds are checked before use and reopened if dead, and connections idle for
+	idleTimeout seconds are closed (a PooledConnection reopens them on its next use).
+	Subclasses implement connect(key), isAlive(connection) and describe(key).
+	"""
 	Error = TimeoutError
+	# errors that mean the session is gone rather than slow
+	DeadErrors = (EOFError, OSError)
+	# calls that are repeated on a fresh connection when the session died under them
+	Retry = set()
 
-	def __init__(self):
-		self.connections = {}
+	def __init__(self, probeInterval=30, idleTimeout=3600):
+		self.probeInterval = probeInterval
+		self.idleTimeout = idleTimeout
+		self.connections = {}	# key -> open connection
+		self.proxies = {}		# key -> PooledConnection handed out
+		self.lastUsed = {}		# key -> time.monotonic() of the last use
+		self.lock = threading.RLock()
+		self.statistics = {'hits': 0, 'misses': 0, 'reconnects': 0, 'probes': 0, 'evictions': 0}
 
 	def __del__(self):
 		for resource in self.connections:
-			self.connections[resource].close()
+			self.disconnect(self.connections[resource])
 
-	def open_resource(self, ip, port=23):
-		if (ip, port) in self.connections:
-			return self.connections[(ip, port)]
-		else:
-			self.connections[(ip, port)] = Telnet(ip, port=port)
-			return self.connections[(ip, port)]
+	def checkout(self, key):
+		"""Returns the PooledConnection for key, connecting if there is none yet."""
+		with self.lock:
+			self.evictIdle()
+			if key in self.proxies:
+				self.statistics['hits'] += 1
+			else:
+				self.statistics['misses'] += 1
+				self.connections[key] = self.connect(key)
+				self.lastUsed[key] = time.monotonic()
+				self.proxies[key] = PooledConnection(self, key)
+			return self.proxies[key]
+
+	def connection(self, key):
+		"""Returns a live connection for key, probing it first if it has been idle for probeInterval."""
+		with self.lock:
+			now = time.monotonic()
+			connection = self.connections.get(key)
+			if connection is None:
+				connection = self.reconnect(key)
+			elif now - self.lastUsed[key] > self.probeInterval:
+				self.statistics['probes'] += 1
+				if not self.isAlive(connection):
+					logger.info("Connection to %s is dead, reconnecting" % self.describe(key))
+					connection = self.reconnect(key)
+			self.lastUsed[key] = time.monotonic()
+			return connection
+
+	def reconnect(self, key):
+		with self.lock:
+			connection = self.connections.pop(key, None)
+			if connection is not None:
+				self.disconnect(connection)
+			self.statistics['reconnects'] += 1
+			self.connections[key] = self.connect(key)
+			self.lastUsed[key] = time.monotonic()
+			return self.connections[key]
+
+	def release(self, key):
+		"""Closes the connection for key and forgets it."""
+		with self.lock:
+			connection = self.connections.pop(key, None)
+			self.proxies.pop(key, None)
+			self.lastUsed.pop(key, None)
+		if connection is not None:
+			self.disconnect(connection)
+
+	def evictIdle(self):
+		"""Closes connections that have not been used for idleTimeout seconds."""
+		with self.lock:
+			now = time.monotonic()
+			for key in list(self.connections):
+				if now - self.lastUsed[key] > self.idleTimeout:
+					logger.info("Closing connection to %s after %.0f sec idle" % (self.describe(key), now - self.lastUsed[key]))
+					self.disconnect(self.connections.pop(key))
+					self.statistics['evictions'] += 1
+
+	def stats(self):
+		"""Returns a dictionary of pool counters and the number of open connections."""
+		with self.lock:
+			stats = dict(self.statistics)
+			stats['open'] = len(self.connections)
+			return stats
+
+	def disconnect(self, connection):
+		try:
+			connection.close()
+		except Exception as error:
+			logger.debug("Error closing connection: %r" % error)
 
-class RealSSHResourceManager(object):
+class RealTelnetResourceManager(ConnectionPool):
 	Error = TimeoutError
+	# a write that failed did not reach the instrument, reads would wait for an answer that was lost
+	Retry = set(['write'])
 
-	def __init__(self):
-		self.connections = {}
+	def open_resource(self, ip, port=23):
+		return self.checkout((ip, port))
 
-	def __del__(self):
-		for resource in self.connections:
-			self.connections[resource].close()
+	def connect(self, key):
+		ip, port = key
+		return Telnet(ip, port=port)
+
+	def describe(self, key):
+		return "%s:%d" % key
+
+	def isAlive(self, connection):
+		"""A closed socket is readable and returns no data when peeked at."""
+		sock = connection.get_socket()
+		if (sock is None) or (sock.fileno() < 0):
+			return False
+		try:
+			readable, writable, failed = select.select([sock], [], [], 0)
+			if readable:
+				return sock.recv(1, socket.MSG_PEEK) != b''
+		except OSError:
+			return False
+		return True
+
+class RealSSHResourceManager(ConnectionPool):
+	Error = TimeoutError
+	DeadErrors = (EOFError, OSError, paramiko.SSHException)
+	# seconds between SSH keep-alive packets, which stop NAT and firewalls dropping idle sessions
+	keepAlive = 30
 
 	def open_resource(self, ip, username, password):
-		if ip in self.connections:
-			return self.connections[(ip, username, password)]
-		else:
-			client = paramiko.SSHClient()
-			client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-			client.connect(ip, username=username, password=password)
-			self.connections[(ip, username, password)] = client
-			return self.connections[(ip, username, password)]
+		return self.checkout((ip, username, password))
+
+	def connect(self, key):
+		ip, username, password = key
+		client = paramiko.SSHClient()
+		client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+		client.connect(ip, username=username, password=password)
+		client.get_transport().set_keepalive(self.keepAlive)
+		return client
+
+	def describe(self, key):
+		return "%s@%s" % (key[1], key[0])
+
+	def isAlive(self, connection):
+		transport = connection.get_transport()
+		return (transport is not None) and transport.is_active()
 
 class SimulatedTelnetResourceManager:
 	Error = IOError
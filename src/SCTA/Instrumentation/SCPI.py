@@ -0,0 +1,110 @@
+"""Helpers for building SCPI messages that are shared by the comm classes."""
+import logging, time
+logger = logging.getLogger(__name__)
+
+def joinCommands(commands, maxLength=1024):
+        """Concatenates SCPI commands into as few program messages as possible.
+
+        Every command is rooted with a leading ':' (common '*' commands are left alone)
+        so that concatenated headers do not depend on the previous command's subsystem.
+        A new message is started whenever appending a command would exceed maxLength.
+
+        Input:
+                commands: list of string SCPI commands
+                maxLength: integer maximum number of characters per message
+
+        Output:
+                list of string program messages
+        """
+        messages = []
+        message = ""
+        for command in commands:
+                command = command.strip()
+                if not command:
+                        continue
+                if command[0] not in "*:":
+                        command = ":" + command
+                if message and (len(message) + 1 + len(command) > maxLength):
+                        messages.append(message)
+                        message = ""
+                message = message + ";" + command if message else command
+        if message:
+                messages.append(message)
+        return messages
+
+# IEEE 488.2 status bits
+ESR_OPC = 0x01  # Operation Complete
+ESR_ERRORS = {0x04: "query error", 0x08: "device-dependent error", 0x10: "execution error", 0x20: "command error"}
+STB_ESB = 0x20  # Event Status Bit summary in the status byte
+STB_RQS = 0x40  # Request Service
+
+def checkEventStatus(esr, command=None):
+        """Logs a warning for every error bit set in an Event Status Register value."""
+        for bit, name in sorted(ESR_ERRORS.items()):
+                if esr & bit:
+                        logger.warning("Instrument reported an error (%s) after %r, ESR = %d" % (name, command, esr))
+
+def pollUntil(condition, interval=0.001, backoff=2.0, maxInterval=0.1, timeout=None):
+        """Calls condition() until it returns True, sleeping between calls.
+        The sleep starts at interval and is multiplied by backoff after every call, up to maxInterval.
+
+        Input:
+                condition: function taking no arguments and returning True when done
+                interval: float first sleep in seconds
+                backoff: float multiplier applied to the sleep after every unsuccessful poll
+                maxInterval: float longest sleep in seconds
+                timeout: float seconds before giving up, or None to wait forever
+
+        Output:
+                float seconds spent waiting
+
+        Raises TimeoutError when the timeout expires.
+        """
+        start = time.perf_counter()
+        while not condition():
+                elapsed = time.perf_counter() - start
+                if (timeout is not None) and (elapsed > timeout):
+                        raise TimeoutError("Condition not met after %.3f sec" % elapsed)
+                time.sleep(interval)
+                interval = min(interval * backoff, maxInterval)
+        return time.perf_counter() - start
+
+def blockHeader(length):
+        """Returns the IEEE 488.2 definite-length block header for length bytes, e.g. b'#41024'."""
+        digits = str(length).encode('ascii')
+        return b'#' + str(len(digits)).encode('ascii') + digits
+
+def readBlock(readInto, buffer=None, terminated=True):
+        """
+        Reads an IEEE 488.2 definite-length block '#<n><length><data>' straight into a buffer.
+
+        Input:
+                readInto: function filling a memoryview with exactly as many bytes as it is long
+                buffer: bytearray, memoryview or C-contiguous NumPy array to read the data into,
+                        or None to allocate a bytearray of the block's length
+                terminated: if True, also reads the newline that ends the response
+
+        Output:
+                (buffer, integer length of the data in bytes)
+        """
+        head = bytearray(2)
+        readInto(memoryview(head))
+        if head[:1] != b'#' or not head[1:2].isdigit():
+                raise ValueError("Expected an IEEE 488.2 block, got %r" % bytes(head))
+        digits = int(head[1:2])
+        if digits == 0:
+                raise ValueError("Indefinite-length blocks (#0) are not supported")
+        size = bytearray(digits)
+        readInto(memoryview(size))
+        length = int(size)
+        if buffer is None:
+                buffer = bytearray(length)
+        view = memoryview(buffer).cast('B')
+        if len(view) < length:
+                # read the block anyway, so the next response is not taken from the middle of this one
+                readInto(memoryview(bytearray(length + terminated)))
+                raise ValueError("Block of %d bytes does not fit in a buffer of %d bytes" % (length, len(view)))
+        readInto(view[:length])
+        if terminated:
+                readInto(memoryview(bytearray(1)))
+        return buffer, length
@@ -1,14 +1,35 @@
 from . import Modulator
 from . import Comm
+from .InstrumentState import InstrumentState
+from .Cache import queryFor
 import logging
 import time
 from .ResourceManagers import PyvisaResourceManager
 
 logger = logging.getLogger(__name__)
 
-class SFU(Modulator):
-
-	def __init__(self, id="SFU", type="GPIB", port="28"):
+class SFU(Modulator, InstrumentState):
+
+	# settings written by config
+	CONFIG = [
+		"SYST:DISP:UPD ON",
+		"SOUR:NOIS:COUP ON",				#Sets bandwidth coupling ON
+		"SOUR:NOISE:AWGN ON",				#Enables AWGN
+		"SOUR:DM:SOUR DTV",					#Configures SFU to DTV mode
+		"SOUR:DM:TRAN:STAN DVS2",			#Configures SFU for DVBS2 standard
+		"SOUR:IQC:DVBS2:AMC DVS2",			#Configures SFU for DVBS2 Standard)
+		"SOUR:IQC:DVBS2:SOUR TEST",			#Configures SFU for Test mode
+		"SOUR:IQC:DVBS2:FECF NORM",			#Configures SFU FEC
+		"SOUR:IQC:DVBS2:TSP S187",			#Configures SFU for 187 byte packets for DVBS2
+		"SOUR:IQC:DVBS2:PRBS:SEQ P23_1",	#Configures packets to have PRBS 2^(23-1)
+	]
+	# the configuration identifies a setup saved by saveState (see InstrumentState)
+	STATE_QUERIES = [queryFor(command) for command in CONFIG]
+	# transponder settings read back by warm construction
+	WARM_QUERIES = ["SOUR:FREQ:ACT:CENT?", "SOUR:IQC:DVBS2:SYMB:RATE?", "SOUR:IQC:DVBS2:ROLL?",
+		"SOUR:IQC:DVBS2:PIL?", "SOUR:IQC:DVBS2:SPEC:SETT:STAT?", "SOUR:IQC:DVBS2:SPEC:SCR:SEQ?"]
+
+	def __init__(self, id="SFU", type="GPIB", port="28", warm=False, completion="opc"):
 		"""
 		Creates an SFU object, which starts a connection for reading and writing commands to the SFU.
 		With no inputs specified, it assumes the host computer's interface is GPIB at port 28.
@@ -17,19 +38,24 @@ class SFU(Modulator):
 			id: string
 			type: string interface type
 			port: string interface address/ port
+			warm: boolean, read the SFU's settings back in bulk and only write the ones that differ,
+			      instead of configuring it from scratch
+			completion: string 'opc' (the default) or 'status', how the comm waits for operation complete.
+			            'status' only for a SFU checked to report the OPC event as documented (see Comm)
 
 		Output:
 			SFU object
 
 		~~~ Valid ranges ~~~
-		type:        ['GPIB', 'IP']
+		type:        ['GPIB', 'IP', 'SOCKET']
 		port:        ['28' or '192.10.10.10']
 		cnr:         [0, 20] dB
 		"""
 
-		self.comm = Comm(protocol=type, port=port)
+		self.comm = Comm(protocol=type, port=port, completion=completion)
 		self.cnr=None
-		super ().__init__(id=id)
+		transponder = self.readSettings() if warm else {}
+		super ().__init__(id=id, **transponder)
 		self.config()
 
 	def __del__(self):
@@ -60,18 +86,36 @@ class SFU(Modulator):
 			None
 		"""
 		logger.info("SFU device ID: %s" % (self.comm.query("*IDN?")) )
-		self.comm.write("SYST:DISP:UPD ON")
-		self.comm.write("SOUR:NOIS:COUP ON") 				#Sets bandwidth coupling ON
-		self.comm.write("SOUR:NOISE:AWGN ON")				#Enables AWGN
-		self.comm.write("SOUR:DM:SOUR DTV")					#Configures SFU to DTV mode 
-		self.comm.write("SOUR:DM:TRAN:STAN DVS2")			#Configures SFU for DVBS2 standard
-		self.comm.write("SOUR:IQC:DVBS2:AMC DVS2")			#Configures SFU for DVBS2 Standard)
-		self.comm.write("SOUR:IQC:DVBS2:SOUR TEST")			#Configures SFU for Test mode
-		self.comm.write("SOUR:IQC:DVBS2:FECF NORM")			#Configures SFU FEC 
-		self.comm.write("SOUR:IQC:DVBS2:TSP S187")			#Configures SFU for 187 byte packets for DVBS2
-		self.comm.write("SOUR:IQC:DVBS2:PRBS:SEQ P23_1")	#Configures packets to have PRBS 2^(23-1)
+		for command in self.CONFIG:
+			self.comm.write(command)
 		logger.info("SFU configuration complete")
 
+	def readSettings(self):
+		"""
+		Reads the SFU's configuration and transponder settings with as few queries as possible and starts
+		the state cache with them, so config and the transponder setters only write the settings that differ.
+		Only called by SFU __init__ with warm=True
+		WARNING: NOT A USER FUNCTION
+
+		Input:
+			None
+
+		Output:
+			dictionary of Transponder keyword arguments read back (freq, symb, roll, pilots, scramb)
+		"""
+		self.comm.enableStateCache()
+		self.comm.readBack([queryFor(command) for command in self.CONFIG])
+		answers = dict(zip(self.WARM_QUERIES, self.comm.readBack(self.WARM_QUERIES)))
+		transponder = {
+			'freq': float(answers["SOUR:FREQ:ACT:CENT?"]),
+			'symb': float(answers["SOUR:IQC:DVBS2:SYMB:RATE?"]),
+			'roll': float(answers["SOUR:IQC:DVBS2:ROLL?"])*100,
+			'pilots': answers["SOUR:IQC:DVBS2:PIL?"] in ('1', 'ON'),
+			'scramb': int(answers["SOUR:IQC:DVBS2:SPEC:SCR:SEQ?"]),
+		}
+		logger.info("Read back SFU settings: %r" % transponder)
+		return transponder
+
 	def setBroadcastStandard(self, bcstd):
 		###########################################################
 		# BUG: Must send 2 different commands for setting code rate
@@ -1,5 +1,6 @@
 from . import Modulator
 from . import TelnetComm
+from .Cache import sameValue
 from ..System import Mode, Transponder
 import logging
 import time
@@ -8,29 +9,88 @@ logger = logging.getLogger(__name__)
 
 class SLG(Modulator):
 
-	def __init__(self, id="SLG", ip="192.168.10.1", port=5025, numMods=32):
+	# queries answered from the comm's query cache when it is enabled, with their time to live in seconds
+	# (None keeps an answer until a write to the same header or a reset)
+	CACHED_QUERIES = {
+		'*IDN?': None,
+		'MOD:CHAN:SYMB?': 60,
+		'MOD:CHAN:ROLL?': 60,
+		'MOD:CHAN:FORM?': 60,
+		'MOD:CHAN:FORM:CONS?': 60,
+		'MOD:CHAN:FORM:RATE?': 60,
+		'MOD:CHAN:FORM:PIL?': 60,
+	}
+
+	# settings of each modulator read back by warm construction, formatted with the modulator number
+	WARM_QUERIES = [
+		'MOD:CHAN%d:CARR?',
+		'MOD:CHAN%d:SOUR?',
+		'MOD:CHAN%d:STAT?',
+		'FREQ:CHAN%d:FREQ?',
+		'POW:CHAN%d:LEV?',
+		'MOD:CHAN%d:SYMB?',
+		'MOD:CHAN%d:ROLL?',
+		'MOD:CHAN%d:FORM?',
+		'MOD:CHAN%d:FORM:CONS?',
+		'MOD:CHAN%d:FORM:RATE?',
+		'MOD:CHAN%d:FORM:PIL?',
+	]
+
+	def __init__(self, id="SLG", ip="192.168.10.1", port=5025, numMods=32, warm=False, queryCache=False, completion="opc"):
 		"""Constructor.
 
+		warm: if True, the settings of all modulators are read back in bulk first (see readSettings),
+		      so only the ones that differ are written, here and by later setters
+		queryCache: if True, CACHED_QUERIES are answered from a cache. Only for scripts that are the SLG's
+		            sole user, as changes made elsewhere read stale until the answers expire
+		completion: 'opc' (the default) or 'status', how the comm waits for operation complete.
+		            'status' only for an SLG checked to report the OPC event as documented (see TelnetComm)
+
 		~~~ Valid ranges ~~~
 		type:        [GPIB, IP]
 		port:        [28 or 192.10.10.10]
 		cnr:         [0, 20] dB
 		"""
 
-		self.comm = TelnetComm(ip=ip, port=port, commands='SCPI')
+		self.comm = TelnetComm(ip=ip, port=port, commands='SCPI', completion=completion)
+		# skip writes of unchanged settings, so setTransponder only sends the fields that differ
+		self.comm.enableStateCache()
+		if queryCache:
+			self.comm.enableQueryCache(self.CACHED_QUERIES)
 		self.cnr=None
 		self.numMods=numMods
 		self.bcstd="DVB-S2"
-		for mods in list(range(1, numMods+1)):
-			self.setCarrierType("SINGLE", mods)
-			if mods<=16:
-				self.setInputSource("PN", mods)
-			else:
-				self.setInputSource("LOAD", mods)
+		if warm:
+			self.readSettings()
+		with self.comm.batch():
+			for mods in list(range(1, numMods+1)):
+				self.setCarrierType("SINGLE", mods)
+				if mods<=16:
+					self.setInputSource("PN", mods)
+				else:
+					self.setInputSource("LOAD", mods)
+
+	def readSettings(self):
+		"""
+		Reads the settings of all modulators with as few queries as possible and starts the caches with them
+
+		Input:
+			None
+
+		Output:
+			dictionary of modulator number -> dictionary of query -> string answer
+		"""
+		queries = [query % mods for mods in list(range(1, self.numMods+1)) for query in self.WARM_QUERIES]
+		answers = iter(self.comm.readBack(queries))
+		settings = {}
+		for mods in list(range(1, self.numMods+1)):
+			settings[mods] = dict((query % mods, next(answers)) for query in self.WARM_QUERIES)
+		logger.info("Read back the settings of %d modulators" % self.numMods)
+		return settings
 
 	def loadConfigFile(self, file):
 		"""
-		Loads the selected file to the SLG.
+		Loads the selected file to the SLG. This clears the comm's state cache.
 		"""
 		self.comm.write("MMEMory:LOAD:STATe 0, '%s'" % file)
 
@@ -68,15 +128,31 @@ class SLG(Modulator):
 		return Transponder(mode=mode, freq=freq, symb=symb, roll=roll, scramb=scramb, pilots=pilots)#, pol=pol, LO=LO)
 
 
+	def configure(self, channelPlan):
+		"""
+		Sets up many modulators at once. Only the settings that differ from the comm's state cache are sent,
+		as concatenated SCPI messages with a single wait for operation complete.
+
+		Input:
+			channelPlan: list of (modNumber, Transponder, power, state) tuples, where power is a float in dBm
+			             and state is True (ON) or False (OFF). Any of Transponder, power and state may be None
+			             to leave that part of the modulator as it is.
+
+		Output:
+			None
+		"""
+		with self.comm.batch():
+			for modNumber, txpdr, power, state in channelPlan:
+				if txpdr is not None:
+					self.setTransponder(txpdr, modNumber)
+				if power is not None:
+					self.setPower(power, modNumber)
+				if state is not None:
+					self.setModulatorState(state, modNumber)
+		logger.info("Configured %d modulators" % len(channelPlan))
+
 	def setAllTransponders(self, txpdr):
-		for mod in list(range(1, self.numMods+1)):
-			self.setTransponder(txpdr, mod)
-		"""	self.setMode(txpdr.getMode(), mod)
-			# set this transponder's parameters to corresponding input parameters
-			self.setFrequency(txpdr.getFrequency(), mod)
-			self.setSymbolRate(txpdr.getSymbolRate(), mod)
-			self.setAlpha(txpdr.getAlpha(), mod)
-			self.setPilots(txpdr.getPilots(), mod)"""
+		self.configure([(mod, txpdr, None, None) for mod in list(range(1, self.numMods+1))])
 
 
 
@@ -88,10 +164,10 @@ class SLG(Modulator):
 			None
 
 		Output:
-			Either an integer AMC Mode Number or a custom Mode Object
+			Either an integer MODCOD Mode Number or a custom Mode Object
 		"""
 		mode = Mode(bcstd=self.getBroadcastStandard(modNumber), mod=self.getConstellation(modNumber), fec=self.getCodeRate(modNumber))
-		num = Mode.toAMC(mode)
+		num = Mode.toMODCOD(mode)
 		if num is None:
 			return mode
 		else:
@@ -103,15 +179,15 @@ class SLG(Modulator):
 		Sets the current mode
 
 		Input:
-			Either an integer AMC Mode Number or a custom Mode Object
+			Either an integer MODCOD Mode Number or a custom Mode Object
 
 		Output:
 			None
 		"""
-		# If AMC mode number is specified, get the corresponding mode object
+		# If MODCOD mode number is specified, get the corresponding mode object
 		if type(mode) is int:
 			num = mode
-			mode = Mode.fromAMC(num)
+			mode = Mode.fromMODCOD(num)
 		self.setBroadcastStandard(mode.getBroadcastStandard(), modNumber)
 		self.setConstellation(mode.getConstellation(), modNumber)
 		self.setCodeRate(mode.getCodeRate(), modNumber)
@@ -221,7 +297,11 @@ class SLG(Modulator):
 		PN
 		TSG
 		"""
-		self.comm.write("MOD:CHAN%d:SOUR %s" % (modNumber,source))
+		# the SLG reads PN23 SYNC back for a PN source: writing PN again would only undo the
+		# synchronisation, so a modulator already set up that way is left alone
+		known = self.comm.cachedValue("MOD:CHAN%d:SOUR" % modNumber)
+		if not (source=="PN" and known is not None and sameValue(known, "PN23 SYNC")):
+			self.comm.write("MOD:CHAN%d:SOUR %s" % (modNumber,source))
 		if source=="PN":
 			self.comm.write("MOD:CHAN%d:SOUR PN23 SYNC"% modNumber)
 
@@ -249,7 +329,7 @@ class SLG(Modulator):
 
 	def setBroadcastStandard(self, bcstd, modNumber):
 		if bcstd=="DVB-S2":
-			self.comm.write("MOD:CHAN%d:FORM DVBS2" % modNumber)
+			bcstd = "DVBS2"
 		self.comm.write("MOD:CHAN%d:FORM %s"% (modNumber, bcstd))
 
 
@@ -0,0 +1,223 @@
+"""Encoding and decoding of SNMP v2c messages (BER, RFC 3416) used by SNMPComm and the simulated agent."""
+import logging
+logger = logging.getLogger(__name__)
+
+# SNMP versions as carried in the message header
+VERSION_2C = 1
+
+# PDU tags
+GET = 0xA0
+GETNEXT = 0xA1
+RESPONSE = 0xA2
+SET = 0xA3
+GETBULK = 0xA5
+
+# ASN.1 and SNMP application tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+IPADDRESS = 0x40
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIMETICKS = 0x43
+OPAQUE = 0x44
+COUNTER64 = 0x46
+NO_SUCH_OBJECT = 0x80
+NO_SUCH_INSTANCE = 0x81
+END_OF_MIB_VIEW = 0x82
+
+# value types accepted by SnmpSet.exe's -tp option, and a few more
+TYPES = {
+        'int': INTEGER,
+        'str': OCTET_STRING,
+        'null': NULL,
+        'oid': OBJECT_IDENTIFIER,
+        'ip': IPADDRESS,
+        'counter': COUNTER32,
+        'uint': GAUGE32,
+        'gauge': GAUGE32,
+        'timeticks': TIMETICKS,
+        'counter64': COUNTER64
+}
+
+ERRORS = {
+        0: "noError", 1: "tooBig", 2: "noSuchName", 3: "badValue", 4: "readOnly", 5: "genErr",
+        6: "noAccess", 7: "wrongType", 8: "wrongLength", 9: "wrongEncoding", 10: "wrongValue",
+        11: "noCreation", 12: "inconsistentValue", 13: "resourceUnavailable", 14: "commitFailed",
+        15: "undoFailed", 16: "authorizationError", 17: "notWritable", 18: "inconsistentName"
+}
+
+EXCEPTIONS = {NO_SUCH_OBJECT: "noSuchObject", NO_SUCH_INSTANCE: "noSuchInstance", END_OF_MIB_VIEW: "endOfMibView"}
+
+class SNMPError(IOError):
+        """Raised when an agent answers with a non-zero error-status or an exception value."""
+        pass
+
+########################
+### Encoding helpers ###
+########################
+
+def encodeLength(length):
+        if length < 0x80:
+                return bytes([length])
+        octets = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+        return bytes([0x80 | len(octets)]) + octets
+
+def encodeTLV(tag, payload):
+        return bytes([tag]) + encodeLength(len(payload)) + payload
+
+def encodeInteger(value, tag=INTEGER):
+        """Two's complement, minimal number of octets."""
+        value = int(value)
+        length = max(1, (value + (value < 0)).bit_length() // 8 + 1)
+        return encodeTLV(tag, value.to_bytes(length, 'big', signed=True))
+
+def encodeUnsigned(value, tag):
+        """Counter32, Gauge32, TimeTicks and Counter64 are unsigned, so they may need a leading zero octet."""
+        value = int(value)
+        length = value.bit_length() // 8 + 1
+        return encodeTLV(tag, value.to_bytes(length, 'big'))
+
+def encodeOID(oid):
+        parts = [int(x) for x in oid.strip('.').split('.')]
+        payload = bytearray([40 * parts[0] + parts[1]])
+        for part in parts[2:]:
+                chunk = [part & 0x7F]
+                part >>= 7
+                while part:
+                        chunk.insert(0, 0x80 | (part & 0x7F))
+                        part >>= 7
+                payload.extend(chunk)
+        return encodeTLV(OBJECT_IDENTIFIER, bytes(payload))
+
+def encodeValue(value, type='int'):
+        """Encodes a python value as the SNMP type named by type (see TYPES)."""
+        tag = TYPES[type]
+        if tag == INTEGER:
+                return encodeInteger(value)
+        if tag == OCTET_STRING:
+                if not isinstance(value, bytes):
+                        value = str(value).encode('utf-8')
+                return encodeTLV(OCTET_STRING, value)
+        if tag == NULL:
+                return encodeTLV(NULL, b'')
+        if tag == OBJECT_IDENTIFIER:
+                return encodeOID(value)
+        if tag == IPADDRESS:
+                return encodeTLV(IPADDRESS, bytes(int(x) for x in value.split('.')))
+        return encodeUnsigned(value, tag)
+
+def encodeMessage(community, pdu, requestID, varbinds, errorStatus=0, errorIndex=0):
+        """
+        Encodes an SNMP v2c message.
+
+        Input:
+                community: string community name
+                pdu: integer PDU tag, e.g. GET or SET
+                requestID: integer request id
+                varbinds: list of (string OID, encoded value bytes) pairs, use encodeValue() or NULL for gets
+                errorStatus: integer error-status, or non-repeaters for GETBULK
+                errorIndex: integer error-index, or max-repetitions for GETBULK
+
+        Output:
+                bytes
+        """
+        bindings = b''.join(encodeTLV(SEQUENCE, encodeOID(oid) + value) for oid, value in varbinds)
+        body = encodeInteger(requestID) + encodeInteger(errorStatus) + encodeInteger(errorIndex) + encodeTLV(SEQUENCE, bindings)
+        message = encodeInteger(VERSION_2C) + encodeTLV(OCTET_STRING, community.encode('ascii')) + encodeTLV(pdu, body)
+        return encodeTLV(SEQUENCE, message)
+
+########################
+### Decoding helpers ###
+########################
+
+def decodeTLV(data, offset=0):
+        """Returns (tag, payload start, payload end) of the TLV starting at offset."""
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+                count = length & 0x7F
+                length = int.from_bytes(data[offset:offset + count], 'big')
+                offset += count
+        if offset + length > len(data):
+                raise SNMPError("Truncated SNMP message")
+        return tag, offset, offset + length
+
+def decodeOID(payload):
+        first = payload[0]
+        parts = [first // 40, first % 40] if first < 80 else [2, first - 80]
+        value = 0
+        for octet in payload[1:]:
+                value = (value << 7) | (octet & 0x7F)
+                if not octet & 0x80:
+                        parts.append(value)
+                        value = 0
+        return '.' + '.'.join(str(x) for x in parts)
+
+def decodeValue(tag, payload):
+        """Converts an encoded value to a python value: int, string OID/IP address, bytes, or None."""
+        if tag == INTEGER:
+                return int.from_bytes(payload, 'big', signed=True)
+        if tag in (COUNTER32, GAUGE32, TIMETICKS, COUNTER64):
+                return int.from_bytes(payload, 'big')
+        if tag == OBJECT_IDENTIFIER:
+                return decodeOID(payload)
+        if tag == IPADDRESS:
+                return '.'.join(str(x) for x in payload)
+        if tag in (OCTET_STRING, OPAQUE):
+                return bytes(payload)
+        return None
+
+def decodeMessage(data):
+        """
+        Decodes an SNMP v2c message.
+
+        Input:
+                data: bytes received from the socket
+
+        Output:
+                dictionary with 'version', 'community', 'pdu', 'requestID', 'errorStatus', 'errorIndex'
+                and 'varbinds', a list of (string OID, integer tag, python value) triples
+        """
+        data = memoryview(data)
+        tag, start, end = decodeTLV(data)
+        if tag != SEQUENCE:
+                raise SNMPError("Not an SNMP message")
+        tag, start, end = decodeTLV(data, start)
+        version = int.from_bytes(data[start:end], 'big')
+        tag, start, end = decodeTLV(data, end)
+        community = bytes(data[start:end]).decode('ascii', 'replace')
+        pdu, start, pduEnd = decodeTLV(data, end)
+        fields = []
+        for i in range(3):
+                tag, start, end = decodeTLV(data, start)
+                fields.append(int.from_bytes(data[start:end], 'big', signed=True))
+                start = end
+        tag, start, end = decodeTLV(data, start)
+        varbinds = []
+        while start < end:
+                tag, bindStart, bindEnd = decodeTLV(data, start)
+                tag, oidStart, oidEnd = decodeTLV(data, bindStart)
+                oid = decodeOID(data[oidStart:oidEnd])
+                tag, valueStart, valueEnd = decodeTLV(data, oidEnd)
+                varbinds.append((oid, tag, decodeValue(tag, data[valueStart:valueEnd])))
+                start = bindEnd
+        return {
+                'version': version,
+                'community': community,
+                'pdu': pdu,
+                'requestID': fields[0],
+                'errorStatus': fields[1],
+                'errorIndex': fields[2],
+                'varbinds': varbinds
+        }
+
+def typeName(tag):
+        """Returns the TYPES name of an SNMP tag."""
+        for name, value in TYPES.items():
+                if value == tag:
+                        return name
+        return None
@@ -1,49 +1,336 @@
-# Comm class behaves differently under simulation
-from .ResourceManagers import TelnetResourceManager, TelnetIOError
+from .SNMP import encodeMessage, decodeMessage, encodeValue, encodeTLV, GET, GETNEXT, SET, GETBULK, NULL, RESPONSE, ERRORS, EXCEPTIONS, END_OF_MIB_VIEW, SNMPError
+from .SCPI import pollUntil
+from .Cache import StateCache
+from .Tracing import trace
+from contextlib import contextmanager
+from collections import OrderedDict
 import logging, time
-import sys, os, subprocess
+import random, re, socket, threading
 
 logger = logging.getLogger(__name__)
 
 class SNMPComm(object):
 
-        def __init__(self, ip="192.168.10.1", port=23, community="private", type="int"):
+        # matches the SnmpSet.exe style commands the drivers build, e.g. ".1.3.6.1.4.1.9633.24.1.3.1.4.1.5.1 -val:974000000 -tp:int"
+        COMMAND = re.compile(r'^\s*(?P<oid>[.0-9]+)(?P<options>(?:\s+-\w+:.*)?)$')
+        # SnmpSet.exe options of a command: -val:value, -tp:type and -t:timeout, which is ignored
+        # as the requests are timed out and retried after timeout and retries instead
+        OPTION = re.compile(r'\s+-(val|tp|t):')
+        # most variable bindings sent in one PDU, longer lists are split over several requests
+        MAX_VARBINDS = 32
+        # PDU names used in traces
+        PDU_NAMES = {GET: "GET", GETNEXT: "GETNEXT", SET: "SET", GETBULK: "GETBULK"}
+
+        def __init__(self, ip="192.168.10.1", port=161, community="private", type="int", timeout=1.0, retries=3):
                 """Constructor.
 
                 ~~~ Valid ranges ~~~
                 ip: String IP address
-                port: integer port number
+                port: integer UDP port number
+                community: String SNMP v2c community
+                type: default value type for writes, see SNMP.TYPES
+                timeout: float seconds to wait for each response
+                retries: integer number of times a request is resent before giving up
 
                 """
                 self.ip = ip
                 self.port = port
                 self.community = community
                 self.type=type
+                self.timeout = timeout
+                self.retries = retries
+                # sets are confirmed by reading the value back, polling with backoff for at most settleTimeout seconds
+                self.verify = True
+                self.settleTimeout = 2.0
+                self.requestID = random.randint(1, 2**30)
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.connect((ip, port))
+                self.socket.settimeout(timeout)
+                self.pending = None     # sets queued by batch(), None when not batching
+                self.cache = None       # StateCache of OID values, see enableStateCache()
+                # requests share one socket, so threads (e.g. a telemetry poller) take turns
+                self.lock = threading.RLock()
                 logger.info("port is %r" % port)
                 logger.info("Connected to instrument at ip %s, port %d" % (ip, port))
-        
+                self.name = "%s:%d" % (ip, port)       # used in traces
+
+        def close(self):
+                self.socket.close()
+
+        def parse(self, command):
+                """Splits an 'OID -val:value -tp:type -t:timeout' command into (OID, value, type). Value is None for queries."""
+                match = self.COMMAND.match(command.rstrip())
+                if match is None:
+                        raise ValueError("Cannot parse SNMP command %r" % command)
+                parts = self.OPTION.split(match.group('options'))
+                if parts[0].strip():
+                        raise ValueError("Cannot parse SNMP command %r" % command)
+                options = dict(zip(parts[1::2], parts[2::2]))
+                oid = '.' + match.group('oid').strip('.')
+                value = options.get('val')
+                type = options.get('tp', '').strip() or self.type
+                if (value is not None) and (type != 'str'):
+                        value = value.strip()
+                        if type not in ('oid', 'ip'):
+                                value = int(value)
+                return oid, value, type
+
+        def toSets(self, commands):
+                """Normalizes a command, or a list of commands and (OID, value[, type]) tuples, to (OID, value, type) triples."""
+                if isinstance(commands, str):
+                        commands = [commands]
+                sets = []
+                for command in commands:
+                        if isinstance(command, str):
+                                sets.append(self.parse(command))
+                        elif len(command) == 2:
+                                sets.append(('.' + command[0].strip('.'), command[1], self.type))
+                        else:
+                                sets.append(('.' + command[0].strip('.'),) + tuple(command[1:]))
+                return sets
+
+        def chunks(self, items):
+                return [items[i:i + self.MAX_VARBINDS] for i in range(0, len(items), self.MAX_VARBINDS)]
+
+        def request(self, pdu, varbinds, errorStatus=0, errorIndex=0):
+                """
+                Sends one PDU on the comm's UDP socket and waits for the matching response.
+                Requests are resent up to retries times before raising TimeoutError.
+
+                Input:
+                        pdu: integer PDU tag from SNMP
+                        varbinds: list of (string OID, encoded value bytes) pairs
+
+                Output:
+                        list of (string OID, integer tag, python value) triples
+                """
+                with self.lock:
+                        return self.exchange(pdu, varbinds, errorStatus, errorIndex)
+
+        def exchange(self, pdu, varbinds, errorStatus, errorIndex):
+                self.requestID = (self.requestID % (2**31 - 1)) + 1
+                requestID = self.requestID
+                message = encodeMessage(self.community, pdu, requestID, varbinds, errorStatus, errorIndex)
+                # traced as e.g. 'GET .1.3.6.1.4.1.9633.24.1.3.1.4.1.5.1', or 'GET[12]' for several OIDs
+                header = self.PDU_NAMES.get(pdu, str(pdu)) + (" " + varbinds[0][0] if len(varbinds) == 1 else "[%d]" % len(varbinds))
+                start = time.perf_counter()
+                sent = received = 0
+                for attempt in range(self.retries + 1):
+                        self.socket.send(message)
+                        sent += len(message)
+                        deadline = time.perf_counter() + self.timeout
+                        while True:
+                                remaining = deadline - time.perf_counter()
+                                if remaining <= 0:
+                                        break
+                                self.socket.settimeout(remaining)
+                                try:
+                                        data = self.socket.recv(65535)
+                                except socket.timeout:
+                                        break
+                                received += len(data)
+                                try:
+                                        response = decodeMessage(data)
+                                except (SNMPError, IndexError, ValueError):
+                                        logger.debug("Discarded malformed SNMP datagram")
+                                        continue
+                                if (response['pdu'] == RESPONSE) and (response['requestID'] == requestID):
+                                        trace(self.name, header, start, sent=sent, received=received)
+                                        return self.check(response, varbinds, pdu)
+                                logger.debug("Discarded stale SNMP response %d" % response['requestID'])
+                        logger.debug("SNMP request %d timed out (attempt %d)" % (requestID, attempt + 1))
+                trace(self.name, header + " (timeout)", start, sent=sent, received=received)
+                raise TimeoutError("No SNMP response from %s:%d" % (self.ip, self.port))
+
+        def check(self, response, varbinds, pdu=GET):
+                if response['errorStatus']:
+                        index = response['errorIndex']
+                        oid = varbinds[index - 1][0] if 0 < index <= len(varbinds) else None
+                        error = ERRORS.get(response['errorStatus'], str(response['errorStatus']))
+                        raise SNMPError("SNMP %s for %s at %s" % (error, oid, self.ip))
+                for oid, tag, value in response['varbinds']:
+                        # a walk running off the end of the agent's MIB is not an error
+                        if (pdu == GETBULK) and (tag == END_OF_MIB_VIEW):
+                                continue
+                        if tag in EXCEPTIONS:
+                                raise SNMPError("SNMP %s for %s at %s" % (EXCEPTIONS[tag], oid, self.ip))
+                return response['varbinds']
+
+        def toString(self, value):
+                """Formats a response value the way SnmpGet.exe printed it."""
+                if isinstance(value, bytes):
+                        return value.decode('utf-8', 'replace')
+                return str(value)
+
         def write(self, commands):
-                shell_command = "C:\SnmpSet.exe -r:%s -v:2 -c:%s -o:%s -tp:int" % (self.ip, self.community, commands)
-                proc=subprocess.Popen(shell_command, stdout=subprocess.PIPE, shell=True)
-                (out, err)=proc.communicate()
-                logger.info("command sent is: %r" % shell_command)
-                logger.info("output is: %r" % out)
-                #newCommand='"C:\Snmpset.exe -r:%s -o:%s -tp:%s' %(self.ip, commands, self.type)
-                time.sleep (2)
-                #print ("newcommand = %r" % newCommand)
-                #logger.debug("command sent is: %r"% newCommand)
-                #command = os.system('"C:\Snmpset.exe -r:%s -o:%s -tp:%s' %(self.ip, commands, self.type))
-                #logger.info("Wrote %s" % repr(command))
-
-       
+                """
+                Sets one OID, or several OIDs with a single SetRequest.
+
+                Input:
+                        commands: string 'OID -val:value [-tp:type]', or a list of such strings
+                                  and/or (OID, value) and (OID, value, type) tuples
+
+                Output:
+                        None
+                """
+                sets = self.toSets(commands)
+                if self.cache is not None:
+                        sets = [(oid, value, type) for oid, value, type in sets if self.cache.setValue(oid, self.toString(value))]
+                        if not sets:
+                                logger.debug("Skipped sets, values unchanged")
+                                return
+                if self.pending is not None:
+                        self.pending.extend(sets)
+                        logger.debug("Queued %d sets" % len(sets))
+                        return
+                self.send(sets)
+
+        def send(self, sets):
+                """Sets a list of (OID, value, type) triples and confirms them if verify is set."""
+                try:
+                        for chunk in self.chunks(sets):
+                                self.request(SET, [(oid, encodeValue(value, type)) for oid, value, type in chunk])
+                except BaseException:
+                        self.discard(sets)
+                        raise
+                for oid, value, type in sets:
+                        logger.info("Wrote %s = %r (%s)" % (oid, value, type))
+                if self.verify:
+                        self.confirm(sets)
+
+        @contextmanager
+        def batch(self):
+                """Queues all writes made inside the with-block and sends them as one SetRequest
+                (confirmed by one GetRequest) when the block exits. Nested batches join the outermost one.
+                A query inside the block first sends the queued sets, so it reads their values.
+                If the block raises an exception, the sets still queued are discarded."""
+                if self.pending is not None:
+                        yield self
+                        return
+                self.pending = []
+                try:
+                        yield self
+                        self.flush()
+                except BaseException:
+                        self.discard(self.pending)
+                        raise
+                finally:
+                        self.pending = None
+
+        def discard(self, sets):
+                """Forgets the values the state cache recorded for sets that were not made,
+                e.g. the queue of a batch that raised, so they are not skipped when set again."""
+                if self.cache is not None:
+                        for oid, value, type in sets:
+                                self.cache.forget(oid)
+
+        def flush(self):
+                """Sends the sets queued by batch() as one SetRequest."""
+                if not self.pending:
+                        return
+                sets = self.pending[:]
+                del self.pending[:]
+                self.send(sets)
+
+        def confirm(self, sets):
+                """Reads the OIDs back until they hold the values just set, instead of sleeping a fixed time."""
+                oids = [oid for oid, value, type in sets]
+                expected = [self.toString(value) for oid, value, type in sets]
+                status = {'reading': 0.0}
+                def settled():
+                        start = time.perf_counter()
+                        status['values'] = self.get(oids)
+                        status['reading'] += time.perf_counter() - start
+                        return status['values'] == expected
+                start = time.perf_counter()
+                try:
+                        elapsed = pollUntil(settled, interval=0.01, backoff=2.0, maxInterval=0.25, timeout=self.settleTimeout)
+                except TimeoutError:
+                        for oid, actual, value in zip(oids, status.get('values', []), expected):
+                                if actual != value:
+                                        logger.warning("%s reads back %r after setting %r" % (oid, actual, value))
+                else:
+                        logger.debug("%d OIDs settled after %.3f sec" % (len(oids), elapsed))
+                finally:
+                        # the read backs are traced as GETs, this is the time spent sleeping between them
+                        waited = max(0.0, time.perf_counter() - start - status['reading'])
+                        trace(self.name, "(settle)", time.perf_counter() - waited, opc=waited)
+
+        def get(self, oids):
+                """Gets a list of OIDs with as few GetRequests as possible and returns their values as strings."""
+                values = []
+                for chunk in self.chunks(oids):
+                        varbinds = self.request(GET, [(oid, encodeTLV(NULL, b'')) for oid in chunk])
+                        values.extend(self.toString(value) for oid, tag, value in varbinds)
+                if self.cache is not None:
+                        for oid, value in zip(oids, values):
+                                self.cache.recordValue(oid, value)
+                return values
+
+        def enableStateCache(self):
+                """Starts skipping sets that would not change an OID's value (see Cache.StateCache)."""
+                if self.cache is None:
+                        self.cache = StateCache()
+                return self.cache
+
+        def invalidate(self, oid=None):
+                """Forgets the cached value of one OID, or of all OIDs."""
+                if self.cache is not None:
+                        if oid is None:
+                                self.cache.invalidate()
+                        else:
+                                self.cache.forget('.' + oid.strip('.'))
+
         def query(self, commands):
-                proc=subprocess.Popen("C:\SnmpGet.exe -r:%s -v:2 -o:%s" %(self.ip, commands), stdout=subprocess.PIPE, shell=True)
-                (out, err)=proc.communicate()
-                result={}
-                logger.info(out.decode('utf-8'))
-                for row in out.decode('utf-8').split("\n"):
-                        if '=' in row:
-                                key, value=row.split('=')
-                                result[key]= value
-                        # print (result)
-                return result["Value"].strip('\r')
+                """
+                Gets one OID, or several OIDs with a single GetRequest.
+
+                Input:
+                        commands: string OID, or a list of string OIDs
+
+                Output:
+                        string value, or a list of string values in the same order as the OIDs
+                """
+                self.flush()
+                if isinstance(commands, str):
+                        oid = self.parse(commands)[0]
+                        result = self.get([oid])[0]
+                        logger.info("Queried %s = %r" % (oid, result))
+                        return result
+                oids = [self.parse(command)[0] for command in commands]
+                results = self.get(oids)
+                logger.info("Queried %d OIDs" % len(oids))
+                logger.debug("query results = %r" % list(zip(oids, results)))
+                return results
+
+        def bulk(self, oids, maxRepetitions=10, nonRepeaters=0):
+                """
+                Sends one GetBulkRequest. The first nonRepeaters OIDs get their next OID only,
+                the rest get up to maxRepetitions successors each, e.g. the rows of a table column.
+
+                Input:
+                        oids: list of string OIDs
+                        maxRepetitions: integer number of successors per repeating OID
+                        nonRepeaters: integer number of leading OIDs that are not repeated
+
+                Output:
+                        list of (string OID, string value) pairs in the order the agent returned them
+                """
+                self.flush()
+                varbinds = self.request(GETBULK, [(oid, encodeTLV(NULL, b'')) for oid in oids], nonRepeaters, maxRepetitions)
+                return [(oid, self.toString(value)) for oid, tag, value in varbinds if tag != END_OF_MIB_VIEW]
+
+        def walk(self, oid, maxRepetitions=25):
+                """Returns an ordered dictionary of every OID below oid, fetched with GetBulkRequests."""
+                root = '.' + oid.strip('.')
+                results = OrderedDict()
+                current = root
+                while True:
+                        rows = self.bulk([current], maxRepetitions=maxRepetitions)
+                        if not rows:
+                                return results
+                        for rowOID, value in rows:
+                                if not rowOID.startswith(root + '.'):
+                                        return results
+                                results[rowOID] = value
+                        current = rows[-1][0]
@@ -1,35 +1,198 @@
 from .ResourceManagers import SSHResourceManager, SSHIOError
-import logging
+from ..Simulation.Parameters import isSimulation
+from .Tracing import trace
+from queue import Queue
+import logging, socket, time, uuid
 logger = logging.getLogger(__name__)
 
+class ShellChannel(object):
+        """
+        A /bin/sh kept running on one SSH channel. Commands are written to the shell's stdin and
+        each command's output is framed by a unique sentinel, so no new channel is opened per command.
+        Several commands can be sent before their results are received, in order.
+        """
+
+        # seconds a receive waits on stdout before checking stderr again
+        POLL = 0.01
+
+        def __init__(self, transport):
+                self.channel = transport.open_session()
+                self.channel.exec_command("/bin/sh")
+                self.channel.settimeout(self.POLL)
+                self.stdout = bytearray()
+                self.stderr = bytearray()
+                self.exitStatus = None
+
+        def isOpen(self):
+                return not self.channel.closed
+
+        def close(self):
+                self.channel.close()
+
+        def send(self, command):
+                """Sends a command and returns its sentinel, to be passed to receive()."""
+                sentinel = "__SCTA_%s__" % uuid.uuid4().hex
+                # the exit status is kept before the stderr frame's printf replaces $?, and stderr is framed
+                # first, so its sentinel has normally arrived when stdout's does
+                frame = "%s\n__scta_status=$?\nprintf '\\n%s\\n' >&2\nprintf '\\n%s %%d\\n' $__scta_status\n" % (command, sentinel, sentinel)
+                self.channel.sendall(frame.encode('utf-8'))
+                return sentinel
+
+        def receive(self, sentinel, timeout=None, stream="stdout"):
+                """
+                Reads until the command framed by sentinel has finished.
+
+                Input:
+                        sentinel: string returned by send()
+                        timeout: float seconds, or None to wait forever
+                        stream: 'stdout' or 'stderr', the output to return
+
+                Output:
+                        string output without its final newline. The exit status is left in self.exitStatus.
+                """
+                outMarker = ("\n%s " % sentinel).encode('utf-8')
+                errMarker = ("\n%s\n" % sentinel).encode('utf-8')
+                deadline = None if timeout is None else time.perf_counter() + timeout
+                while True:
+                        end = self.stdout.find(outMarker)
+                        if (end >= 0) and (self.stdout.find(b'\n', end + len(outMarker)) >= 0) and (errMarker in self.stderr):
+                                break
+                        if (deadline is not None) and (time.perf_counter() > deadline):
+                                raise SSHIOError("No answer from shell after %.3f sec" % timeout)
+                        if self.channel.closed:
+                                raise EOFError("Shell channel closed")
+                        while self.channel.recv_stderr_ready():
+                                self.stderr.extend(self.channel.recv_stderr(65536))
+                        try:
+                                data = self.channel.recv(65536)
+                        except socket.timeout:
+                                continue
+                        if not data and not self.channel.recv_stderr_ready():
+                                raise EOFError("Shell channel closed")
+                        self.stdout.extend(data)
+                # split this command's output off the buffers
+                statusEnd = self.stdout.find(b'\n', end + len(outMarker))
+                self.exitStatus = int(self.stdout[end + len(outMarker):statusEnd])
+                out = bytes(self.stdout[:end])
+                del self.stdout[:statusEnd + 1]
+                errEnd = self.stderr.find(errMarker)
+                err = bytes(self.stderr[:errEnd])
+                del self.stderr[:errEnd + len(errMarker)]
+                result = out if stream == "stdout" else err
+                result = result.decode('utf-8', 'replace')
+                if result.endswith('\n'):
+                        result = result[:-1]    # remove the newline character
+                return result
+
 class SSHComm(object):
 
-        def __init__(self, ip, username, password, rm=SSHResourceManager()):
+        def __init__(self, ip, username, password, rm=SSHResourceManager(), persistent=False, channels=1):
                 """Constructor.
 
                 ~~~ Valid ranges ~~~
-                protocol: GPIB, serial, IP
-                port: String of port of IP address
+                ip: String IP address
+                username, password: String login
+                persistent: False runs every command with exec_command on a new channel,
+                            True keeps shells open on persistent channels (see ShellChannel)
+                channels: integer number of persistent shells, so that several commands can be in flight
 
                 """
                 self.ip=ip
                 self.username=username
                 self.password=password
                 self.instrument=rm.open_resource(ip, username, password)
+                # exec_command mode retries queries that return nothing this many times
+                self.emptyRetries = 3
+                self.channels = channels
+                self.shells = None      # Queue of idle ShellChannels in persistent mode
                 logger.info("Connected to instrument at %s@%s" % (username,ip))
+                self.name = "%s@%s" % (username, ip)    # used in traces
+                if persistent:
+                        if isSimulation:
+                                logger.info("Simulated SSH has no channels, running commands with exec_command")
+                        else:
+                                self.openShells(channels)
                 #self.instrument.timeout=2000
-        
+
+        def openShells(self, channels=1):
+                """Opens the persistent shells used by write, query and queryAll."""
+                self.channels = channels
+                transport = self.instrument.get_transport()
+                self.shells = Queue()
+                for i in range(channels):
+                        self.shells.put(ShellChannel(transport))
+                logger.info("Opened %d persistent shells on %s@%s" % (channels, self.username, self.ip))
+
+        def close(self):
+                if self.shells is not None:
+                        while not self.shells.empty():
+                                self.shells.get().close()
+                        self.shells = None
+
+        def getShell(self):
+                """Takes an idle shell, replacing it if its channel has died."""
+                shell = self.shells.get()
+                if not shell.isOpen():
+                        logger.info("Persistent shell on %s@%s closed, opening a new one" % (self.username, self.ip))
+                        try:
+                                shell = ShellChannel(self.instrument.get_transport())
+                        except Exception:
+                                self.shells.put(shell)
+                                raise
+                return shell
+
+        def run(self, commands, timeout=None, stream="stdout"):
+                """Sends every command before reading any result, spreading them over all shells."""
+                shells = [self.getShell() for i in range(self.channels)]
+                try:
+                        sent = []
+                        for i, command in enumerate(commands):
+                                shell = shells[i % len(shells)]
+                                sent.append((shell, shell.send(command)))
+                        return [shell.receive(sentinel, timeout, stream) for shell, sentinel in sent]
+                except (EOFError, SSHIOError):
+                        # a shell left with unread output cannot be framed again
+                        for shell in shells:
+                                shell.close()
+                        raise
+                finally:
+                        for shell in shells:
+                                self.shells.put(shell)
+
+        def header(self, command):
+                """Returns the header a command is traced under, the command's first word."""
+                return command.split(None, 1)[0] if command.strip() else ""
+
         def write(self, command, timeout=None):
-                self.instrument.exec_command(command, timeout=timeout)
+                start = time.perf_counter()
+                if self.shells is not None:
+                        self.run([command], timeout)
+                else:
+                        self.instrument.exec_command(command, timeout=timeout)
+                trace(self.name, self.header(command), start, sent=len(command) + 1)
                 logger.info("Wrote %s" % repr(command))
 
         def query(self, command, timeout=None, stream="stdout"):
+                start = time.perf_counter()
+                if self.shells is not None:
+                        shell = self.getShell()
+                        try:
+                                result = shell.receive(shell.send(command), timeout, stream)
+                        except (EOFError, SSHIOError):
+                                shell.close()
+                                raise
+                        finally:
+                                self.shells.put(shell)
+                        trace(self.name, self.header(command), start, sent=len(command) + 1, received=len(result) + 1)
+                        logger.info("Queried %s" % repr(command))
+                        logger.info("query result = %r" % result)
+                        return result
                 result = ""
-                while not result:
+                for attempt in range(self.emptyRetries):
                         stdin, stdout, stderr = self.instrument.exec_command(command, timeout=timeout)
                         stdout.channel.recv_exit_status()
                         logger.info("Queried %s" % repr(command))
-                        
+
                         if stream == "stdout":
                                 outstream = stdout
                         else:
@@ -39,5 +202,30 @@ class SSHComm(object):
                         result = result[:-1]    # remove the newline character
                         #result= result.replace("\n","")
                         logger.info("query result = %r" % result)
-                
-                return result
\ No newline at end of file
+                        if result:
+                                break
+
+                trace(self.name, self.header(command), start, sent=len(command) + 1, received=len(result) + 1)
+                return result
+
+        def queryAll(self, commands, timeout=None, stream="stdout"):
+                """
+                Runs several commands with all of them in flight at once, over the persistent shells.
+
+                Input:
+                        commands: list of string shell commands
+                        timeout: float seconds per result, or None
+
+                Output:
+                        list of string results, in the order of commands
+                """
+                if self.shells is None:
+                        return [self.query(command, timeout, stream) for command in commands]
+                start = time.perf_counter()
+                results = self.run(commands, timeout, stream)
+                # the commands overlap, so they are traced together
+                trace(self.name, "(queryAll)", start, sent=sum(len(command) + 1 for command in commands),
+                        received=sum(len(result) + 1 for result in results))
+                logger.info("Queried %d commands" % len(commands))
+                logger.debug("query results = %r" % results)
+                return results
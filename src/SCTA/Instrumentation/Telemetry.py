@@ -0,0 +1,116 @@
+"""Background polling of instrument status into a DataLogger and/or a ring buffer of NumPy arrays."""
+import logging, threading, time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class Telemetry(object):
+
+        def __init__(self, poll, names, rate=1.0, dataLogger=None, size=86400):
+                """
+                Creates a collector that calls poll() at a fixed rate on a background thread. Call start() to begin.
+
+                Input:
+                        poll: function taking no arguments and returning a dictionary of name -> number, e.g. VTR.getStatus
+                        names: list of string names to record from each poll
+                        rate: float polls per second
+                        dataLogger: DataLogger to push every sample to, or None
+                        size: integer number of samples kept in the ring buffer (86400 is one day at 1 Hz)
+
+                Output:
+                        Telemetry object
+                """
+                self.poll = poll
+                self.names = list(names)
+                self.interval = 1.0 / rate
+                self.dataLogger = dataLogger
+                self.size = size
+                self.times = np.zeros(size)
+                self.samples = np.zeros((size, len(self.names)))
+                self.count = 0          # samples recorded since start, the newest is at (count - 1) % size
+                self.missed = 0         # poll slots skipped because a poll took longer than the interval
+                self.errors = 0         # polls that raised an exception
+                self.lock = threading.Lock()
+                self.stopped = threading.Event()
+                self.thread = None
+
+        def start(self):
+                self.stopped.clear()
+                self.thread = threading.Thread(target=self.run, name="Telemetry")
+                self.thread.daemon = True
+                self.thread.start()
+                logger.info("Started telemetry of %r at %.3f Hz" % (self.names, 1.0 / self.interval))
+                return self
+
+        def stop(self):
+                self.stopped.set()
+                if self.thread is not None:
+                        self.thread.join()
+                        self.thread = None
+                logger.info("Stopped telemetry after %d samples (%d missed, %d errors)" % (self.count, self.missed, self.errors))
+
+        def isRunning(self):
+                return (self.thread is not None) and self.thread.is_alive()
+
+        def run(self):
+                # polls are scheduled on a fixed grid so that slow polls do not make the rate drift
+                start = time.perf_counter()
+                slot = 0
+                while not self.stopped.is_set():
+                        timestamp = time.time()
+                        try:
+                                status = self.poll()
+                        except Exception as e:
+                                self.errors += 1
+                                logger.warning("Telemetry poll failed: %r" % e)
+                        else:
+                                self.record(timestamp, status)
+                        slot += 1
+                        now = time.perf_counter() - start
+                        behind = int(now / self.interval) - slot
+                        if behind > 0:
+                                self.missed += behind
+                                slot += behind
+                        self.stopped.wait(max(0, slot * self.interval - now))
+
+        def record(self, timestamp, status):
+                row = [float(status[name]) for name in self.names]
+                with self.lock:
+                        index = self.count % self.size
+                        self.times[index] = timestamp
+                        self.samples[index] = row
+                        self.count += 1
+                if self.dataLogger is not None:
+                        if self.dataLogger.getFileFormat().lower() == 'json':
+                                self.dataLogger.push(dict((name, status[name]) for name in self.names))
+                        else:
+                                self.dataLogger.push(row)
+
+        def getData(self):
+                """
+                Returns the samples in the ring buffer, oldest first.
+
+                Input:
+                        None
+
+                Output:
+                        dictionary with 'time' (float seconds since the epoch) and one entry per name,
+                        each a NumPy array of the same length. Booleans are recorded as 1.0 and 0.0.
+                """
+                with self.lock:
+                        count = min(self.count, self.size)
+                        order = (np.arange(count) + self.count - count) % self.size
+                        data = {'time': self.times[order]}
+                        for column, name in enumerate(self.names):
+                                data[name] = self.samples[order, column]
+                return data
+
+        def getLastSample(self):
+                """Returns the newest sample as a dictionary, or None before the first poll."""
+                with self.lock:
+                        if self.count == 0:
+                                return None
+                        index = (self.count - 1) % self.size
+                        sample = dict(zip(self.names, self.samples[index]))
+                        sample['time'] = self.times[index]
+                return sample
@@ -1,31 +1,82 @@
 # Comm class behaves differently under simulation
 from .ResourceManagers import TelnetResourceManager, TelnetIOError
-import logging
+from .Cache import StateCache, QueryCache, parseCommand
+from .SCPI import joinCommands, pollUntil, checkEventStatus, blockHeader, readBlock, ESR_OPC
+from .Tracing import trace
+from contextlib import contextmanager
+from collections import deque
+import numpy as np
+import logging, threading, time
 logger = logging.getLogger(__name__)
 
 class TelnetComm(object):
 
-        def __init__(self, ip, port=23, commands='SCPI', rm=TelnetResourceManager()):
+        # Longest program message sent when flushing a batch of writes
+        BATCH_MAX_LENGTH = 1024
+        # Number of per-command completion times kept in completionTimes
+        COMPLETION_HISTORY = 1000
+
+        def __init__(self, ip, port=23, commands='SCPI', rm=TelnetResourceManager(), completion="opc"):
                 """Constructor.
 
                 ~~~ Valid ranges ~~~
                 ip: String IP address
                 port: integer port number
+                completion: 'opc' polls *OPC? (the default, see pollOperationComplete),
+                            'status' polls the Event Status Register with backoff,
+                            for drivers whose instrument has been checked to report the OPC event as documented
 
                 """
                 self.ip = ip
                 self.port = port
                 self.commands = commands
+                self.completion = completion
+                # a raw socket has no service request line, so the event status register is polled with backoff
+                self.pollInterval = 0.001
+                self.pollBackoff = 2.0
+                self.pollMaxInterval = 0.1
+                self.completionTimeout = None   # seconds, None waits forever
+                self.completionTimes = deque(maxlen=self.COMPLETION_HISTORY)   # (command, seconds) pairs
+                self.statusCleared = False
                 self.connection = rm.open_resource(ip, port)
+                # held across each exchange, shared with other comms when the resource manager shares the session
+                self.lock = getattr(self.connection, 'lock', None) or threading.RLock()
                 logger.info("Connected to instrument at ip %s, port %d" % (ip, port))
+                self.name = "%s:%d" % (ip, port)       # used in traces
+                self.pending = None     # writes queued by batch(), None when not batching
+                self.cache = None       # StateCache of the instrument's settings, see enableStateCache()
+                self.queryCache = None  # QueryCache of slow-changing answers, see enableQueryCache()
         
         def write(self, command):
-                command = (command + '\n').encode('ascii')
-                self.connection.write(command)
-                logger.info("Wrote %s" % repr(command))
+                if self.queryCache is not None:
+                        self.queryCache.write(command)
+                if (self.cache is not None) and not self.cache.write(command):
+                        logger.debug("Skipped %s, setting unchanged" % repr(command))
+                        return
+                if (self.pending is not None) and (self.commands == "SCPI"):
+                        self.pending.append(command)
+                        logger.debug("Queued %s" % repr(command))
+                        return
+                message = (command + '\n').encode('ascii')
+                with self.lock:
+                        start = time.perf_counter()
+                        try:
+                                self.connection.write(message)
+                                logger.info("Wrote %s" % repr(message))
+                                opc = 0.0
+                                if self.commands == "SCPI":
+                                        opc = self.scpiCompleteOperation(command)
+                                        logger.debug("Write operation complete")
+                        except BaseException:
+                                self.discard([command])
+                                raise
+                trace(self.name, self.header(command), start, opc, sent=len(message))
+
+        def header(self, command):
+                """Returns the header a command is traced under: the SCPI short form, or the first word of other commands."""
                 if self.commands == "SCPI":
-                        self.scpiCompleteOperation()
-                        logger.debug("Write operation complete")
+                        return parseCommand(command)[0]
+                return command.split(None, 1)[0] if command.strip() else ""
 
         def read(self):
                 output = self.connection.read_until(b'\n', timeout=1).decode('ascii')
@@ -33,18 +84,266 @@ class TelnetComm(object):
                 return output
 
         def query(self, command):
-                command = (command + '\n').encode('ascii')
-                self.connection.write(command)
-                result = self.read()
-                logger.info("Queried %s" % repr(command))
+                if self.queryCache is not None:
+                        result = self.queryCache.get(command)
+                        if result is not None:
+                                return result
+                self.flush()
+                message = (command + '\n').encode('ascii')
+                with self.lock:
+                        start = time.perf_counter()
+                        self.connection.write(message)
+                        result = self.read()
+                trace(self.name, self.header(command) + '?', start, sent=len(message), received=len(result) + 1)
+                logger.info("Queried %s" % repr(message))
                 logger.debug("query result = %s" % result)
+                if self.cache is not None:
+                        self.cache.read(command, result)
+                if self.queryCache is not None:
+                        self.queryCache.put(command, result)
                 return result
 
-        def scpiCompleteOperation(self):
+        def readBack(self, queries):
+                """
+                Reads many settings with as few round trips as possible, concatenating the queries into messages
+                of up to BATCH_MAX_LENGTH characters, and primes the state and query caches with the answers,
+                e.g. to attach to an instrument that is already set up without writing its settings again.
+
+                Input:
+                        queries: list of string SCPI queries without arguments, e.g. ['FREQ?', 'POW?']
+
+                Output:
+                        list of string answers, in the order of queries
+                """
+                answers = []
+                for message in joinCommands(queries, self.BATCH_MAX_LENGTH):
+                        answers.extend(self.query(message).split(';'))
+                if len(answers) != len(queries):
+                        raise ValueError("Got %d answers to %d queries" % (len(answers), len(queries)))
+                for query, answer in zip(queries, answers):
+                        if self.cache is not None:
+                                self.cache.read(query, answer)
+                        if self.queryCache is not None:
+                                self.queryCache.put(query, answer)
+                logger.debug("Read back %d settings" % len(queries))
+                return answers
+
+        def telnet(self):
+                """Returns the telnetlib.Telnet object of the connection, unwrapped from its pool (see ResourceManagers)."""
+                return self.connection.unwrap() if hasattr(self.connection, 'unwrap') else self.connection
+
+        def drain(self):
+                """Discards what telnetlib has buffered of earlier answers, e.g. one that arrived late, so a binary
+                block read past telnetlib is not taken from the middle of them."""
+                telnet = self.telnet()
+                stale = len(telnet.cookedq) + len(telnet.rawq) - telnet.irawq
+                if stale:
+                        logger.warning("Discarded %d bytes of earlier answers from %s" % (stale, self.name))
+                        telnet.cookedq = b''
+                        telnet.rawq = b''
+                        telnet.irawq = 0
+
+        def readInto(self, view):
+                """Fills a memoryview with the next bytes from the socket. Binary data is read past telnetlib,
+                which would treat 0xFF bytes as telnet commands and drop NUL bytes, so whatever telnetlib
+                has buffered must be drained before the block is asked for (see drain)."""
+                sock = self.telnet().get_socket()
+                received = 0
+                while received < len(view):
+                        count = sock.recv_into(view[received:])
+                        if count == 0:
+                                raise EOFError("Connection to %s closed" % self.name)
+                        received += count
+
+        def queryBinary(self, command, dtype='<f4', buffer=None):
+                """
+                Sends a query answered with an IEEE 488.2 binary block, e.g. 'TRAC:DATA? TRACE1' after 'FORM REAL,32',
+                and receives the block's data straight into a buffer without converting it to text.
+
+                Input:
+                        command: string SCPI query
+                        dtype: NumPy data type of the block's values, e.g. '<f4' for REAL,32 or 'u1' for a file
+                        buffer: bytearray, memoryview or NumPy array to read into, reused between calls to avoid
+                                allocating, or None to allocate one the size of the block
+
+                Output:
+                        NumPy array viewing the data in the buffer (it changes when the buffer is read into again)
+                """
+                self.flush()
+                message = (command + '\n').encode('ascii')
+                with self.lock:
+                        self.drain()
+                        start = time.perf_counter()
+                        self.connection.write(message)
+                        buffer, length = readBlock(self.readInto, buffer)
+                trace(self.name, self.header(command) + '?', start, sent=len(message), received=length)
+                logger.info("Queried %s" % repr(message))
+                logger.debug("query result = %d byte block" % length)
+                dtype = np.dtype(dtype)
+                return np.frombuffer(buffer, dtype=dtype, count=length // dtype.itemsize)
+
+        def writeBinary(self, command, data):
+                """
+                Sends a command with an IEEE 488.2 binary block as its last argument, e.g. writeBinary("MMEM:DATA 'cal.dat',", data)
+
+                Input:
+                        command: string SCPI command up to the block
+                        data: bytes, bytearray, memoryview or C-contiguous NumPy array
+                """
+                self.flush()
+                payload = memoryview(data).cast('B')
+                with self.lock:
+                        sock = self.connection.get_socket()
+                        start = time.perf_counter()
+                        head = command.encode('ascii') + b' ' + blockHeader(len(payload))
+                        sock.sendall(head)
+                        sock.sendall(payload)
+                        sock.sendall(b'\n')
+                        logger.info("Wrote %s with a %d byte block" % (repr(command), len(payload)))
+                        opc = 0.0
+                        if self.commands == "SCPI":
+                                opc = self.scpiCompleteOperation(command)
+                trace(self.name, self.header(command), start, opc, sent=len(head) + len(payload) + 1)
+
+        def enableStateCache(self):
+                """Starts skipping writes that would not change the instrument's settings (see Cache.StateCache)."""
+                if self.cache is None:
+                        self.cache = StateCache()
+                return self.cache
+
+        def enableQueryCache(self, queries={}):
+                """Starts answering the given queries from a cache (see Cache.QueryCache).
+
+                Input:
+                        queries: dictionary of string query -> float TTL seconds (None until a write invalidates it),
+                                 e.g. {'*IDN?': None, 'SENS:DDEM:SRAT?': 60}. More can be added with queryCache.add().
+                """
+                if self.queryCache is None:
+                        self.queryCache = QueryCache()
+                for query, ttl in queries.items():
+                        self.queryCache.add(query, ttl)
+                return self.queryCache
+
+        def cachedValue(self, command):
+                """Returns the value the state cache holds for a command's setting, e.g. 'MOD:CHAN1:SOUR',
+                or None if it is unknown or the cache is off. Drivers ask this rather than the cache itself
+                so that sessions recorded with a primed cache replay the same way (see Recorder)."""
+                if self.cache is None:
+                        return None
+                return self.cache.get(command)
+
+        def invalidate(self, command=None):
+                """Forgets the cached value of one command's setting, or of all settings.
+                Call this after the instrument was changed without this comm, e.g. from the front panel."""
+                if self.cache is not None:
+                        self.cache.invalidate(command)
+                if self.queryCache is not None:
+                        self.queryCache.invalidate(command)
+
+        def discard(self, commands):
+                """Forgets the settings the state cache recorded for writes that did not reach the instrument,
+                e.g. the queue of a batch that raised, so they are not skipped when written again."""
+                if self.cache is None:
+                        return
+                for command in commands:
+                        for part in command.split(';'):
+                                if part.strip():
+                                        self.cache.invalidate(part)
+
+        @contextmanager
+        def batch(self):
+                """Queues all writes made inside the with-block and sends them as concatenated
+                SCPI messages when the block exits, waiting for operation complete only once.
+                A query inside the block first flushes the queued writes, so ordering is kept.
+                Nested batches join the outermost one. Only applies to SCPI instruments.
+                If the block raises an exception, the writes still queued are discarded.
+                """
+                if self.pending is not None:
+                        yield self
+                        return
+                self.pending = []
+                try:
+                        yield self
+                        self.flush()
+                except BaseException:
+                        self.discard(self.pending)
+                        raise
+                finally:
+                        self.pending = None
+
+        def flush(self):
+                """Sends the writes queued by batch() and waits once for all of them to complete."""
+                if not self.pending:
+                        return
+                commands = self.pending[:]
+                del self.pending[:]
+                start = time.perf_counter()
+                sent = 0
+                with self.lock:
+                        try:
+                                for message in joinCommands(commands, self.BATCH_MAX_LENGTH):
+                                        self.connection.write((message + '\n').encode('ascii'))
+                                        sent += len(message) + 1
+                                        logger.info("Wrote %s" % repr(message))
+                                opc = self.scpiCompleteOperation("batch of %d writes" % len(commands))
+                        except BaseException:
+                                self.discard(commands)
+                                raise
+                trace(self.name, "(batch)", start, opc, sent=sent)
+                logger.debug("Batch of %d writes complete" % len(commands))
+
+        def scpiCompleteOperation(self, command=None):
                 """For SCPI commands only! Some commands will take the instrument a long time to run.
-                Instead of setting an arbitrarily long timeout, poll the operation complete status until it returns true.
+                Instead of setting an arbitrarily long timeout, wait for the operation complete event.
+                The time spent waiting is appended to completionTimes along with the command, and returned."""
+                start = time.perf_counter()
+                if self.completion == "opc":
+                        self.pollOperationComplete()
+                else:
+                        self.waitOperationComplete(command)
+                elapsed = time.perf_counter() - start
+                self.completionTimes.append((command, elapsed))
+                logger.debug("Operation complete after %.3f sec" % elapsed)
+                return elapsed
+
+        def waitOperationComplete(self, command=None):
+                """Sends *OPC and polls *ESR? until the Operation Complete bit is set.
+                Every *ESR? answers immediately, and polls back off from pollInterval to pollMaxInterval
+                so long operations don't flood the connection."""
+                if not self.statusCleared:
+                        self.queryEventStatus()     # clear any stale events
+                        self.statusCleared = True
+                self.connection.write(b'*OPC\n')
+                status = {}
+                def opc():
+                        status["esr"] = self.queryEventStatus()
+                        return status["esr"] & ESR_OPC
+                pollUntil(opc, interval=self.pollInterval, backoff=self.pollBackoff,
+                        maxInterval=self.pollMaxInterval, timeout=self.completionTimeout)
+                checkEventStatus(status["esr"], command)
+
+        def queryEventStatus(self):
+                """Reads (and thereby clears) the Event Status Register. A late answer is waited for rather
+                than left behind to be read as the answer to the next query, up to completionTimeout."""
+                self.connection.write(b'*ESR?\n')
+                start = time.perf_counter()
+                while True:
+                        try:
+                                esr = self.read()
+                        except TelnetIOError as error:
+                                esr = ''
+                        if esr:
+                                return int(esr)
+                        elapsed = time.perf_counter() - start
+                        if (self.completionTimeout is not None) and (elapsed > self.completionTimeout):
+                                raise TimeoutError("No answer to *ESR? after %.3f sec" % elapsed)
+                        logger.debug("Telnet ESR query timed out. Continue to wait")
+
+        def pollOperationComplete(self):
+                """Polls the operation complete status until it returns true.
                 Similar to the ESR query poll suggested in R&S SFU documentation except at a much higher level.
-                Resorted to this instead because ESR poll did not work as documented..."""
+                Resorted to this instead because ESR poll did not work as documented on our instruments,
+                which is why it is the default completion and 'status' has to be asked for."""
                 command = '*OPC?'
                 command = (command + '\n').encode('ascii')
                 self.connection.write(command)
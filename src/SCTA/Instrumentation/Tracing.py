@@ -0,0 +1,199 @@
+"""Per-command latency histograms of the comm layer, exportable as JSON or CSV."""
+from contextlib import contextmanager
+import csv, json, logging, threading, time
+logger = logging.getLogger(__name__)
+
+class Histogram(object):
+
+        # upper bucket edges in seconds, doubling from 10 us to about 22 minutes; the last bucket is open
+        EDGES = [1e-5 * 2 ** i for i in range(28)]
+
+        def __init__(self):
+                self.buckets = [0] * (len(self.EDGES) + 1)
+                self.count = 0
+                self.total = 0.0
+                self.min = None
+                self.max = None
+
+        def add(self, seconds):
+                index = 0
+                while (index < len(self.EDGES)) and (seconds > self.EDGES[index]):
+                        index += 1
+                self.buckets[index] += 1
+                self.count += 1
+                self.total += seconds
+                self.min = seconds if self.min is None else min(self.min, seconds)
+                self.max = seconds if self.max is None else max(self.max, seconds)
+
+        def merge(self, other):
+                for index, count in enumerate(other.buckets):
+                        self.buckets[index] += count
+                self.count += other.count
+                self.total += other.total
+                for value in (other.min, other.max):
+                        if value is not None:
+                                self.min = value if self.min is None else min(self.min, value)
+                                self.max = value if self.max is None else max(self.max, value)
+
+        def mean(self):
+                return self.total / self.count if self.count else 0.0
+
+        def percentile(self, percent):
+                """Returns the upper edge of the bucket holding the given percentile, capped at the maximum."""
+                if not self.count:
+                        return 0.0
+                target = percent / 100.0 * self.count
+                seen = 0
+                for index, count in enumerate(self.buckets):
+                        seen += count
+                        if (seen >= target) and count:
+                                edge = self.EDGES[index] if index < len(self.EDGES) else self.max
+                                return min(edge, self.max)
+                return self.max
+
+        def toDict(self):
+                return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                        'edges': self.EDGES, 'buckets': self.buckets}
+
+class CommandStats(object):
+        """Everything traced for one command header on one instrument."""
+
+        def __init__(self):
+                self.wall = Histogram()         # seconds from sending the command to its answer or completion
+                self.opc = Histogram()          # seconds of that spent waiting for operation complete
+                self.sent = 0                   # bytes
+                self.received = 0               # bytes
+
+        def add(self, seconds, opc, sent, received):
+                self.wall.add(seconds)
+                self.opc.add(opc)
+                self.sent += sent
+                self.received += received
+
+        def merge(self, other):
+                self.wall.merge(other.wall)
+                self.opc.merge(other.opc)
+                self.sent += other.sent
+                self.received += other.received
+
+        def row(self):
+                return {'calls': self.wall.count, 'total': self.wall.total, 'mean': self.wall.mean(),
+                        'p50': self.wall.percentile(50), 'p90': self.wall.percentile(90), 'p99': self.wall.percentile(99),
+                        'max': self.wall.max or 0.0, 'opc': self.opc.total, 'sent': self.sent, 'received': self.received}
+
+class Tracer(object):
+
+        COLUMNS = ['instrument', 'header', 'calls', 'total', 'mean', 'p50', 'p90', 'p99', 'max', 'opc', 'sent', 'received']
+
+        def __init__(self):
+                """
+                Collects the latency of every command the comms send while it is active (see startTracing).
+
+                Output:
+                        Tracer object
+                """
+                self.lock = threading.Lock()
+                self.stats = {}         # (instrument, header) -> CommandStats
+                self.start = time.perf_counter()
+                self.elapsed = None     # seconds the tracer ran, set by stopTracing()
+
+        def record(self, instrument, header, seconds, opc=0.0, sent=0, received=0):
+                """
+                Adds one command to the histograms.
+
+                Input:
+                        instrument: string name of the comm, e.g. 'TCPIP0::192.168.10.2::INSTR'
+                        header: string command header, e.g. 'SENS:ADJ:LEV' or 'GET .1.3.6.1.4.1.9633.24.1.3.1.4.1.5.1'
+                        seconds: float wall time of the command
+                        opc: float seconds of that spent waiting for operation complete
+                        sent, received: integer byte counts
+                """
+                with self.lock:
+                        key = (instrument, header)
+                        if key not in self.stats:
+                                self.stats[key] = CommandStats()
+                        self.stats[key].add(seconds, opc, sent, received)
+
+        def byInstrument(self):
+                """Returns a dictionary of instrument -> CommandStats of all its commands together."""
+                with self.lock:
+                        totals = {}
+                        for (instrument, header), stats in self.stats.items():
+                                totals.setdefault(instrument, CommandStats()).merge(stats)
+                return totals
+
+        def summary(self):
+                """Returns a list of dictionaries with the COLUMNS of every instrument and header, slowest total first.
+                Rows with header '*' add up all the commands of their instrument."""
+                with self.lock:
+                        rows = [dict(stats.row(), instrument=instrument, header=header) for (instrument, header), stats in self.stats.items()]
+                rows += [dict(stats.row(), instrument=instrument, header='*') for instrument, stats in self.byInstrument().items()]
+                return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+        def export(self, path, format=None):
+                """
+                Writes the trace to a file.
+
+                Input:
+                        path: string file name
+                        format: 'json' (summary rows plus full histograms) or 'csv' (summary rows),
+                                None picks it from the file extension
+                """
+                format = (format or path.rsplit('.', 1)[-1]).lower()
+                if format == 'csv':
+                        with open(path, 'w', newline='') as file:
+                                writer = csv.DictWriter(file, fieldnames=self.COLUMNS)
+                                writer.writeheader()
+                                writer.writerows(self.summary())
+                elif format == 'json':
+                        with self.lock:
+                                histograms = [{'instrument': instrument, 'header': header, 'wall': stats.wall.toDict(), 'opc': stats.opc.toDict()}
+                                        for (instrument, header), stats in self.stats.items()]
+                        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.start
+                        with open(path, 'w') as file:
+                                json.dump({'elapsed': elapsed, 'summary': self.summary(), 'histograms': histograms}, file, indent=1)
+                else:
+                        raise ValueError("Unknown trace format %r, expected 'json' or 'csv'" % format)
+                logger.info("Exported trace of %d commands to %s" % (len(self.stats), path))
+
+# the tracer the comms report to, None when tracing is off
+_tracer = None
+
+def startTracing():
+        """Starts tracing every comm and returns the new Tracer."""
+        global _tracer
+        _tracer = Tracer()
+        return _tracer
+
+def stopTracing():
+        """Stops tracing and returns the Tracer, or None if tracing was off."""
+        global _tracer
+        tracer, _tracer = _tracer, None
+        if tracer is not None:
+                tracer.elapsed = time.perf_counter() - tracer.start
+        return tracer
+
+def getTracer():
+        return _tracer
+
+def trace(instrument, header, start, opc=0.0, sent=0, received=0):
+        """Records a command that began at time.perf_counter() start, if tracing is on."""
+        tracer = _tracer
+        if tracer is not None:
+                tracer.record(instrument, header, time.perf_counter() - start, opc, sent, received)
+
+@contextmanager
+def tracing(path=None):
+        """
+        Traces the comms inside the with-block and exports the result to path (JSON or CSV) at the end, e.g.
+
+                with tracing('calibration-trace.json') as tracer:
+                        calibrateDDSS(...)
+        """
+        tracer = startTracing()
+        try:
+                yield tracer
+        finally:
+                stopTracing()
+                if path is not None:
+                        tracer.export(path)
@@ -3,6 +3,7 @@ from . import Comm
 import logging
 import time
 from .SNMPComm import SNMPComm
+from .Telemetry import Telemetry
 
 # Setup debug logging
 logger = logging.getLogger(__name__)
@@ -52,34 +53,33 @@ class VTR(Demodulator):
 		reverse_dataSource[value]=key
 
 
-	def __init__(self, id="FSW", type="GPIB", port="30", window="VSA"):
+	def __init__(self, id="VTR", ip="192.168.10.1", port=161, type="int", community="private"):
 		"""
-		Creates an FSW object, which starts a connection for reading and writing commands to the FSW.
-		With no inputs specified, it assumes the host computer's interface is GPIB at port 30.
+		Creates a VTR object, which opens an SNMP connection for reading and writing settings of the VTR.
 
 		Input:
 			id: string
-			type: string interface type
-			port: string interface address/ port
+			ip: string IP address
+			port: integer UDP port
+			type: string default SNMP value type
+			community: string SNMP community
 
 		Output:
-			SFU object
-
-		~~~ Valid ranges ~~~
-		type:        ['GPIB', 'IP']
-		port:        ['28' or '192.10.10.10']
+			VTR object
 		"""
-		self.comm = Comm(protocol=type, port=port)
-		super().__init__(id=id)
-		self.configureFor(window)
+		self.comm = SNMPComm(ip=ip, type=type, port=port, community=community)
+		self.type = type
+		self.telemetry = None
+		# the Transponder constructor would write default settings without a demodulator number
+		#super().__init__(id=id)
+		self.id = id
 
 	def __del__(self):
 		self.close()
 
 	def close(self):
 		"""
-		Closes the connection with the FSW
-		NOTE: YOU MUST CALL THIS AFTER YOU ARE FINISHED WITH THE FSW
+		Closes the connection with the VTR
 
 		Input:
 			None
@@ -87,7 +87,8 @@ class VTR(Demodulator):
 		Output:
 			None
 		"""
-		self.comm.instrument.close()
+		self.stopTelemetry()
+		self.comm.close()
 	
 
 	def setSymbolRate(self, rate):
@@ -299,19 +300,21 @@ class VTR(Demodulator):
 
 	def getSNR(self, modNumber):
 		OID=".1.3.6.1.4.1.9633.28.1.3.2.7.1.2." 
-		code=OID+modNumber+str(value)
+		code=OID+str(modNumber)
 		snr=float(self.comm.query(code))
-		logger.info("Got input SNR: %.2%f" % snr)
+		logger.info("Got input SNR: %.2f" % snr)
+		return snr
 
 	def getPower(self, modNumber):
 		OID=".1.3.6.1.4.1.9633.28.1.3.2.7.1.4." 
-		code=OID+modNumber+str(value)
+		code=OID+str(modNumber)
 		power=float(self.comm.query(code))
-		logger.info("Got input power: %.2%f" % power)
+		logger.info("Got input power: %.2f" % power)
+		return power
 
 	def getDemodLock(self, modNumber):
 		OID=".1.3.6.1.4.1.9633.28.1.3.2.7.1.5." 
-		code=OID+modNumber+str(value)
+		code=OID+str(modNumber)
 		demod=int(self.comm.query(code))
 		if demod==1:
 			demod=True
@@ -323,7 +326,7 @@ class VTR(Demodulator):
 
 	def getTotalPackets(self, modNumber):
 		OID=".1.3.6.1.4.1.9633.28.1.3.2.7.1.7." 
-		code=OID+modNumber
+		code=OID+str(modNumber)
 		packets=int(self.comm.query(code))
 		logger.info("Got Packet count: %r" % packets)
 		return packets
@@ -331,14 +334,14 @@ class VTR(Demodulator):
 
 	def CRCCount(self, modNumber):
 		OID=".1.3.6.1.4.1.9633.28.1.3.2.7.1.8." 
-		code=OID+modNumber
+		code=OID+str(modNumber)
 		crc=int(self.comm.query(code))
 		logger.info("Got CRC count: %r" % crc)
 		return crc
 
 	def getPacketErrorCount(self, modNumber):
 		OID=".1.3.6.1.4.1.9633.28.1.3.2.7.1.10." 
-		code=OID+modNumber
+		code=OID+str(modNumber)
 		packets=int(self.comm.query(code))
 		logger.info("Got Packet Error count: %r" % packets)
 		return packets
@@ -403,4 +406,76 @@ class VTR(Demodulator):
 		code=OID
 		rate=float(self.comm.query(code))
 		logger.info("Got Output data Rate: %r" % rate)
-		return rate
\ No newline at end of file
+		return rate
+	# status read by getStatus(): name -> (OID, conversion); per-demodulator OIDs end in the demodulator number
+	STATUS={
+	"snr": (".1.3.6.1.4.1.9633.28.1.3.2.7.1.2.%d", float),
+	"power": (".1.3.6.1.4.1.9633.28.1.3.2.7.1.4.%d", float),
+	"lock": (".1.3.6.1.4.1.9633.28.1.3.2.7.1.5.%d", lambda value: int(value) == 1),
+	"packets": (".1.3.6.1.4.1.9633.28.1.3.2.7.1.7.%d", int),
+	"crc": (".1.3.6.1.4.1.9633.28.1.3.2.7.1.8.%d", int),
+	"packetErrors": (".1.3.6.1.4.1.9633.28.1.3.2.7.1.10.%d", int),
+	"skew": (".1.3.6.1.4.1.9633.28.1.3.2.1.13.0", int),
+	"nullPackets": (".1.3.6.1.4.1.9633.28.1.3.2.1.15.0", int),
+	"overruns": (".1.3.6.1.4.1.9633.28.1.3.2.1.17.0", int),
+	"dataRate": (".1.3.6.1.4.1.9633.28.1.3.2.1.24.0", float)
+	}
+
+	def getStatus(self, modNumber, names=None):
+		"""
+		Gets the whole status block of a demodulator with a single SNMP GetRequest,
+		instead of one request per getSNR(), getPower(), getDemodLock(), ... call.
+
+		Input:
+			modNumber: integer demodulator number
+			names: list of keys to read, or None for all of them
+
+		Output:
+			dictionary with keys 'snr', 'power', 'lock', 'packets', 'crc', 'packetErrors',
+			'skew', 'nullPackets', 'overruns' and 'dataRate'
+		"""
+		names=list(names or self.STATUS)
+		OIDs=[]
+		for name in names:
+			OID=self.STATUS[name][0]
+			OIDs.append(OID % modNumber if "%d" in OID else OID)
+		values=self.comm.query(OIDs)
+		status={}
+		for name, value in zip(names, values):
+			status[name]=self.STATUS[name][1](value)
+		logger.info("Got status of demodulator %d: %r" % (modNumber, status))
+		return status
+
+	def startTelemetry(self, modNumber, names=None, rate=1.0, dataLogger=None, size=86400):
+		"""
+		Starts polling the demodulator status in the background, one GetRequest per sample.
+		The script's main loop keeps running; read the samples with getTelemetry().
+
+		Input:
+			modNumber: integer demodulator number
+			names: list of getStatus() keys to record, or None for all of them
+			rate: float samples per second
+			dataLogger: DataLogger to push every sample to, or None.
+						For CSV files the header should list the names in order.
+			size: integer number of samples kept in memory
+
+		Output:
+			Telemetry object
+		"""
+		self.stopTelemetry()
+		names=list(names or self.STATUS)
+		self.telemetry=Telemetry(lambda: self.getStatus(modNumber, names), names, rate=rate, dataLogger=dataLogger, size=size)
+		return self.telemetry.start()
+
+	def stopTelemetry(self):
+		if self.telemetry is not None:
+			self.telemetry.stop()
+
+	def getTelemetry(self):
+		"""
+		Returns the samples collected since startTelemetry() as a dictionary of NumPy arrays,
+		'time' plus one array per recorded status name.
+		"""
+		if self.telemetry is None:
+			return None
+		return self.telemetry.getData()
@@ -2,9 +2,16 @@ __all__ = ["Comm", "Modulator", "SFU", "Demodulator", "FSW", "Fastbit", "SSHComm
 from .Modulator import Modulator
 from .Demodulator import Demodulator
 from .SSHComm import SSHComm
+from .AsyncInstrument import AsyncInstrument
+from .Executor import InstrumentExecutor, runAll
+from .Recorder import record, replay, summarize
+from .Tracing import tracing, startTracing, stopTracing
 try:
 	from .Comm import Comm
 	from .TelnetComm import TelnetComm
+	from .AsyncComm import AsyncComm
+	from .AsyncTelnetComm import AsyncTelnetComm
+	from .AsyncSNMPComm import AsyncSNMPComm
 	from .SFU import SFU
 	from .FSW import FSW
 	from .Fastbit import Fastbit
@@ -0,0 +1,374 @@
+"""A local SCPI instrument over TCP, for running the drivers end to end without equipment."""
+from ..Instrumentation.Cache import parseCommand, pattern
+from ..Instrumentation.SCPI import ESR_OPC, blockHeader
+import numpy as np
+import argparse, logging, random, re, socket, threading, time
+
+logger = logging.getLogger(__name__)
+
+# a definite-length block argument, e.g. "MMEM:DATA 'cal.dat',#41024..."
+BLOCK = re.compile(br'#([1-9])')
+# Event Status Register bit set when a command cannot be executed, e.g. recalling a state that was never saved
+ESR_EXECUTION_ERROR = 0x10
+
+# Settings each emulated instrument starts with and returns to on *RST, keyed by header without
+# numeric suffixes (so 'MOD:CHAN:SYMB' answers MOD:CHAN1:SYMB? to MOD:CHAN32:SYMB?).
+# Queries with arguments, e.g. measurement results, are looked up as 'HEADER ARGUMENTS' first.
+PROFILES = {
+        'FSW': {
+                'idn': "Rohde&Schwarz,FSW-26,1312.8000K26/100000,2.30",
+                'stateExtension': ".dfl",
+                'defaults': {
+                        'INST:SEL': "SAN",
+                        'INST:LIST': "'SANALYZER','Spectrum'",
+                        'SENS:FREQ:CENT': "1000000000",
+                        'SENS:FREQ:SPAN': "60000000",
+                        'SENS:BAND:RES': "100000",
+                        'SENS:SWE:TIME': "0.01",
+                        'SENS:SWE:COUN': "0",
+                        'SENS:DDEM:SRAT': "20000000",
+                        'SENS:DDEM:TFIL:ALPH': "0.35",
+                        'SENS:DDEM:FORM': "PSK",
+                        'SENS:DDEM:PSK:NST': "8",
+                        'INP:GAIN:STAT': "0",
+                        'INP:EATT:STAT': "0",
+                        'INP:EATT:AUTO': "0",
+                        'INIT:CONT': "1",
+                        'DISP:TRAC:Y:SCAL:RLEV': "0",
+                        'INP:ATT': "10",
+                        'STAT:QUES:POW:COND': "0",
+                        'CALC:MARK:FUNC:POW:RES CPOW': "-30.00",
+                        'CALC:MARK:FUNC:DDEM:STAT:SNR AVG': "15.00",
+                        'CALC:MARK:FUNC:DDEM:STAT:MPOW AVG': "-30.00",
+                        'CALC:MARK:FUNC:DDEM:STAT:PERR AVG': "0.50",
+                        'CALC:MARK:FUNC:DDEM:STAT:CFER AVG': "100.00",
+                },
+        },
+        'SFU': {
+                'idn': "Rohde&Schwarz,SFU,2110.2500K02/100000,2.10",
+                'defaults': {
+                        'FREQ': "1000000000",
+                        'POW': "-30",
+                        'OUTP:STAT': "0",
+                        'DM:TRAN': "DVS2",
+                        'DM:FORM': "QPSK",
+                        'DVBS2:SYMB': "20000000",
+                        'DVBS2:ROLL': "0.35",
+                        'DVBS2:PIL': "0",
+                        'NOIS': "OFF",
+                        'NOIS:CN': "20",
+                },
+        },
+        'BTC': {
+                'idn': "Rohde&Schwarz,BTC,2114.3000K02/100000,3.00",
+                'defaults': {
+                        'FREQ': "1000000000",
+                        'POW': "-30",
+                        'OUTP:STAT': "0",
+                        'DVBS2:SYMB': "20000000",
+                        'DVBS2:ROLL': "0.35",
+                },
+        },
+        'SLG': {
+                'idn': "SLG,Satellite Link Generator,0,1.0",
+                'defaults': {
+                        'POW:CHAN:LEV': "-30.0",
+                        'FREQ:CHAN:FREQ': "1000000000",
+                        'MOD:CHAN:SYMB': "20000000",
+                        'MOD:CHAN:FORM': "DVBS2",
+                        'MOD:CHAN:FORM:CONS': "QPSK",
+                        'MOD:CHAN:FORM:RATE': "R3/4",
+                        'MOD:CHAN:FORM:PIL': "OFF",
+                        'MOD:CHAN:ROLL': "35",
+                        'MOD:CHAN:CARR': "SINGLE",
+                        'MOD:CHAN:STAT': "ON",
+                        'MOD:CHAN:SOUR': "PN",
+                        'OUTP:BAND': "LOW",
+                },
+        },
+}
+
+class InstrumentServer(object):
+
+        def __init__(self, profile="FSW", ip="127.0.0.1", port=5025, latency=None, defaultLatency=0.0, jitter=0.0, seed=None):
+                """
+                Creates a TCP server that answers SCPI like an R&S instrument or the SLG. Call start() to begin.
+                Settings that are written are kept and returned by the matching query, *RST restores the
+                profile's defaults, and *OPC, *OPC? and *ESR? follow the time each write takes to complete.
+                Commands may be concatenated with ';' like the comms' batches send them.
+
+                Input:
+                        profile: string 'FSW', 'SFU', 'BTC' or 'SLG' (see PROFILES)
+                        ip: string IP address to bind to
+                        port: integer TCP port, 0 picks a free port (see self.port)
+                        latency: dictionary of header -> float seconds the command takes, e.g. {'*RST': 2.0, 'INIT:IMM': 0.5}.
+                                 Headers are matched in short form without numeric suffixes.
+                        defaultLatency: float seconds taken by commands not in latency
+                        jitter: float standard deviation in seconds added to every latency
+                        seed: random seed for the jitter, for repeatable runs
+
+                Output:
+                        InstrumentServer object
+                """
+                self.profile = PROFILES[profile]
+                self.latency = dict((pattern(parseCommand(header)[0]), seconds) for header, seconds in (latency or {}).items())
+                self.defaultLatency = defaultLatency
+                self.jitter = jitter
+                self.random = random.Random(seed)
+                self.lock = threading.RLock()
+                self.traces = {}        # 'TRAC:DATA TRACE<n>' -> float32 levels, kept over *RST
+                self.saved = {}         # state file name or '*<register>' -> saved state, kept over *RST
+                self.reset()
+                self.esr = 0
+                self.opcPending = False
+                self.busyUntil = 0.0    # time.perf_counter() at which the last write completes
+                self.requests = 0       # number of commands handled
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.socket.bind((ip, port))
+                self.socket.listen(8)
+                self.socket.settimeout(0.1)
+                self.ip, self.port = self.socket.getsockname()
+                self.thread = None
+                self.running = False
+                self.clients = []
+
+        def start(self):
+                self.running = True
+                self.thread = threading.Thread(target=self.serve, name="InstrumentServer:%d" % self.port)
+                self.thread.daemon = True
+                self.thread.start()
+                logger.info("%s simulator listening on %s:%d" % (self.profile['idn'].split(',')[1], self.ip, self.port))
+                return self
+
+        def stop(self):
+                self.running = False
+                if self.thread is not None:
+                        self.thread.join()
+                for client in self.clients:
+                        client.join()
+                self.socket.close()
+
+        def __enter__(self):
+                return self.start()
+
+        def __exit__(self, *exc):
+                self.stop()
+
+        def reset(self):
+                with self.lock:
+                        self.state = {}
+
+        def getValue(self, command):
+                """Returns the value a query would answer, e.g. getValue('MOD:CHAN1:SYMB?')."""
+                header, arguments, query = parseCommand(command)
+                with self.lock:
+                        if arguments is not None:
+                                key = header + ' ' + arguments.upper()
+                                if key in self.state:
+                                        return self.state[key]
+                                if key in self.traces:
+                                        return self.traces[key]
+                                if pattern(key) in self.profile['defaults']:
+                                        return self.profile['defaults'][pattern(key)]
+                        if header in self.state:
+                                return self.state[header]
+                        return self.profile['defaults'].get(pattern(header), "0")
+
+        def setValue(self, command, value=None):
+                """Sets what a query answers, e.g. setValue('CALC2:MARK:FUNC:DDEM:STAT:SNR? AVG', '12.5')."""
+                header, arguments, query = parseCommand(command)
+                with self.lock:
+                        if query and arguments is not None:
+                                self.state[header + ' ' + arguments.upper()] = value
+                        else:
+                                self.state[header] = arguments if value is None else value
+
+        def setTrace(self, levels, trace=1):
+                """Sets the levels TRAC:DATA? TRACE<trace> answers, as text or, after FORM REAL,32, as a binary block."""
+                with self.lock:
+                        self.traces['TRAC:DATA TRACE%d' % trace] = np.asarray(levels, dtype='<f4')
+
+        def encode(self, value):
+                """Formats a stored value as a response: arrays follow FORM, bytes are sent as a block, the rest as text."""
+                if isinstance(value, np.ndarray):
+                        if self.state.get('FORM', 'ASC').upper().startswith('REAL'):
+                                return blockHeader(value.nbytes) + value.tobytes()
+                        return ",".join("%g" % level for level in value)
+                if isinstance(value, bytes):
+                        return blockHeader(len(value)) + value
+                return value
+
+        def messageEnd(self, buffer):
+                """Returns the index of the newline ending the first message in buffer, skipping over
+                binary blocks, or -1 if the message is incomplete."""
+                position = 0
+                while True:
+                        newline = buffer.find(b'\n', position)
+                        match = BLOCK.search(buffer, position, newline if newline >= 0 else len(buffer))
+                        if match is None:
+                                return newline
+                        start = match.end() + int(match.group(1))
+                        if start > len(buffer):
+                                return -1
+                        position = start + int(buffer[match.end():start])
+                        if position > len(buffer):
+                                return -1
+
+        def stateName(self, header, arguments):
+                """Returns the key of a saved state: '*<register>' for *SAV/*RCL, the file name with extension for MMEM."""
+                if header.startswith('*'):
+                        return '*' + arguments.strip()
+                name = arguments.split(',', 1)[-1].strip().strip("'\"")
+                extension = self.profile.get('stateExtension', '')
+                if not name.lower().endswith(extension.lower()):
+                        name += extension
+                return name
+
+        def delay(self, header):
+                seconds = self.latency.get(pattern(header), self.defaultLatency)
+                if self.jitter:
+                        seconds += self.random.gauss(0, self.jitter)
+                return max(0.0, seconds)
+
+        def wait(self):
+                """Blocks until the writes sent so far have completed."""
+                remaining = self.busyUntil - time.perf_counter()
+                if remaining > 0:
+                        time.sleep(remaining)
+
+        def serve(self):
+                while self.running:
+                        try:
+                                connection, address = self.socket.accept()
+                        except socket.timeout:
+                                continue
+                        except OSError:
+                                break
+                        client = threading.Thread(target=self.session, args=(connection,), name="InstrumentServer:%d:%d" % (self.port, address[1]))
+                        client.daemon = True
+                        client.start()
+                        self.clients.append(client)
+
+        def session(self, connection):
+                connection.settimeout(0.1)
+                buffer = bytearray()
+                with connection:
+                        while self.running:
+                                try:
+                                        data = connection.recv(65536)
+                                except socket.timeout:
+                                        continue
+                                except OSError:
+                                        break
+                                if not data:
+                                        break
+                                buffer.extend(data)
+                                end = self.messageEnd(buffer)
+                                while end >= 0:
+                                        message = bytes(buffer[:end])
+                                        del buffer[:end + 1]
+                                        answers = self.handle(message)
+                                        if answers:
+                                                answers = [answer if isinstance(answer, bytes) else answer.encode('ascii') for answer in answers]
+                                                connection.sendall(b";".join(answers) + b'\n')
+                                        end = self.messageEnd(buffer)
+
+        def handle(self, message):
+                """Runs one program message (bytes) and returns the list of answers to its queries."""
+                match = BLOCK.search(message)
+                if match is not None:
+                        # a command whose last argument is a binary block stores the block's data
+                        start = match.end() + int(match.group(1))
+                        header = parseCommand(message[:match.start()].decode('ascii', 'replace'))[0]
+                        with self.lock:
+                                self.busyUntil = max(self.busyUntil, time.perf_counter()) + self.delay(header)
+                                self.state[header] = bytes(message[start:start + int(message[match.end():start])])
+                        self.requests += 1
+                        return []
+                message = message.decode('ascii', 'replace').strip()
+                answers = []
+                parent = ""
+                for part in message.split(';'):
+                        part = part.strip()
+                        if not part:
+                                continue
+                        # a header after ';' without a leading ':' is relative to the previous header's parent node
+                        if parent and not part.startswith(':') and not part.startswith('*'):
+                                part = parent + ':' + part
+                        header, arguments, query = parseCommand(part)
+                        if not header.startswith('*'):
+                                parent = header.rsplit(':', 1)[0] if ':' in header else ""
+                        self.requests += 1
+                        answer = self.execute(header, arguments, query)
+                        if answer is not None:
+                                answers.append(answer)
+                return answers
+
+        def execute(self, header, arguments, query):
+                with self.lock:
+                        if header == '*ESR' and query:
+                                if self.opcPending and time.perf_counter() >= self.busyUntil:
+                                        self.esr |= ESR_OPC
+                                        self.opcPending = False
+                                esr, self.esr = self.esr, 0
+                                return str(esr)
+                        if header == '*OPC':
+                                if query:
+                                        self.wait()
+                                        return "1"
+                                self.opcPending = True
+                                return None
+                        if header == '*CLS':
+                                self.esr = 0
+                                self.opcPending = False
+                                return None
+                        if header == 'SYST:ERR' and query:
+                                return '0,"No error"'
+                if query:
+                        self.wait()
+                        time.sleep(self.delay(header))
+                        if header == '*IDN':
+                                return self.profile['idn']
+                        if header in ('*ESE', '*SRE', '*STB'):
+                                return self.state.get(header, "0")
+                        if header == 'MMEM:CAT':
+                                with self.lock:
+                                        return ",".join("'%s'" % name for name in sorted(self.saved) if not name.startswith('*'))
+                        return self.encode(self.getValue(header + '?' + ('' if arguments is None else ' ' + arguments)))
+                with self.lock:
+                        self.busyUntil = max(self.busyUntil, time.perf_counter()) + self.delay(header)
+                        if header in ('*RST', 'SYST:PRES'):
+                                self.reset()
+                        elif header == 'INST:CRE':
+                                channel = ",".join("'%s'" % name.strip().strip("'\"") for name in arguments.split(','))
+                                self.state['INST:LIST'] = self.getValue('INST:LIST?') + ',' + channel
+                        elif header in ('*SAV', 'MMEM:STOR:STAT'):
+                                self.saved[self.stateName(header, arguments)] = dict(self.state)
+                        elif header in ('*RCL', 'MMEM:LOAD:STAT'):
+                                name = self.stateName(header, arguments)
+                                if name in self.saved:
+                                        self.state = dict(self.saved[name])
+                                else:
+                                        self.esr |= ESR_EXECUTION_ERROR
+                        elif arguments is not None:
+                                self.state[header] = arguments.strip()
+                return None
+
+if __name__ == "__main__":
+        parser = argparse.ArgumentParser(description="Serve a simulated SCPI instrument over TCP")
+        parser.add_argument("--profile", default="FSW", choices=sorted(PROFILES))
+        parser.add_argument("--ip", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=5025)
+        parser.add_argument("--latency", type=float, default=0.0, help="seconds every command takes")
+        parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the latency in seconds")
+        options = parser.parse_args()
+        logging.basicConfig(level=logging.INFO)
+        server = InstrumentServer(profile=options.profile, ip=options.ip, port=options.port,
+                defaultLatency=options.latency, jitter=options.jitter)
+        server.start()
+        try:
+                while True:
+                        time.sleep(1)
+        except KeyboardInterrupt:
+                server.stop()
@@ -0,0 +1,150 @@
+"""A minimal SNMP v2c agent for exercising SNMPComm and the SNMP drivers without equipment."""
+from ..Instrumentation.SNMP import (encodeMessage, decodeMessage, encodeValue, encodeTLV, typeName,
+        GET, GETNEXT, SET, GETBULK, RESPONSE, NULL, NO_SUCH_OBJECT, END_OF_MIB_VIEW, SNMPError)
+import logging, socket, threading, time
+
+logger = logging.getLogger(__name__)
+
+class SNMPAgent(object):
+
+        def __init__(self, ip="127.0.0.1", port=0, community="private", values=None, setDelay=0):
+                """
+                Creates an agent that serves a dictionary of OIDs over UDP. Call start() to begin answering.
+
+                Input:
+                        ip: string IP address to bind to
+                        port: integer UDP port, 0 picks a free port (see self.port)
+                        community: string community the agent answers to, other requests are ignored
+                        values: dictionary of string OID -> (string type, value), e.g. {'.1.3.6.1.2.1.1.5.0': ('str', 'VTM')}
+                        setDelay: float seconds before a set value becomes visible to gets, like slow equipment
+
+                Output:
+                        SNMPAgent object
+                """
+                self.community = community
+                self.values = {}
+                for oid, value in (values or {}).items():
+                        self.values[self.normalize(oid)] = value
+                self.setDelay = setDelay
+                self.pending = {}       # OID -> (time the value becomes visible, (type, value))
+                self.requests = 0       # number of PDUs answered
+                self.lock = threading.Lock()
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.bind((ip, port))
+                self.socket.settimeout(0.1)
+                self.ip, self.port = self.socket.getsockname()
+                self.thread = None
+                self.running = False
+
+        def normalize(self, oid):
+                return '.' + oid.strip('.')
+
+        def start(self):
+                self.running = True
+                self.thread = threading.Thread(target=self.serve, name="SNMPAgent:%d" % self.port)
+                self.thread.daemon = True
+                self.thread.start()
+                logger.info("SNMP agent listening on %s:%d" % (self.ip, self.port))
+                return self
+
+        def stop(self):
+                self.running = False
+                if self.thread is not None:
+                        self.thread.join()
+                self.socket.close()
+
+        def __enter__(self):
+                return self.start()
+
+        def __exit__(self, *exc):
+                self.stop()
+
+        def getValue(self, oid):
+                """Returns the (type, value) pair the agent currently holds for oid, or None."""
+                with self.lock:
+                        oid = self.normalize(oid)
+                        if oid in self.pending and self.pending[oid][0] <= time.perf_counter():
+                                self.values[oid] = self.pending.pop(oid)[1]
+                        return self.values.get(oid)
+
+        def key(self, oid):
+                return tuple(int(x) for x in oid.strip('.').split('.'))
+
+        def next(self, oid):
+                """Returns the OID that follows oid in lexicographic order, or None at the end of the MIB."""
+                with self.lock:
+                        following = [other for other in set(self.values) | set(self.pending) if self.key(other) > self.key(oid)]
+                if not following:
+                        return None
+                return min(following, key=self.key)
+
+        def setValue(self, oid, type, value):
+                with self.lock:
+                        oid = self.normalize(oid)
+                        if self.setDelay:
+                                self.pending[oid] = (time.perf_counter() + self.setDelay, (type, value))
+                        else:
+                                self.values[oid] = (type, value)
+
+        def serve(self):
+                while self.running:
+                        try:
+                                data, address = self.socket.recvfrom(65535)
+                        except socket.timeout:
+                                continue
+                        except OSError:
+                                break
+                        try:
+                                request = decodeMessage(data)
+                        except (SNMPError, IndexError, ValueError):
+                                logger.debug("Agent discarded malformed datagram")
+                                continue
+                        if request['community'] != self.community:
+                                continue
+                        response = self.handle(request)
+                        if response is not None:
+                                self.requests += 1
+                                self.socket.sendto(response, address)
+
+        def handle(self, request):
+                """Builds the response message for a decoded request."""
+                varbinds = []
+                if request['pdu'] == SET:
+                        for oid, tag, value in request['varbinds']:
+                                if isinstance(value, bytes):
+                                        value = value.decode('utf-8', 'replace')
+                                self.setValue(oid, typeName(tag), value)
+                                varbinds.append((oid, encodeValue(value, typeName(tag))))
+                elif request['pdu'] == GET:
+                        for oid, tag, value in request['varbinds']:
+                                varbinds.append((oid, self.encode(oid)))
+                elif request['pdu'] == GETNEXT:
+                        for oid, tag, value in request['varbinds']:
+                                varbinds.append(self.encodeNext(oid))
+                elif request['pdu'] == GETBULK:
+                        # error-status and error-index carry non-repeaters and max-repetitions
+                        nonRepeaters = request['errorStatus']
+                        maxRepetitions = request['errorIndex']
+                        for oid, tag, value in request['varbinds'][:nonRepeaters]:
+                                varbinds.append(self.encodeNext(oid))
+                        for oid, tag, value in request['varbinds'][nonRepeaters:]:
+                                for i in range(maxRepetitions):
+                                        oid, encoded = self.encodeNext(oid)
+                                        varbinds.append((oid, encoded))
+                                        if encoded[0] == END_OF_MIB_VIEW:
+                                                break
+                else:
+                        return None
+                return encodeMessage(self.community, RESPONSE, request['requestID'], varbinds)
+
+        def encodeNext(self, oid):
+                following = self.next(oid)
+                if following is None:
+                        return oid, encodeTLV(END_OF_MIB_VIEW, b'')
+                return following, self.encode(following)
+
+        def encode(self, oid):
+                entry = self.getValue(oid)
+                if entry is None:
+                        return encodeTLV(NO_SUCH_OBJECT, b'')
+                return encodeValue(entry[1], entry[0])
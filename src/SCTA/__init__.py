@@ -1 +1 @@
-__all__ = ["Specs", "System", "Instrumentation", "DataLogging"]
\ No newline at end of file
+__all__ = ["Specs", "System", "Instrumentation", "DataLogging", "Analysis"]
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""Vectorized power integration and noise measurement over spectrum analyzer traces."""
+import numpy as np
+
+def frequencyAxis(center, span, points):
+	"""
+	Returns the frequency of every trace point of a sweep.
+
+	Input:
+		center: float center frequency in Hz
+		span: float span in Hz
+		points: integer number of sweep points
+
+	Output:
+		NumPy array of float frequencies in Hz
+	"""
+	return np.linspace(center - span/2.0, center + span/2.0, int(points))
+
+def stitch(segments):
+	"""
+	Joins the traces of several sweeps into one, sorted by frequency.
+	Where sweeps overlap, the points of the later sweep are dropped.
+
+	Input:
+		list of (frequencies, levels) pairs of NumPy arrays
+
+	Output:
+		(frequencies, levels) NumPy arrays
+	"""
+	frequencies, levels = [], []
+	end = -np.inf
+	for segment in sorted(segments, key=lambda segment: segment[0][0]):
+		keep = segment[0] > end
+		frequencies.append(segment[0][keep])
+		levels.append(segment[1][keep])
+		if keep.any():
+			end = frequencies[-1][-1]
+	return np.concatenate(frequencies), np.concatenate(levels)
+
+def channelPowers(frequencies, levels, centers, bandwidths, rbw, nbw=1.0):
+	"""
+	Integrates the power of many channels over one RMS-detected trace in a single pass.
+	Each trace point stands for the bin halfway to its neighbours, and bins cut by a channel
+	edge count in proportion to the part that lies inside the channel.
+
+	Input:
+		frequencies: NumPy array of float Hz, increasing
+		levels: NumPy array of float dBm per trace point
+		centers: list of float channel center frequencies in Hz
+		bandwidths: list of float channel bandwidths in Hz
+		rbw: float resolution bandwidth of the sweep in Hz
+		nbw: float noise bandwidth of the resolution filter divided by rbw
+
+	Output:
+		NumPy array of float channel powers in dBm, NaN for channels outside the trace
+	"""
+	frequencies = np.asarray(frequencies, dtype=np.float64)
+	centers = np.asarray(centers, dtype=np.float64)
+	bandwidths = np.asarray(bandwidths, dtype=np.float64)
+	# bin edges halfway between trace points, the outer bins as wide as their neighbour
+	edges = np.empty(len(frequencies) + 1)
+	edges[1:-1] = (frequencies[1:] + frequencies[:-1]) / 2.0
+	edges[0] = 2*frequencies[0] - edges[1]
+	edges[-1] = 2*frequencies[-1] - edges[-2]
+	# power density in mW/Hz of each bin, and its running integral at the bin edges
+	density = np.power(10.0, np.asarray(levels, dtype=np.float64)/10.0) / (rbw*nbw)
+	energy = np.concatenate(([0.0], np.cumsum(density * np.diff(edges))))
+	low = centers - bandwidths/2.0
+	high = centers + bandwidths/2.0
+	power = np.interp(high, edges, energy) - np.interp(low, edges, energy)
+	with np.errstate(divide='ignore'):
+		powers = 10*np.log10(power)
+	powers[(low < edges[0]) | (high > edges[-1])] = np.nan
+	return powers
+
+def signalToNoise(frequencies, levels, center, bandwidth, noiseRegions, rbw, nbw=1.0):
+	"""
+	Measures the carrier to noise ratio of one channel from a single RMS-detected trace.
+	The noise density is the mean density of the trace points in the noise regions, which must
+	lie where the trace shows only the noise that also falls into the channel, e.g. beside the
+	carrier when the noise is wider than the span.
+
+	Input:
+		frequencies: NumPy array of float Hz, increasing
+		levels: NumPy array of float dBm per trace point
+		center: float channel center frequency in Hz
+		bandwidth: float occupied bandwidth of the channel in Hz
+		noiseRegions: list of (start, stop) float frequency offsets from center in Hz, e.g. [(-30e6, -15e6), (15e6, 30e6)]
+		rbw: float resolution bandwidth of the sweep in Hz
+		nbw: float noise bandwidth of the resolution filter divided by rbw
+
+	Output:
+		a python dictionary of
+			'snr': float carrier to noise ratio in dB, NaN if the channel shows no more power than the noise
+			'power': float signal plus noise power in the channel in dBm
+			'noise': float noise power in the channel in dBm
+			'noisedensity': float noise density in dBm/Hz
+	"""
+	frequencies = np.asarray(frequencies, dtype=np.float64)
+	offsets = frequencies - center
+	inside = np.zeros(len(frequencies), dtype=bool)
+	for start, stop in noiseRegions:
+		inside |= (offsets >= start) & (offsets <= stop)
+	if not inside.any():
+		raise ValueError("No trace points in the noise regions %r" % (noiseRegions,))
+	density = np.mean(np.power(10.0, np.asarray(levels, dtype=np.float64)[inside]/10.0)) / (rbw*nbw)
+	power = channelPowers(frequencies, levels, [center], [bandwidth], rbw, nbw)[0]
+	noise = density*bandwidth
+	signal = np.power(10.0, power/10.0) - noise
+	return {
+		'snr': float(10*np.log10(signal/noise)) if signal > 0 else float('nan'),
+		'power': float(power),
+		'noise': float(10*np.log10(noise)),
+		'noisedensity': float(10*np.log10(density)),
+	}
@@ -1,6 +1,6 @@
 import SCTA_context
 from SCTA.System import Transponder
-from SCTA.Instrumentation import BTC, SLG, FSW
+from SCTA.Instrumentation import BTC, SLG, FSW, InstrumentExecutor
 from SCTA.DataLogging import DataLogger
 from SCTA.utils.fileparse import csv2dict, dict2csv, importCSV
 import pandas as pd
@@ -36,11 +36,14 @@ def calibrateDDSS(scenario=1):
 	#initialize SLG Setup
 
 
-	slg1.loadConfigFile("DSWM\SLG1_DSWM_US_23CH_2B_20MS.cfg")
-	slg2.loadConfigFile("DSWM\SLG2_DSWM_US_23CH_2B_20MS.cfg")
-	slg3.loadConfigFile("DSWM\SLG3_DSWM_US_23CH_2B_20MS.cfg")
-
 	slg=[slg1, slg2, slg3]
+
+	# load the three generators in parallel
+	with InstrumentExecutor(raiseErrors=True) as executor:
+		executor.starmap('loadConfigFile', [
+			(slg1, ("DSWM\SLG1_DSWM_US_23CH_2B_20MS.cfg",)),
+			(slg2, ("DSWM\SLG2_DSWM_US_23CH_2B_20MS.cfg",)),
+			(slg3, ("DSWM\SLG3_DSWM_US_23CH_2B_20MS.cfg",))])
 	mod1=list(range(1,10))
 	mod2=list(range(1,7))
 	mod3=list(range(1,9))
@@ -0,0 +1,56 @@
+# Testing the modulation quality metrics of captured symbols
+import logging, unittest
+import numpy as np
+from .context import SCTA
+from SCTA.Analysis import analyze, constellationStatistics, estimateCarrier, idealPoints
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class Analysis_Test(object):
+
+	SYMBOLS = 20000
+	SYMB = 20e6
+	SNR = 20.0		# dB
+	FREQ_ERROR = 10e3	# Hz
+	PHASE = 0.2		# radians
+
+	def capture(self, constellation):
+		"""Random symbols with a carrier offset, a gain and white noise at SNR"""
+		random = np.random.RandomState(0)
+		points = idealPoints(constellation)
+		symbols = points[random.randint(len(points), size=self.SYMBOLS)]
+		noise = (random.standard_normal(self.SYMBOLS) + 1j*random.standard_normal(self.SYMBOLS)) * np.sqrt(10**(-self.SNR/10)/2)
+		rotation = np.exp(1j*(2*np.pi*self.FREQ_ERROR/self.SYMB*np.arange(self.SYMBOLS) + self.PHASE))
+		return (0.01*(symbols + noise)*rotation).astype(np.complex64)
+
+	def test_analyze(self):
+		for constellation in ['QPSK', '8PSK']:
+			yield self.check_analyze, constellation
+
+	def check_analyze(self, constellation):
+		results = analyze(self.capture(constellation), constellation, self.SYMB)
+		assert (abs(results['mer'] - self.SNR) < 0.2)
+		assert (abs(results['evm'] - 100*10**(-self.SNR/20)) < 0.3)
+		assert (abs(results['carrierfreqerror'] - self.FREQ_ERROR) < 100)
+		assert (results['phaseerror'] < 5)
+
+	def test_carrier(self):
+		frequency, phase = estimateCarrier(self.capture('QPSK'), 'QPSK', self.SYMB)
+		assert (abs(frequency - self.FREQ_ERROR) < 100)
+		assert (abs(phase - self.PHASE) < 0.02)
+
+	def test_statistics(self):
+		statistics = constellationStatistics(self.capture('8PSK'), '8PSK', self.SYMB)
+		assert (statistics['counts'].sum() == self.SYMBOLS)
+		assert (np.allclose(statistics['centroids'], idealPoints('8PSK'), atol=0.02))
+		assert (np.allclose(statistics['spread'], 10**(-self.SNR/20), atol=0.01))
+
+	def test_unknown(self):
+		try:
+			analyze(self.capture('QPSK'), '16APSK')
+		except ValueError:
+			pass
+		else:
+			assert False, "an unknown constellation should raise ValueError"
@@ -0,0 +1,66 @@
+# Testing the asyncio comms and drivers against local SNMP agents
+import asyncio, logging, time, unittest
+from .context import SCTA
+from SCTA.Instrumentation.AsyncSNMPComm import AsyncSNMPComm
+from SCTA.Instrumentation.AsyncInstrument import AsyncInstrument
+from SCTA.Instrumentation.VTR import VTR
+from SCTA.Simulation.SNMPAgent import SNMPAgent
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class AsyncComm_Test(object):
+
+	FREQ_OID = ".1.3.6.1.4.1.9633.24.1.3.1.4.1.5.1"
+	SNR_OID = ".1.3.6.1.4.1.9633.28.1.3.2.7.1.2.1"
+	DELAY = 0.3
+
+	def setUp(self):
+		values = {self.FREQ_OID: ('int', 974000000), self.SNR_OID: ('int', 12)}
+		# both agents apply sets slowly, so writes to them take about DELAY each
+		self.agents = [SNMPAgent(values=values, setDelay=self.DELAY).start() for i in range(2)]
+		self.loop = asyncio.new_event_loop()
+
+	def tearDown(self):
+		self.loop.close()
+		for agent in self.agents:
+			agent.stop()
+
+	def test_query(self):
+		comm = AsyncSNMPComm(ip=self.agents[0].ip, port=self.agents[0].port, loop=self.loop)
+		try:
+			assert (self.loop.run_until_complete(comm.query(self.FREQ_OID)) == "974000000")
+			assert (self.loop.run_until_complete(comm.query([self.FREQ_OID, self.SNR_OID])) == ["974000000", "12"])
+		finally:
+			comm.close()
+
+	def test_concurrent_writes(self):
+		comms = [AsyncSNMPComm(ip=agent.ip, port=agent.port, loop=self.loop) for agent in self.agents]
+		try:
+			start = time.perf_counter()
+			async def write():
+				await asyncio.gather(*[comm.write(self.FREQ_OID + " -val:1450000000") for comm in comms])
+			self.loop.run_until_complete(write())
+			elapsed = time.perf_counter() - start
+			# the writes overlap, so together they take about as long as one
+			assert (elapsed < 1.8 * self.DELAY), elapsed
+			for agent in self.agents:
+				assert (agent.getValue(self.FREQ_OID) == ('int', 1450000000))
+		finally:
+			for comm in comms:
+				comm.close()
+
+	def test_instrument(self):
+		async def connect():
+			return await asyncio.gather(*[AsyncInstrument.create(VTR, ip=agent.ip, port=agent.port, loop=self.loop) for agent in self.agents])
+		vtrs = self.loop.run_until_complete(connect())
+		try:
+			async def getSNRs():
+				return await asyncio.gather(*[vtr.getSNR(1) for vtr in vtrs])
+			snrs = self.loop.run_until_complete(getSNRs())
+			assert (snrs == [12.0, 12.0])
+			assert (vtrs[0].id == "VTR")
+		finally:
+			for vtr in vtrs:
+				vtr.close()
@@ -0,0 +1,168 @@
+# Testing the instrument state, query and level caches
+import logging, time, unittest
+from .context import SCTA
+from SCTA.Instrumentation.Cache import StateCache, QueryCache, LevelCache, parseCommand, queryFor, sameValue, shortForm
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class StateCache_Test(object):
+
+	def setUp(self):
+		self.cache = StateCache()
+
+	def test_shortForm(self):
+		for node, short in [("CHANnel2", "CHAN2"), ("MODulator", "MOD"), ("FREQUENCY", "FREQ"), ("INPUT", "INP"), ("SRAT", "SRAT"), ("CALC2", "CALC2")]:
+			yield self.check_shortForm, node, short
+
+	def check_shortForm(self, node, short):
+		assert (shortForm(node) == short)
+
+	def test_parseCommand(self):
+		assert (parseCommand(":SENSe:FREQuency:CENTer 974e6") == ("SENS:FREQ:CENT", "974e6", False))
+		assert (parseCommand("MOD:CHAN1:SYMB?") == ("MOD:CHAN1:SYMB", None, True))
+		assert (parseCommand("*rst") == ("*RST", None, False))
+
+	def test_skip(self):
+		assert (self.cache.write("SENS:FREQ:CENT 974000000.00"))
+		assert (not self.cache.write("SENSe:FREQuency:CENTer 974e6"))
+		assert (self.cache.write("SENS:FREQ:CENT 1450e6"))
+		assert (self.cache.skipped == 1)
+
+	def test_read(self):
+		self.cache.read("MOD:CHAN1:SYMB?", "2.0E+07")
+		assert (not self.cache.write("MOD:CHAN1:SYMB 20000000"))
+
+	def test_coupling(self):
+		# coupling a setting again lets the instrument choose it, so writing the old value is sent
+		assert (self.cache.write("SENS:BAND:RES 100000"))
+		assert (self.cache.write("SENS:BAND:RES:AUTO ON"))
+		assert (self.cache.write("SENS:BAND:RES 100000"))
+
+	def test_actions(self):
+		# commands without arguments, common commands and actions are always sent
+		assert (self.cache.write("INIT:IMM"))
+		assert (self.cache.write("INIT:IMM"))
+		assert (self.cache.write("INST:CRE DDEM, 'VSA'"))
+		assert (self.cache.write("INST:CRE DDEM, 'VSA'"))
+
+	def test_scope(self):
+		self.cache.write("INST:SEL VSA")
+		self.cache.write("SENS:FREQ:CENT 974e6")
+		self.cache.write("INST:SEL Spectrum")
+		assert (self.cache.write("SENS:FREQ:CENT 974e6"))
+		assert (not self.cache.write("INST:SEL Spectrum"))
+		self.cache.write("INST:SEL VSA")
+		assert (not self.cache.write("SENS:FREQ:CENT 974e6"))
+
+	def test_invalidate(self):
+		for reset in ["*RST", "MMEMory:LOAD:STATe 0, 'DSWM.cfg'"]:
+			self.cache.write("INST:SEL VSA")
+			self.cache.write(reset)
+			assert (self.cache.write("INST:SEL VSA"))
+		self.cache.write("OUTP:BAND LOW")
+		self.cache.invalidate("OUTP:BAND?")
+		assert (self.cache.write("OUTP:BAND LOW"))
+
+	def test_children(self):
+		# changing a node forgets the settings below it
+		self.cache.write("MOD:CHAN1:FORM DVBS2")
+		self.cache.write("MOD:CHAN1:FORM:RATE R3/4")
+		assert (not self.cache.write("MOD:CHAN1:FORM DVBS2"))
+		assert (not self.cache.write("MOD:CHAN1:FORM:RATE R3/4"))
+		self.cache.write("MOD:CHAN1:FORM DVBS")
+		assert (self.cache.write("MOD:CHAN1:FORM:RATE R3/4"))
+
+	def test_sameValue(self):
+		assert (sameValue("974000000.00", "9.74E+08"))
+		assert (sameValue("ON", "1"))
+		assert (sameValue("DTV", "DTV"))
+		assert (sameValue("TEST", "test"))
+		assert (sameValue("FREQuency", "FREQ"))
+		assert (not sameValue("'VSA'", "'Spectrum'"))
+		assert (not sameValue("DVBS2", "DVBS"))
+
+	def test_queryFor(self):
+		assert (queryFor("SOURce:NOISe:COUPling ON") == "SOUR:NOIS:COUP?")
+		assert (queryFor("SOUR2:DM:TYPE DTV") == "SOUR2:DM:TYPE?")
+
+class QueryCache_Test(object):
+
+	def setUp(self):
+		self.cache = QueryCache()
+		self.cache.add("*IDN?")
+		self.cache.add("MOD:CHAN:SYMB?", ttl=60)
+		self.cache.add("SENS:SWE:TIME?", ttl=0.05)
+
+	def test_hit(self):
+		assert (self.cache.get("*IDN?") is None)
+		self.cache.put("*IDN?", "Rohde&Schwarz,FSW-26")
+		assert (self.cache.get("*idn?") == "Rohde&Schwarz,FSW-26")
+		assert (self.cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1})
+
+	def test_uncached(self):
+		self.cache.put("SENS:FREQ:CENT?", "974000000")
+		assert (self.cache.get("SENS:FREQ:CENT?") is None)
+		assert (self.cache.stats()['entries'] == 0)
+
+	def test_ttl(self):
+		self.cache.put("SENS:SWE:TIME?", "0.01")
+		assert (self.cache.get("SENS:SWE:TIME?") == "0.01")
+		time.sleep(0.06)
+		assert (self.cache.get("SENS:SWE:TIME?") is None)
+
+	def test_channels(self):
+		self.cache.put("MOD:CHAN1:SYMB?", "2.0E+07")
+		self.cache.put("MOD:CHAN2:SYMB?", "3.0E+07")
+		assert (self.cache.get("MODulator:CHANnel2:SYMB?") == "3.0E+07")
+		self.cache.write("MOD:CHAN2:SYMB 25e6")
+		assert (self.cache.get("MOD:CHAN2:SYMB?") is None)
+		assert (self.cache.get("MOD:CHAN1:SYMB?") == "2.0E+07")
+
+	def test_size(self):
+		self.cache.add("CALC:MARK:FUNC:POW:RES?", size=2)
+		for n, mode in enumerate(["CPOW", "ACP", "OBW"]):
+			self.cache.put("CALC:MARK:FUNC:POW:RES? %s" % mode, str(n))
+		assert (self.cache.get("CALC:MARK:FUNC:POW:RES? CPOW") is None)
+		assert (self.cache.get("CALC:MARK:FUNC:POW:RES? OBW") == "2")
+
+	def test_invalidate(self):
+		self.cache.put("*IDN?", "Rohde&Schwarz,FSW-26")
+		self.cache.put("MOD:CHAN1:SYMB?", "2.0E+07")
+		self.cache.write("*RST")
+		assert (self.cache.get("MOD:CHAN1:SYMB?") is None)
+		assert (self.cache.get("*IDN?") == "Rohde&Schwarz,FSW-26")
+
+	def test_scope(self):
+		self.cache.write("INST:SEL VSA")
+		self.cache.put("MOD:CHAN1:SYMB?", "2.0E+07")
+		self.cache.write("INST:SEL Spectrum")
+		assert (self.cache.get("MOD:CHAN1:SYMB?") is None)
+		self.cache.write("INST:SEL VSA")
+		assert (self.cache.get("MOD:CHAN1:SYMB?") == "2.0E+07")
+
+class LevelCache_Test(object):
+
+	LEVELS = {'DISP:TRAC:Y:SCAL:RLEV': "-10", 'INP:ATT': "5"}
+
+	def setUp(self):
+		self.cache = LevelCache(frequencyBin=10e6, tolerance=3.0)
+		self.cache.put('VSA', 1450e6, -30.0, self.LEVELS)
+
+	def test_hit(self):
+		assert (self.cache.get('VSA', 1452e6, -31.0) == self.LEVELS)
+		assert (self.cache.get('VSA', 1452e6) == self.LEVELS)
+		assert (self.cache.get('Spectrum', 1450e6, -30.0) is None)
+		assert (self.cache.stats() == {'hits': 2, 'misses': 1, 'entries': 1})
+
+	def test_bins(self):
+		assert (self.cache.get('VSA', 1470e6, -30.0) is None)
+		assert (self.cache.get('VSA', 1450e6, -20.0) is None)
+		self.cache.put('VSA', 1450e6, -20.0, {'DISP:TRAC:Y:SCAL:RLEV': "0", 'INP:ATT': "15"})
+		assert (self.cache.get('VSA', 1450e6, -30.0) == self.LEVELS)
+		assert (self.cache.get('VSA', 1450e6, -21.0)['INP:ATT'] == "15")
+
+	def test_discard(self):
+		self.cache.discard('VSA', 1450e6, -30.0)
+		assert (self.cache.get('VSA', 1450e6, -30.0) is None)
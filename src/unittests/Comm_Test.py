@@ -0,0 +1,86 @@
+# Testing Comm's binary block transfers against a fake VISA resource
+import logging, unittest
+import numpy as np
+from .context import SCTA
+from SCTA.Instrumentation.Comm import Comm
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FakeResource(object):
+	"""Answers TRAC:DATA? with a REAL,32 block and keeps the raw messages written to it."""
+	def __init__(self, levels):
+		self.levels = levels
+		self.output = bytearray()
+		self.written = []
+		self.failing = False
+
+	def write(self, command):
+		if self.failing:
+			raise OSError("connection lost")
+		self.written.append(command)
+		if command.startswith("TRAC:DATA?"):
+			data = self.levels.tobytes()
+			self.output.extend(b"#%d%d" % (len(str(len(data))), len(data)) + data + b"\n")
+
+	def write_raw(self, message):
+		self.written.append(bytes(message))
+
+	def query(self, command):
+		return "1\n"
+
+	def read_bytes(self, count, break_on_termchar=False):
+		data = bytes(self.output[:count])
+		del self.output[:count]
+		return data
+
+class Comm_Test(object):
+
+	def setUp(self):
+		self.levels = np.linspace(-100, -20, 32001).astype('<f4')
+		self.resource = FakeResource(self.levels)
+		self.comm = Comm("SOCKET", "127.0.0.1", rm=self)
+		self.comm.completion = "opc"
+
+	def open_resource(self, port):
+		assert (port == "TCPIP0::127.0.0.1::5025::SOCKET")
+		return self.resource
+
+	def test_queryBinary(self):
+		buffer = np.zeros(40000, dtype='<f4')
+		trace = self.comm.queryBinary("TRAC:DATA? TRACE1", buffer=buffer)
+		assert (len(trace) == 32001)
+		assert (np.array_equal(trace, self.levels))
+		assert (np.shares_memory(trace, buffer))
+		assert (len(self.resource.output) == 0)
+
+	def test_small_buffer(self):
+		try:
+			self.comm.queryBinary("TRAC:DATA? TRACE1", buffer=bytearray(16))
+		except ValueError:
+			pass
+		else:
+			assert False, "a block larger than the buffer should raise ValueError"
+		# the rejected block was read past, so the next one is read whole
+		assert (len(self.resource.output) == 0)
+		assert (np.array_equal(self.comm.queryBinary("TRAC:DATA? TRACE1"), self.levels))
+
+	def test_failedWrite(self):
+		# a setting whose write failed is not skipped the next time
+		self.comm.enableStateCache()
+		self.resource.failing = True
+		try:
+			self.comm.write("SENS:FREQ:CENT 1e9")
+		except OSError:
+			pass
+		else:
+			assert False, "the failed write did not raise"
+		self.resource.failing = False
+		self.comm.write("SENS:FREQ:CENT 1e9")
+		assert (self.resource.written[-1] == "SENS:FREQ:CENT 1e9")
+
+	def test_writeBinary(self):
+		data = np.arange(4, dtype='<f4')
+		self.comm.writeBinary("MMEM:DATA 'cal.dat',", data)
+		assert (self.resource.written[-1] == b"MMEM:DATA 'cal.dat', #216" + data.tobytes() + b"\n")
@@ -0,0 +1,88 @@
+# Testing the multi-instrument executor with local SNMP agents
+import gc, logging, threading, time, unittest, weakref
+from .context import SCTA
+from SCTA.Instrumentation.Executor import InstrumentExecutor, ExecutorError, runAll
+from SCTA.Instrumentation.VTR import VTR
+from SCTA.Simulation.SNMPAgent import SNMPAgent
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class SlowComm(object):
+	"""Records how many threads use it at the same time."""
+	def __init__(self):
+		self.users = 0
+		self.maxUsers = 0
+		self.guard = threading.Lock()
+
+	def write(self, command):
+		with self.guard:
+			self.users += 1
+			self.maxUsers = max(self.maxUsers, self.users)
+		time.sleep(0.05)
+		with self.guard:
+			self.users -= 1
+
+class SlowInstrument(object):
+	def __init__(self, comm):
+		self.comm = comm
+
+	def setFrequency(self, freq):
+		self.comm.write("FREQ %d" % freq)
+		return freq
+
+	def fail(self):
+		raise ValueError("no such setting")
+
+class Executor_Test(object):
+
+	SNR_OID = ".1.3.6.1.4.1.9633.28.1.3.2.7.1.2.1"
+
+	def test_map(self):
+		agents = [SNMPAgent(values={self.SNR_OID: ('int', 10 + i)}).start() for i in range(3)]
+		vtrs = [VTR(ip=agent.ip, port=agent.port) for agent in agents]
+		try:
+			assert (runAll('getSNR', vtrs, 1) == [10.0, 11.0, 12.0])
+		finally:
+			for vtr, agent in zip(vtrs, agents):
+				vtr.close()
+				agent.stop()
+
+	def test_parallel(self):
+		instruments = [SlowInstrument(SlowComm()) for i in range(4)]
+		start = time.perf_counter()
+		with InstrumentExecutor() as executor:
+			results = executor.starmap('setFrequency', [(instrument, (i,)) for i, instrument in enumerate(instruments)])
+		assert (time.perf_counter() - start < 0.15)
+		assert ([result.value for result in results] == [0, 1, 2, 3])
+
+	def test_shared_comm(self):
+		# instruments on one connection must take turns
+		comm = SlowComm()
+		instruments = [SlowInstrument(comm) for i in range(4)]
+		with InstrumentExecutor() as executor:
+			executor.map('setFrequency', instruments, 974e6)
+		assert (comm.maxUsers == 1)
+
+	def test_comm_released(self):
+		# the lock given to a comm does not keep the comm alive
+		comm = SlowComm()
+		with InstrumentExecutor() as executor:
+			executor.map('setFrequency', [SlowInstrument(comm)], 974e6)
+		reference = weakref.ref(comm)
+		del comm
+		gc.collect()
+		assert (reference() is None)
+
+	def test_errors(self):
+		instruments = [SlowInstrument(SlowComm()) for i in range(2)]
+		with InstrumentExecutor() as executor:
+			results = executor.map('fail', instruments)
+		assert (all(isinstance(result.error, ValueError) for result in results))
+		try:
+			runAll('fail', instruments)
+		except ExecutorError as e:
+			assert (len(e.results) == 2)
+		else:
+			assert False, "failed calls did not raise ExecutorError"
@@ -0,0 +1,206 @@
+# Testing the FSW driver against the simulated FSW of Simulation.InstrumentServer
+import json, logging, os, tempfile, time, unittest
+import numpy as np
+from .context import SCTA
+from SCTA.Analysis import analyze, idealPoints
+from SCTA.DataLogging import DataLogger
+from SCTA.utils.spectrum import frequencyAxis
+from SCTA.Instrumentation.FSW import FSW
+from SCTA.System import Transponder
+from SCTA.Instrumentation.Tracing import tracing
+from SCTA.Simulation.InstrumentServer import InstrumentServer
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FSWServer_Test(object):
+
+	def setUp(self):
+		self.server = InstrumentServer(profile="FSW", port=0).start()
+		self.fsw = FSW(type="SOCKET", port="%s::%d" % (self.server.ip, self.server.port))
+
+	def tearDown(self):
+		self.fsw.close()
+		self.server.stop()
+
+	def test_allMeasurements(self):
+		self.server.setValue("CALC2:MARK:FUNC:DDEM:STAT:SNR? AVG", "12.5")
+		measurements = self.fsw.getAllMeasurements(avg=10)
+		assert (measurements == {'mer': 12.5, 'power': -30.0, 'phaseerror': 0.5, 'carrierfreqerror': 100.0})
+		assert (self.server.getValue("SENS:SWE:COUN?") == "10")
+		assert (self.server.getValue("INP:EATT:AUTO?") == "ON")
+		assert (self.server.getValue("INIT:CONT?") == "OFF")
+
+	def test_roundTrips(self):
+		self.fsw.getAllMeasurements(avg=10)
+		with tracing() as tracer:
+			self.fsw.getAllMeasurements(avg=10)
+		headers = dict((header, stats.wall.count) for (instrument, header), stats in tracer.stats.items())
+		# the setup is one batch and the four statistics are one query
+		assert (headers["(batch)"] == 1)
+		assert (headers["CALC2:MARK:FUNC:DDEM:STAT:SNR?"] == 1)
+		assert ("CALC2:MARK:FUNC:DDEM:STAT:MPOW?" not in headers)
+
+	def test_sweep(self):
+		with self.fsw.sweep(avg=10) as measurements:
+			self.server.setValue("CALC2:MARK:FUNC:DDEM:STAT:SNR? AVG", "20")
+			assert (measurements['mer'] == 15.0)
+			assert (self.fsw.getMER() == 15.0)
+			assert (self.fsw.getPower() == -30.0)
+		assert (self.fsw.getMER() == 20.0)
+
+	def test_levelCache(self):
+		# auto level runs before every measurement unless the level cache is asked for
+		assert (self.fsw.levelCache is None)
+		self.fsw.enableLevelCache()
+		self.fsw.setFrequency(1450e6)
+		self.fsw.setNominalPower(-30)
+		self.fsw.getAllMeasurements(avg=10)
+		self.fsw.getAllMeasurements(avg=10)
+		self.fsw.getAllMeasurements(avg=10)
+		assert (self.fsw.levelCache.stats()['hits'] == 2)
+		# a different nominal power levels again
+		self.fsw.setNominalPower(-10)
+		self.fsw.getAllMeasurements(avg=10)
+		assert (self.fsw.levelCache.stats()['misses'] == 2)
+
+	def test_overload(self):
+		self.fsw.enableLevelCache()
+		self.fsw.setFrequency(1450e6)
+		self.fsw.getAllMeasurements(avg=10)
+		self.server.setValue("STAT:QUES:POW:COND?", str(FSW.POWER_OVERLOAD))
+		self.fsw.getAllMeasurements(avg=10)
+		stats = self.fsw.levelCache.stats()
+		assert (stats['hits'] == 1)
+		assert (stats['misses'] == 2)
+		assert (stats['entries'] == 1)
+
+	def test_channelPowers(self):
+		self.fsw.setFrequency(1450e6)
+		self.server.setTrace(np.full(FSW.TRACE_POINTS, -60.0))
+		wide = Transponder(freq=1000e6, symb=30e6, roll=20)
+		narrow = Transponder(freq=1500e6, symb=1e6, roll=20)
+		powers = self.fsw.getChannelPowers([wide, narrow])
+		# the RBW follows the narrowest carrier, which takes two sweeps to resolve
+		rbw = 1.2e6*FSW.CHANNEL_RBW
+		assert (abs(powers[0] - (-60 + 10*np.log10(36e6/rbw))) < 0.1)
+		assert (abs(powers[1] - (-60 + 10*np.log10(1.2e6/rbw))) < 0.1)
+		# and the Spectrum window is left as it was
+		assert (self.server.getValue("SENS:BAND:RES:AUTO?") == "ON")
+		assert (float(self.server.getValue("SENS:FREQ:CENT?")) == 1450e6)
+		assert (self.fsw.getFrequency() == 1450e6)
+
+	def test_stream(self):
+		self.fsw.enableLevelCache()
+		results = list(self.fsw.stream('mer', count=3))
+		assert ([mer for timestamp, mer in results] == [15.0, 15.0, 15.0])
+		assert (results[0][0] <= results[1][0] <= results[2][0])
+		assert (self.fsw.levelCache.stats()['misses'] == 1)
+
+	def test_streamInterval(self):
+		start = time.perf_counter()
+		powers = []
+		for n, (timestamp, power) in enumerate(self.fsw.stream('channelpower', interval=0.05, count=3)):
+			powers.append(power)
+			self.server.setValue("CALC:MARK:FUNC:POW:RES? CPOW", str(-40.0 - n))
+		assert (powers == [-30.0, -40.0, -41.0])
+		assert (time.perf_counter() - start >= 0.1)
+
+	def test_streamLogger(self):
+		path = os.path.join(tempfile.mkdtemp(), "stream")
+		dataLogger = DataLogger(path, 'json')
+		for timestamp, measurements in self.fsw.stream('vsa', count=2, dataLogger=dataLogger):
+			pass
+		with open(dataLogger.getFilePath()) as file:
+			samples = json.load(file)
+		assert (len(samples) == 2)
+		assert (samples[1]['mer'] == 15.0)
+
+	def test_captureIQ(self):
+		symbols = np.tile(idealPoints('8PSK'), 125).astype(np.complex64)
+		self.server.setValue("TRAC4:DATA? TRACE1", symbols.view('<f4'))
+		buffer = np.zeros(2000, dtype=np.complex64)
+		capture = self.fsw.captureIQ(1000, buffer=buffer)
+		assert (np.array_equal(capture, symbols))
+		assert (np.shares_memory(capture, buffer))
+		assert (self.server.getValue("SENS:DDEM:RLEN?") == "1000 SYM")
+		assert (analyze(capture, '8PSK')['evm'] < 1e-3)
+
+	def test_spectrumSNR(self):
+		self.fsw.setSymbolRate(20e6)
+		self.fsw.setAlpha(20)
+		# -100 dBm/Hz of noise over the 60 MHz span, with a 24 MHz wide carrier 25 dB above it at 1 GHz
+		frequencies = frequencyAxis(1e9, 60e6, 1201)
+		density = np.where(np.abs(frequencies - 1e9) <= 12e6, -75.0, -100.0)
+		self.server.setTrace(density + 10*np.log10(100e3))
+		with tracing() as tracer:
+			snr = self.fsw.getSpectrumSNR()
+		assert (abs(snr - 10*np.log10(10**2.5 - 1)) < 0.1)
+		headers = dict((header, stats.wall.count) for (instrument, header), stats in tracer.stats.items())
+		assert (headers["TRAC:DATA?"] == 1)
+
+	def test_recall(self):
+		self.fsw.close()
+		self.fsw = FSW(type="SOCKET", port="%s::%d" % (self.server.ip, self.server.port), recall=True)
+		name = "SCTA_FSW_VSA_%s" % self.fsw.fingerprint()
+		assert (self.fsw.listStates() == [name])
+		assert (self.server.getValue("INST:LIST?") == "'SANALYZER','Spectrum','DDEM','VSA'")
+		# an FSW that already has the setup is left alone
+		assert (self.fsw.restoreSetup('VSA', self.fail) == 'current')
+		# one that was reset recalls the state file
+		self.fsw.reset()
+		assert (self.fsw.restoreSetup('VSA', self.fail) == 'recalled')
+		assert (self.server.getValue("INST:LIST?") == "'SANALYZER','Spectrum','DDEM','VSA'")
+
+	def test_recallChanged(self):
+		self.fsw.close()
+		self.fsw = FSW(type="SOCKET", port="%s::%d" % (self.server.ip, self.server.port), recall=True)
+		# an FSW with the channels but other settings is not taken to have the setup
+		self.fsw.comm.write("SENS:SWE:POIN 32001")
+		assert (self.fsw.restoreSetup('VSA', self.fail) == 'recalled')
+		assert (self.server.getValue("SENS:SWE:POIN?") != "32001")
+
+	def test_recallMatching(self):
+		self.fsw.close()
+		self.fsw = FSW(type="SOCKET", port="%s::%d" % (self.server.ip, self.server.port), recall=True)
+		# a state file of the setup that no longer gives it, listed last, is not recalled instead
+		self.fsw.comm.write("SENS:SWE:POIN 32001")
+		self.fsw.saveState("SCTA_FSW_VSA_ffffffffffff")
+		self.fsw.reset()
+		assert (self.fsw.restoreSetup('VSA', self.fail) == 'recalled')
+		assert (self.server.getValue("SENS:SWE:POIN?") != "32001")
+		assert (self.server.getValue("INST:LIST?") == "'SANALYZER','Spectrum','DDEM','VSA'")
+
+	def test_registers(self):
+		self.fsw.setFrequency(1450e6)
+		self.fsw.saveState(3)
+		self.fsw.setFrequency(974e6)
+		self.fsw.recallState(3)
+		assert (float(self.fsw.comm.query("SENS:FREQ:CENT?")) == 1450e6)
+
+	def test_warm(self):
+		self.fsw.setFrequency(1450e6)
+		self.fsw.close()
+		with tracing() as tracer:
+			self.fsw = FSW(type="SOCKET", port="%s::%d" % (self.server.ip, self.server.port), warm=True)
+		headers = dict((header, stats.wall.count) for (instrument, header), stats in tracer.stats.items())
+		# the FSW is neither reset nor set up again, and keeps its frequency
+		assert ("*RST" not in headers)
+		assert ("INST:CRE" not in headers)
+		assert (self.fsw.getFrequency() == 1450e6)
+		assert (float(self.server.getValue("SENS:FREQ:CENT?")) == 1450e6)
+
+	def test_queryCache(self):
+		# symbol rate changes made outside the script are read unless the query cache is asked for
+		assert (self.fsw.getSymbolRate() == 20e6)
+		self.server.setValue("SENS:DDEM:SRAT", "30000000")
+		assert (self.fsw.getSymbolRate() == 30e6)
+		self.fsw.close()
+		self.fsw = FSW(type="SOCKET", port="%s::%d" % (self.server.ip, self.server.port), queryCache=True)
+		assert (self.fsw.getSymbolRate() == 20e6)
+		self.server.setValue("SENS:DDEM:SRAT", "30000000")
+		assert (self.fsw.getSymbolRate() == 20e6)
+
+	def fail(self):
+		assert False, "the setup should not be rebuilt"
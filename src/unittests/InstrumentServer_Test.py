@@ -0,0 +1,179 @@
+# Testing the simulated SCPI instrument server with TelnetComm and the SLG driver
+import logging, time, unittest
+import numpy as np
+from .context import SCTA
+from SCTA.Instrumentation.TelnetComm import TelnetComm
+from SCTA.Instrumentation.ResourceManagers import RealTelnetResourceManager
+from SCTA.Instrumentation.SLG import SLG
+from SCTA.Instrumentation.Tracing import tracing
+from SCTA.System import Transponder
+from SCTA.Simulation.InstrumentServer import InstrumentServer
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class LateConnection(object):
+	"""Telnet connection whose first *ESR? answer arrives after the read timed out."""
+	def __init__(self):
+		self.answers = []
+		self.late = True
+
+	def write(self, message):
+		if message == b'*ESR?\n':
+			self.answers.append(b'1\n')
+		elif message == b'*IDN?\n':
+			self.answers.append(b'SLG\n')
+
+	def read_until(self, match, timeout=None):
+		if self.late:
+			self.late = False
+			return b''
+		return self.answers.pop(0)
+
+	def open_resource(self, ip, port):
+		return self
+
+class InstrumentServer_Test(object):
+
+	def setUp(self):
+		self.server = InstrumentServer(profile="SLG", port=0, latency={'MOD:CHAN:SYMB': 0.05}).start()
+		self.rm = RealTelnetResourceManager()
+		self.comm = TelnetComm(self.server.ip, self.server.port, rm=self.rm)
+
+	def tearDown(self):
+		self.rm.release((self.server.ip, self.server.port))
+		self.server.stop()
+
+	def test_state(self):
+		assert (self.comm.query("*IDN?").startswith("SLG"))
+		assert (self.comm.query("MOD:CHAN3:FORM:PIL?") == "OFF")
+		self.comm.write("MODulator:CHANnel3:FORM:PIL ON")
+		assert (self.comm.query("MOD:CHAN3:FORM:PIL?") == "ON")
+		assert (self.comm.query("MOD:CHAN4:FORM:PIL?") == "OFF")
+		self.comm.write("*RST")
+		assert (self.comm.query("MOD:CHAN3:FORM:PIL?") == "OFF")
+
+	def test_latency(self):
+		start = time.perf_counter()
+		self.comm.write("MOD:CHAN1:SYMB 30000000")
+		assert (time.perf_counter() - start >= 0.05)
+		assert (float(self.comm.query("MOD:CHAN1:SYMB?")) == 30e6)
+		assert (self.comm.query("*OPC?") == "1")
+
+	def test_statusCompletion(self):
+		comm = TelnetComm(self.server.ip, self.server.port, rm=self.rm, completion="status")
+		comm.write("MOD:CHAN1:SYMB 30000000")
+		assert (comm.completionTimes[-1][1] >= 0.04)
+		assert (float(comm.query("MOD:CHAN1:SYMB?")) == 30e6)
+
+	def test_lateStatus(self):
+		# a late *ESR? answer is waited for, not read as the answer to the next query
+		connection = LateConnection()
+		comm = TelnetComm("127.0.0.1", 5025, rm=connection, completion="status")
+		comm.statusCleared = True
+		comm.write("MOD:CHAN1:ROLL 20")
+		assert (comm.query("*IDN?") == "SLG")
+
+	def test_batch(self):
+		with self.comm.batch():
+			self.comm.write("MOD:CHAN1:ROLL 20")
+			self.comm.write("MOD:CHAN2:ROLL 25")
+		assert (self.server.getValue("MOD:CHAN2:ROLL?") == "25")
+		# relative headers after ';' continue from the previous node
+		assert (self.comm.query("MOD:CHAN1:ROLL?;FORM:PIL?") == "20;OFF")
+
+	def test_abortedBatch(self):
+		# writes thrown away with a batch are not remembered as sent
+		self.comm.enableStateCache()
+		try:
+			with self.comm.batch():
+				self.comm.write("MOD:CHAN1:ROLL 20")
+				raise RuntimeError("aborted")
+		except RuntimeError:
+			pass
+		assert (self.server.getValue("MOD:CHAN1:ROLL?") == "35")
+		self.comm.write("MOD:CHAN1:ROLL 20")
+		assert (self.server.getValue("MOD:CHAN1:ROLL?") == "20")
+
+	def test_driver(self):
+		slg = SLG(ip=self.server.ip, port=self.server.port, numMods=2)
+		assert (slg.getAlpha(1) == 35)
+		assert (slg.getPilots(2) is False)
+		slg.setPilots(True, 2)
+		assert (slg.getPilots(2) is True)
+
+	def test_driverCompletion(self):
+		slg = SLG(ip=self.server.ip, port=self.server.port, numMods=2, completion="status")
+		assert (slg.comm.completion == "status")
+		slg.setPilots(True, 2)
+		assert (slg.getPilots(2) is True)
+
+	def test_warm(self):
+		SLG(ip=self.server.ip, port=self.server.port, numMods=2).setPilots(True, 2)
+		slg = SLG(ip=self.server.ip, port=self.server.port, numMods=2, warm=True)
+		# the settings are read back in one message and none of them is written again
+		assert (slg.comm.cache.skipped == 4)
+		assert (slg.getPilots(2) is True)
+		slg.setPilots(True, 2)
+		assert (slg.comm.cache.skipped == 5)
+
+	def test_inputSource(self):
+		slg = SLG(ip=self.server.ip, port=self.server.port, numMods=2)
+		assert (slg.getInputSource(1) == "PN23 SYNC")
+		slg.setInputSource("LOAD", 1)
+		with tracing() as tracer:
+			slg.setInputSource("PN", 1)
+			slg.setInputSource("PN", 1)
+		headers = dict((header, stats.wall.count) for (instrument, header), stats in tracer.stats.items())
+		# PN is selected, then synchronised, and nothing is sent for a modulator that already has it
+		assert (headers["MOD:CHAN1:SOUR"] == 2)
+		assert (slg.getInputSource(1) == "PN23 SYNC")
+
+	def test_configure(self):
+		slg = SLG(ip=self.server.ip, port=self.server.port, numMods=32)
+		txpdr = Transponder(bcstd="DVB-S2", mod="8PSK", fec="2/3", freq=1450e6, symb=30e6, roll=20, pilots=True)
+		plan = [(mods, txpdr, -20.0 - mods, mods % 2 == 1) for mods in list(range(1, 33))]
+		waits = len(slg.comm.completionTimes)
+		slg.configure(plan)
+		# all 32 modulators are set up with a single wait for operation complete
+		assert (len(slg.comm.completionTimes) == waits + 1)
+		assert (slg.getSymbolRate(32) == 30e6)
+		assert (slg.getConstellation(32) == "8PSK")
+		assert (slg.getPower(5) == -25.0)
+		assert (slg.getModulatorState(2) is False)
+		# nothing is sent again for an unchanged plan
+		slg.configure(plan)
+		assert (len(slg.comm.completionTimes) == waits + 1)
+
+	def test_binary(self):
+		levels = np.linspace(-100, -20, 1001).astype('<f4')
+		levels[500] = np.frombuffer(b'\xff\x0a\xff\x0a', dtype='<f4')[0]	# bytes that look like telnet commands and newlines
+		self.server.setTrace(levels)
+		self.comm.write("FORM REAL,32")
+		buffer = bytearray(8192)
+		trace = self.comm.queryBinary("TRAC:DATA? TRACE1", buffer=buffer)
+		assert (np.array_equal(trace, levels, equal_nan=True))
+		assert (np.shares_memory(trace, np.frombuffer(buffer, dtype='u1')))
+		# the connection is still in step for text queries
+		assert (self.comm.query("*IDN?").startswith("SLG"))
+		self.comm.write("FORM ASC")
+		assert (self.comm.query("TRAC:DATA? TRACE1").startswith("-100,"))
+
+	def test_bufferedBinary(self):
+		levels = np.linspace(-100, -20, 1001).astype('<f4')
+		self.server.setTrace(levels)
+		self.comm.write("FORM REAL,32")
+		# telnetlib reads ahead, so part of an earlier answer is still in its buffers
+		self.comm.connection.write(b"*IDN?\n")
+		time.sleep(0.1)
+		assert (self.comm.connection.read_until(b'S', timeout=1) == b'S')
+		trace = self.comm.queryBinary("TRAC:DATA? TRACE1")
+		assert (np.array_equal(trace, levels))
+		assert (self.comm.query("*IDN?").startswith("SLG"))
+
+	def test_writeBinary(self):
+		data = bytes(range(256)) * 4
+		self.comm.writeBinary("MMEM:DATA 'cal.dat',", data)
+		assert (self.server.getValue("MMEM:DATA?") == data)
+		assert (bytes(self.comm.queryBinary("MMEM:DATA? 'cal.dat'", dtype='u1')) == data)
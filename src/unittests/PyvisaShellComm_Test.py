@@ -0,0 +1,64 @@
+# Testing PyvisaShellComm's buffered reader against a fake serial console
+import logging, unittest
+from .context import SCTA
+from SCTA.Instrumentation.PyvisaShellComm import PyvisaShellComm
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FakeConsole(object):
+	"""Echoes commands like a serial shell, wrapping the echo at 80 columns, and answers from a dictionary."""
+	def __init__(self, outputs):
+		self.outputs = outputs
+		self.received = bytearray()
+		self.reads = 0
+		self.timeout = 5000
+
+	def write(self, command):
+		line = "root@jester:~# " + command
+		echo = "\r\n".join(line[i:i + 80] for i in range(0, len(line), 80)) + "\r\n"
+		self.received.extend(echo[len("root@jester:~# "):].encode('ascii'))
+		self.received.extend(self.outputs[command].encode('ascii'))
+		self.received.extend(b"root@jester:~# ")
+
+	@property
+	def bytes_in_buffer(self):
+		return len(self.received)
+
+	def read_bytes(self, count):
+		self.reads += 1
+		data = bytes(self.received[:count])
+		del self.received[:count]
+		return data
+
+class PyvisaShellComm_Test(object):
+
+	LOG = "".join("line %d of the log\r\n" % i for i in range(10000))
+
+	def setUp(self):
+		outputs = {"uname": "Linux\r\n", "true": "", "cat /var/log/messages": self.LOG, "echo " + "x" * 100: "x" * 100 + "\r\n"}
+		self.console = FakeConsole(outputs)
+		self.comm = PyvisaShellComm("Serial", 1, rm=self)
+
+	def open_resource(self, port):
+		return self.console
+
+	def test_query(self):
+		assert (self.comm.query("uname") == "Linux")
+		assert (self.comm.query("true") == "")
+
+	def test_wrapped_echo(self):
+		assert (self.comm.query("echo " + "x" * 100) == "x" * 100)
+
+	def test_large_output(self):
+		output = self.comm.query("cat /var/log/messages")
+		assert (output.split("\n")[-1] == "line 9999 of the log")
+		# the whole dump is drained in one read rather than one per line
+		assert (self.console.reads < 10)
+
+	def test_iterQuery(self):
+		lines = self.comm.iterQuery("cat /var/log/messages")
+		assert (next(lines) == "line 0 of the log")
+		assert (sum(1 for line in lines) == 9999)
+		assert (self.comm.cwd_prompt == "root@jester:~# ")
@@ -0,0 +1,157 @@
+# Testing session recording and replay against a local SNMP agent
+import logging, os, tempfile, time, unittest
+import numpy as np
+from .context import SCTA
+from SCTA.Instrumentation.FSW import FSW
+from SCTA.Instrumentation.SLG import SLG
+from SCTA.Instrumentation.VTR import VTR
+from SCTA.Instrumentation.Recorder import record, replay, summarize, load, ReplayError
+from SCTA.Simulation.InstrumentServer import InstrumentServer
+from SCTA.Simulation.SNMPAgent import SNMPAgent
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class Recorder_Test(object):
+
+	VALUES = {
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.2.1": ('int', 12),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.4.1": ('int', -35),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.5.1": ('int', 1),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.7.1": ('counter', 100000),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.8.1": ('counter', 0),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.10.1": ('counter', 3),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.13.0": ('int', -2),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.15.0": ('counter', 50),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.17.0": ('counter', 0),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.24.0": ('int', 45000000)
+	}
+
+	def setUp(self):
+		self.agent = SNMPAgent(values=self.VALUES).start()
+		handle, self.path = tempfile.mkstemp(suffix='.session.gz')
+		os.close(handle)
+		with record(self.path):
+			vtr = VTR(ip=self.agent.ip, port=self.agent.port)
+			self.status = vtr.getStatus(1)
+			self.snr = vtr.getSNR(1)
+			vtr.close()
+		self.agent.stop()
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def run(self, realtime=False):
+		with replay(self.path, realtime=realtime):
+			vtr = VTR(ip=self.agent.ip, port=self.agent.port)
+			status = vtr.getStatus(1)
+			snr = vtr.getSNR(1)
+			vtr.close()
+		return status, snr
+
+	def test_record(self):
+		entries = load(self.path)
+		assert ([entry['op'] for entry in entries] == ['open', 'query', 'query'])
+		assert (entries[0]['cls'] == 'SNMPComm')
+		assert (all(entry['d'] >= 0 for entry in entries[1:]))
+
+	def test_replay(self):
+		# the agent is stopped, so every answer comes from the session file
+		status, snr = self.run()
+		assert (status == self.status)
+		assert (snr == self.snr)
+
+	def test_realtime(self):
+		start = time.perf_counter()
+		self.run(realtime=True)
+		assert (time.perf_counter() - start >= summarize(self.path)['instrument'])
+
+	def test_mismatch(self):
+		with replay(self.path):
+			vtr = VTR(ip=self.agent.ip, port=self.agent.port)
+			try:
+				vtr.getSNR(1)
+			except ReplayError:
+				pass
+			else:
+				assert False, "replaying a different call should raise ReplayError"
+
+	def test_summarize(self):
+		summary = summarize(self.path)
+		assert (summary['calls'] == 2)
+		assert (summary['operations']['query']['calls'] == 2)
+		assert (abs(summary['overhead'] + summary['instrument'] - summary['wall']) < 1e-9)
+
+class FSWRecorder_Test(object):
+
+	def setUp(self):
+		self.server = InstrumentServer(profile="FSW", port=0).start()
+		self.port = "%s::%d" % (self.server.ip, self.server.port)
+		self.server.setTrace(np.linspace(-100, -20, 1001).astype('<f4'))
+		handle, self.path = tempfile.mkstemp(suffix='.session.gz')
+		os.close(handle)
+		with record(self.path):
+			fsw = FSW(type="SOCKET", port=self.port, window="Spectrum")
+			self.frequencies, self.levels = fsw.getTrace()
+			fsw.comm.writeBinary("MMEM:DATA 'cal.dat',", self.levels)
+			self.settings = fsw.comm.readBack(["SENS:FREQ:CENT?", "SENS:FREQ:SPAN?"])
+			fsw.close()
+		self.server.stop()
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def test_replay(self):
+		# binary blocks are replayed from the session file, into the script's buffer when it passes one
+		buffer = np.zeros(2000, dtype='<f4')
+		with replay(self.path):
+			fsw = FSW(type="SOCKET", port=self.port, window="Spectrum")
+			frequencies, levels = fsw.getTrace(buffer=buffer)
+			fsw.comm.writeBinary("MMEM:DATA 'cal.dat',", levels)
+			settings = fsw.comm.readBack(["SENS:FREQ:CENT?", "SENS:FREQ:SPAN?"])
+			fsw.close()
+		assert (np.array_equal(frequencies, self.frequencies))
+		assert (np.array_equal(levels, self.levels))
+		assert (np.shares_memory(levels, buffer))
+		assert (settings == self.settings)
+
+	def test_summarize(self):
+		operations = summarize(self.path)['operations']
+		assert (operations['queryBinary']['calls'] == 1)
+		assert (operations['writeBinary']['calls'] == 1)
+
+class DriverRecorder_Test(object):
+
+	def setUp(self):
+		handle, self.path = tempfile.mkstemp(suffix='.session.gz')
+		os.close(handle)
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def check_replay(self, profile, script):
+		# a script replays the session it recorded against the simulated instrument, after it stopped
+		server = InstrumentServer(profile=profile, port=0).start()
+		try:
+			with record(self.path):
+				recorded = script(server.ip, server.port)
+		finally:
+			server.stop()
+		with replay(self.path):
+			replayed = script(server.ip, server.port)
+		assert (replayed == recorded)
+
+	def test_recall(self):
+		def script(ip, port):
+			FSW(type="SOCKET", port="%s::%d" % (ip, port), recall=True).close()
+			fsw = FSW(type="SOCKET", port="%s::%d" % (ip, port), recall=True)
+			return fsw.listStates()
+		self.check_replay("FSW", script)
+
+	def test_warm(self):
+		def script(ip, port):
+			SLG(ip=ip, port=port, numMods=2).setPilots(True, 2)
+			slg = SLG(ip=ip, port=port, numMods=2, warm=True)
+			return [slg.getPilots(2), slg.getInputSource(1)]
+		self.check_replay("SLG", script)
@@ -0,0 +1,129 @@
+# Testing the connection pool of the Telnet resource manager against a local TCP server
+import logging, socket, threading, time, unittest
+from .context import SCTA
+from SCTA.Instrumentation.ResourceManagers import RealTelnetResourceManager
+from SCTA.Instrumentation.TelnetComm import TelnetComm
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class EchoServer(object):
+	"""Echoes lines back and counts accepted connections. dropAll() closes every open session."""
+	def __init__(self):
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.bind(("127.0.0.1", 0))
+		self.server.listen(5)
+		self.port = self.server.getsockname()[1]
+		self.accepted = 0
+		self.clients = []
+		self.thread = threading.Thread(target=self.serve)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def serve(self):
+		while True:
+			try:
+				client, address = self.server.accept()
+			except OSError:
+				return
+			self.accepted += 1
+			self.clients.append(client)
+			worker = threading.Thread(target=self.echo, args=(client,))
+			worker.daemon = True
+			worker.start()
+
+	def echo(self, client):
+		try:
+			while True:
+				data = client.recv(1024)
+				if not data:
+					return
+				client.sendall(data)
+		except OSError:
+			return
+
+	def dropAll(self):
+		for client in self.clients:
+			client.shutdown(socket.SHUT_RDWR)
+			client.close()
+		self.clients = []
+
+	def stop(self):
+		self.dropAll()
+		self.server.close()
+
+class ResourceManagers_Test(object):
+
+	def setUp(self):
+		self.server = EchoServer()
+		self.rm = RealTelnetResourceManager()
+
+	def tearDown(self):
+		self.rm.release(("127.0.0.1", self.server.port))
+		self.server.stop()
+
+	def query(self, connection, text):
+		connection.write(text + b'\n')
+		return connection.read_until(b'\n', timeout=1)
+
+	def test_reuse(self):
+		first = self.rm.open_resource("127.0.0.1", self.server.port)
+		second = self.rm.open_resource("127.0.0.1", self.server.port)
+		assert (first is second)
+		assert (self.query(first, b'*IDN?') == b'*IDN?\n')
+		stats = self.rm.stats()
+		assert (stats['hits'] == 1 and stats['misses'] == 1 and stats['open'] == 1)
+		assert (self.server.accepted == 1)
+
+	def test_reconnect(self):
+		self.rm.probeInterval = 0
+		connection = self.rm.open_resource("127.0.0.1", self.server.port)
+		assert (self.query(connection, b'one') == b'one\n')
+		self.server.dropAll()
+		time.sleep(0.1)
+		# the probe finds the session dead and the same object carries on over a new one
+		assert (self.query(connection, b'two') == b'two\n')
+		assert (self.rm.stats()['reconnects'] >= 1)
+		assert (self.server.accepted == 2)
+
+	def test_evict(self):
+		self.rm.idleTimeout = 0.05
+		connection = self.rm.open_resource("127.0.0.1", self.server.port)
+		time.sleep(0.1)
+		self.rm.evictIdle()
+		assert (self.rm.stats()['evictions'] == 1)
+		assert (self.rm.stats()['open'] == 0)
+		assert (self.query(connection, b'back') == b'back\n')
+		assert (self.rm.stats()['open'] == 1)
+
+	def test_noReadRetry(self):
+		connection = self.rm.open_resource("127.0.0.1", self.server.port)
+		assert (self.query(connection, b'one') == b'one\n')
+		self.server.dropAll()
+		time.sleep(0.1)
+		# the answer to a query sent on the dead session is lost, so the read raises instead of waiting on a new one
+		try:
+			connection.read_until(b'\n', timeout=1)
+		except EOFError:
+			pass
+		else:
+			assert False, "a read on a dead session did not raise"
+		assert (self.rm.stats()['reconnects'] == 1)
+		assert (self.query(connection, b'two') == b'two\n')
+
+	def test_sharedSession(self):
+		# comms on one session take turns for each query and its answer
+		comms = [TelnetComm("127.0.0.1", self.server.port, commands='raw', rm=self.rm) for i in range(2)]
+		assert (comms[0].lock is comms[1].lock)
+		answers = {0: [], 1: []}
+		def run(number):
+			for i in range(200):
+				command = "comm%d-%d" % (number, i)
+				answers[number].append(comms[number].query(command) == command)
+		threads = [threading.Thread(target=run, args=(number,)) for number in answers]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		assert (all(answers[0]) and all(answers[1]))
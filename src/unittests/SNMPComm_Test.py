@@ -0,0 +1,138 @@
+# Testing SNMPComm against a local SNMP agent
+import logging, unittest
+from .context import SCTA
+from SCTA.Instrumentation.SNMPComm import SNMPComm
+from SCTA.Instrumentation.SNMP import SNMPError
+from SCTA.Simulation.SNMPAgent import SNMPAgent
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class SNMPComm_Test(object):
+
+	FREQ_OID = ".1.3.6.1.4.1.9633.24.1.3.1.4.1.5.1"
+	POWER_OID = ".1.3.6.1.4.1.9633.24.1.3.1.4.1.6.1"
+	NAME_OID = ".1.3.6.1.2.1.1.5.0"
+	VALUES = {
+		FREQ_OID: ('int', 974000000),
+		POWER_OID: ('int', -300),
+		NAME_OID: ('str', 'VTM')
+	}
+	TEST_FREQS = [950000000, 1450000000, 2150000000]
+	TEST_POWERS = [-700, -350, 0, 127, 128, -129]
+
+	def setUp(self):
+		self.agent = SNMPAgent(values=self.VALUES).start()
+		self.comm = SNMPComm(ip=self.agent.ip, port=self.agent.port, timeout=0.5, retries=1)
+
+	def tearDown(self):
+		self.comm.close()
+		self.agent.stop()
+
+	def test_query(self):
+		assert (self.comm.query(self.FREQ_OID) == "974000000")
+		assert (self.comm.query(self.POWER_OID) == "-300")
+		assert (self.comm.query(self.NAME_OID) == "VTM")
+
+	def test_write(self):
+		for freq in self.TEST_FREQS:
+			yield self.check_write, self.FREQ_OID, freq
+
+	def test_write_signed(self):
+		for power in self.TEST_POWERS:
+			yield self.check_write, self.POWER_OID, power
+
+	def check_write(self, oid, value):
+		self.comm.write(oid + " -val:%d" % value)
+		assert (int(self.comm.query(oid)) == value)
+
+	def test_write_type(self):
+		self.comm.write(self.NAME_OID + " -val:VTM-2 -tp:str")
+		assert (self.comm.query(self.NAME_OID) == "VTM-2")
+
+	def test_write_timeout(self):
+		# the SnmpSet.exe timeout option of VTM.setVTMMode is accepted and left out of the value
+		assert (self.comm.parse(self.FREQ_OID + " -val:5 -t:60") == (self.FREQ_OID, 5, 'int'))
+		self.comm.write(self.FREQ_OID + " -val:%d -t:60" % self.TEST_FREQS[1])
+		assert (int(self.comm.query(self.FREQ_OID)) == self.TEST_FREQS[1])
+
+	def test_write_delayed(self):
+		# equipment that applies sets slowly is read back until the value settles
+		self.agent.setDelay = 0.2
+		self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[0])
+		assert (int(self.comm.query(self.FREQ_OID)) == self.TEST_FREQS[0])
+
+	def test_noSuchObject(self):
+		try:
+			self.comm.query(".1.3.6.1.4.1.9633.99.0")
+		except SNMPError:
+			pass
+		else:
+			assert False, "missing OID did not raise SNMPError"
+
+	def test_timeout(self):
+		self.comm.community = "wrong"	# the agent ignores other communities
+		try:
+			self.comm.query(self.FREQ_OID)
+		except TimeoutError:
+			pass
+		else:
+			assert False, "unanswered request did not raise TimeoutError"
+
+	def test_query_list(self):
+		requests = self.agent.requests
+		values = self.comm.query([self.FREQ_OID, self.POWER_OID, self.NAME_OID])
+		assert (values == ["974000000", "-300", "VTM"])
+		assert (self.agent.requests == requests + 1)
+
+	def test_write_list(self):
+		requests = self.agent.requests
+		self.comm.write([(self.FREQ_OID, self.TEST_FREQS[1]), (self.POWER_OID, -350), (self.NAME_OID, "VTM-3", "str")])
+		assert (self.comm.query([self.FREQ_OID, self.POWER_OID, self.NAME_OID]) == [str(self.TEST_FREQS[1]), "-350", "VTM-3"])
+		# one SetRequest and one GetRequest to confirm it, then the query
+		assert (self.agent.requests == requests + 3)
+
+	def test_batch(self):
+		requests = self.agent.requests
+		with self.comm.batch():
+			self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[2])
+			self.comm.write(self.POWER_OID + " -val:-700")
+			assert (self.agent.requests == requests)
+		assert (self.agent.requests == requests + 2)
+		assert (self.comm.query([self.FREQ_OID, self.POWER_OID]) == [str(self.TEST_FREQS[2]), "-700"])
+
+	def test_batch_query(self):
+		# a query inside a batch reads the values set before it
+		with self.comm.batch():
+			self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[1])
+			assert (self.comm.query(self.FREQ_OID) == str(self.TEST_FREQS[1]))
+			self.comm.write(self.POWER_OID + " -val:-350")
+		assert (self.comm.query(self.POWER_OID) == "-350")
+
+	def test_abortedBatch(self):
+		self.comm.enableStateCache()
+		try:
+			with self.comm.batch():
+				self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[0])
+				raise RuntimeError("aborted")
+		except RuntimeError:
+			pass
+		self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[0])
+		assert (self.comm.query(self.FREQ_OID) == str(self.TEST_FREQS[0]))
+
+	def test_walk(self):
+		table = self.comm.walk(".1.3.6.1.4.1.9633.24.1.3.1.4.1")
+		assert (list(table.items()) == [(self.FREQ_OID, "974000000"), (self.POWER_OID, "-300")])
+		assert (self.comm.bulk([self.POWER_OID], maxRepetitions=5) == [])
+
+	def test_stateCache(self):
+		self.comm.enableStateCache()
+		self.comm.write([(self.FREQ_OID, self.TEST_FREQS[0]), (self.POWER_OID, -300)])
+		requests = self.agent.requests
+		self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[0])
+		self.comm.write([(self.FREQ_OID, self.TEST_FREQS[0]), (self.POWER_OID, -300)])
+		assert (self.agent.requests == requests)
+		self.comm.invalidate(self.FREQ_OID)
+		self.comm.write(self.FREQ_OID + " -val:%d" % self.TEST_FREQS[0])
+		assert (self.agent.requests > requests)
@@ -0,0 +1,110 @@
+# Testing SSHComm's persistent shells against a local /bin/sh standing in for an SSH channel
+import logging, queue, socket, subprocess, threading, time, unittest
+from .context import SCTA
+from SCTA.Instrumentation.SSHComm import SSHComm
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class LocalChannel(object):
+	"""The part of paramiko's Channel used by ShellChannel, backed by a local process."""
+	def __init__(self, transport):
+		self.transport = transport
+		self.closed = False
+		self.timeout = None
+		self.stdout = queue.Queue()
+		self.stderr = queue.Queue()
+
+	def exec_command(self, command):
+		self.transport.sessions += 1
+		self.process = subprocess.Popen([command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		for pipe, output in ((self.process.stdout, self.stdout), (self.process.stderr, self.stderr)):
+			reader = threading.Thread(target=self.pump, args=(pipe, output))
+			reader.daemon = True
+			reader.start()
+
+	def pump(self, pipe, output):
+		for data in iter(lambda: pipe.read1(65536), b''):
+			output.put(data)
+
+	def settimeout(self, timeout):
+		self.timeout = timeout
+
+	def sendall(self, data):
+		self.process.stdin.write(data)
+		self.process.stdin.flush()
+
+	def recv(self, size):
+		try:
+			return self.stdout.get(timeout=self.timeout)
+		except queue.Empty:
+			raise socket.timeout()
+
+	def recv_stderr_ready(self):
+		return not self.stderr.empty()
+
+	def recv_stderr(self, size):
+		return self.stderr.get()
+
+	def close(self):
+		if not self.closed:
+			self.closed = True
+			self.process.stdin.close()
+			self.process.wait()
+
+class LocalTransport(object):
+	def __init__(self):
+		self.sessions = 0
+	def open_session(self):
+		return LocalChannel(self)
+
+class LocalClient(object):
+	def __init__(self):
+		self.transport = LocalTransport()
+	def get_transport(self):
+		return self.transport
+
+class LocalResourceManager(object):
+	def open_resource(self, ip, username, password):
+		return LocalClient()
+
+class SSHComm_Test(object):
+
+	def setUp(self):
+		self.comm = SSHComm("127.0.0.1", "root", "", rm=LocalResourceManager(), persistent=True, channels=2)
+
+	def tearDown(self):
+		self.comm.close()
+
+	def test_query(self):
+		assert (self.comm.query("echo hello") == "hello")
+		assert (self.comm.query("printf 'a\\nb\\n'") == "a\nb")
+		assert (self.comm.query("true") == "")
+		assert (self.comm.query("echo oops >&2", stream="stderr") == "oops")
+
+	def test_exitStatus(self):
+		shell = self.comm.shells.get()
+		try:
+			for command, status in [("false", 1), ("true", 0), ("sh -c 'exit 3'", 3)]:
+				shell.receive(shell.send(command))
+				assert (shell.exitStatus == status)
+		finally:
+			self.comm.shells.put(shell)
+
+	def test_state(self):
+		# the shell persists between commands
+		self.comm.write("COUNTER=41")
+		assert (self.comm.query("echo $((COUNTER + 1))") == "42")
+
+	def test_queryAll(self):
+		results = self.comm.queryAll(["echo %d" % i for i in range(10)])
+		assert (results == [str(i) for i in range(10)])
+		# no new sessions per command
+		assert (self.comm.instrument.get_transport().sessions == 2)
+
+	def test_reopen(self):
+		shell = self.comm.shells.get()
+		shell.close()
+		self.comm.shells.put(shell)
+		assert (self.comm.queryAll(["echo a", "echo b"]) == ["a", "b"])
@@ -0,0 +1,51 @@
+# Testing channel power integration over spectrum traces
+import logging, unittest
+import numpy as np
+from .context import SCTA
+from SCTA.utils.spectrum import frequencyAxis, stitch, channelPowers, signalToNoise
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class Spectrum_Test(object):
+
+	RBW = 100e3
+
+	def setUp(self):
+		# -100 dBm/Hz noise floor from 900 MHz to 1100 MHz, with a 20 MHz wide carrier 30 dB above it at 1 GHz
+		self.frequencies = frequencyAxis(1e9, 200e6, 20001)
+		density = np.full(len(self.frequencies), -100.0)
+		density[np.abs(self.frequencies - 1e9) <= 10e6] = -70.0
+		self.levels = density + 10*np.log10(self.RBW)
+
+	def test_flat(self):
+		# 1 MHz of -100 dBm/Hz is -40 dBm, even for channels that cut bins in half
+		powers = channelPowers(self.frequencies, self.levels, [950e6, 950.0025e6, 1050e6], [1e6, 1e6, 1e6], self.RBW)
+		assert (np.allclose(powers, -40.0, atol=0.01))
+
+	def test_carrier(self):
+		powers = channelPowers(self.frequencies, self.levels, [1e9], [20e6], self.RBW)
+		assert (abs(powers[0] - (-70 + 10*np.log10(20e6))) < 0.05)
+
+	def test_outside(self):
+		powers = channelPowers(self.frequencies, self.levels, [1e9, 1.2e9], [20e6, 20e6], self.RBW)
+		assert (not np.isnan(powers[0]))
+		assert (np.isnan(powers[1]))
+
+	def test_stitch(self):
+		low = (self.frequencies[:12000], self.levels[:12000])
+		high = (self.frequencies[10000:], self.levels[10000:])
+		frequencies, levels = stitch([high, low])
+		assert (np.array_equal(frequencies, self.frequencies))
+		assert (np.array_equal(levels, self.levels))
+
+	def test_signalToNoise(self):
+		results = signalToNoise(self.frequencies, self.levels, 1e9, 20e6, [(-90e6, -20e6), (20e6, 90e6)], self.RBW)
+		assert (abs(results['noisedensity'] - (-100.0)) < 0.01)
+		assert (abs(results['snr'] - 10*np.log10(10**3.0 - 1)) < 0.05)
+		assert (abs(results['noise'] - (-100 + 10*np.log10(20e6))) < 0.01)
+
+	def test_noSignal(self):
+		results = signalToNoise(self.frequencies, self.levels, 950e6, 20e6, [(20e6, 40e6)], self.RBW)
+		assert (np.isnan(results['snr']))
@@ -0,0 +1,90 @@
+# Testing the comm latency tracer against the simulated instruments
+import csv, json, logging, os, tempfile, time, unittest
+from .context import SCTA
+from SCTA.Instrumentation.Tracing import Histogram, Tracer, tracing, getTracer
+from SCTA.Instrumentation.TelnetComm import TelnetComm
+from SCTA.Instrumentation.SNMPComm import SNMPComm
+from SCTA.Instrumentation.ResourceManagers import RealTelnetResourceManager
+from SCTA.Simulation.InstrumentServer import InstrumentServer
+from SCTA.Simulation.SNMPAgent import SNMPAgent
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class Histogram_Test(object):
+
+	def test_percentile(self):
+		histogram = Histogram()
+		for seconds in [0.001] * 90 + [0.1] * 10:
+			histogram.add(seconds)
+		assert (histogram.count == 100)
+		assert (abs(histogram.total - 1.09) < 1e-9)
+		assert (0.001 <= histogram.percentile(50) < 0.002)
+		assert (histogram.percentile(99) == 0.1)
+
+	def test_merge(self):
+		a, b = Histogram(), Histogram()
+		a.add(0.5)
+		b.add(2.0)
+		a.merge(b)
+		assert ((a.count, a.min, a.max) == (2, 0.5, 2.0))
+
+class Tracer_Test(object):
+
+	def setUp(self):
+		self.server = InstrumentServer(profile="SLG", port=0, latency={'MOD:CHAN:SYMB': 0.02}).start()
+		self.rm = RealTelnetResourceManager()
+		self.comm = TelnetComm(self.server.ip, self.server.port, rm=self.rm)
+		self.agent = SNMPAgent(values={".1.3.6.1.2.1.1.5.0": ('str', 'VTM')}).start()
+		self.snmp = SNMPComm(ip=self.agent.ip, port=self.agent.port)
+
+	def tearDown(self):
+		self.snmp.close()
+		self.agent.stop()
+		self.rm.release((self.server.ip, self.server.port))
+		self.server.stop()
+
+	def run(self):
+		with tracing() as tracer:
+			for rate in [20e6, 25e6, 30e6]:
+				self.comm.write("MODulator:CHANnel1:SYMBol %d" % rate)
+			self.comm.query("MOD:CHAN1:SYMB?")
+			self.snmp.query(".1.3.6.1.2.1.1.5.0")
+		return tracer
+
+	def test_record(self):
+		tracer = self.run()
+		assert (getTracer() is None)
+		rows = dict(((row['instrument'], row['header']), row) for row in tracer.summary())
+		write = rows[(self.comm.name, "MOD:CHAN1:SYMB")]
+		assert (write['calls'] == 3)
+		assert (write['opc'] >= 0.06)
+		assert (write['opc'] <= write['total'])
+		assert (rows[(self.comm.name, "MOD:CHAN1:SYMB?")]['received'] > 0)
+		assert (rows[(self.snmp.name, "GET .1.3.6.1.2.1.1.5.0")]['calls'] == 1)
+		assert (rows[(self.comm.name, "*")]['calls'] == 4)
+
+	def test_export(self):
+		tracer = self.run()
+		directory = tempfile.mkdtemp()
+		jsonPath = os.path.join(directory, "trace.json")
+		csvPath = os.path.join(directory, "trace.csv")
+		tracer.export(jsonPath)
+		tracer.export(csvPath)
+		with open(jsonPath) as file:
+			trace = json.load(file)
+		assert (trace['elapsed'] > 0)
+		assert (len(trace['histograms']) == 3)
+		assert (sum(trace['histograms'][0]['wall']['buckets']) == trace['histograms'][0]['wall']['count'])
+		with open(csvPath) as file:
+			rows = list(csv.DictReader(file))
+		assert (len(rows) == len(tracer.summary()))
+		assert (sorted(rows[0]) == sorted(Tracer.COLUMNS))
+		os.remove(jsonPath)
+		os.remove(csvPath)
+		os.rmdir(directory)
+
+	def test_off(self):
+		self.comm.query("MOD:CHAN1:SYMB?")
+		assert (getTracer() is None)
@@ -0,0 +1,71 @@
+# Testing VTR status reads and telemetry against a local SNMP agent
+import logging, time, unittest
+from .context import SCTA
+from SCTA.Instrumentation.VTR import VTR
+from SCTA.Simulation.SNMPAgent import SNMPAgent
+
+# Setup debug logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class VTR_Test(object):
+
+	VALUES = {
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.2.1": ('int', 12),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.4.1": ('int', -35),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.5.1": ('int', 1),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.7.1": ('counter', 100000),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.8.1": ('counter', 0),
+		".1.3.6.1.4.1.9633.28.1.3.2.7.1.10.1": ('counter', 3),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.13.0": ('int', -2),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.15.0": ('counter', 50),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.17.0": ('counter', 0),
+		".1.3.6.1.4.1.9633.28.1.3.2.1.24.0": ('int', 45000000)
+	}
+
+	def setUp(self):
+		self.agent = SNMPAgent(values=self.VALUES).start()
+		self.vtr = VTR(ip=self.agent.ip, port=self.agent.port)
+
+	def tearDown(self):
+		self.vtr.close()
+		self.agent.stop()
+
+	def test_getStatus(self):
+		requests = self.agent.requests
+		status = self.vtr.getStatus(1)
+		assert (self.agent.requests == requests + 1)
+		assert (status['snr'] == 12.0)
+		assert (status['lock'] is True)
+		assert (status['packets'] == 100000)
+		assert (status['skew'] == -2)
+		assert (status['dataRate'] == 45e6)
+
+	def test_getters(self):
+		assert (self.vtr.getSNR(1) == 12.0)
+		assert (self.vtr.getDemodLock(1) is True)
+		assert (self.vtr.getPacketErrorCount(1) == 3)
+
+	def test_telemetry(self):
+		self.vtr.startTelemetry(1, names=['snr', 'lock', 'packets'], rate=50)
+		time.sleep(0.3)
+		self.agent.setValue(".1.3.6.1.4.1.9633.28.1.3.2.7.1.7.1", 'counter', 200000)
+		time.sleep(0.2)
+		self.vtr.stopTelemetry()
+		data = self.vtr.getTelemetry()
+		count = len(data['time'])
+		assert (count >= 10)
+		assert (sorted(data) == ['lock', 'packets', 'snr', 'time'])
+		assert (all(len(data[name]) == count for name in data))
+		assert (all(data['time'][1:] >= data['time'][:-1]))
+		assert (data['packets'][0] == 100000)
+		assert (data['packets'][-1] == 200000)
+
+	def test_telemetry_ring(self):
+		telemetry = self.vtr.startTelemetry(1, names=['snr'], rate=100, size=5)
+		time.sleep(0.2)
+		self.vtr.stopTelemetry()
+		data = self.vtr.getTelemetry()
+		assert (telemetry.count > 5)
+		assert (len(data['snr']) == 5)
+		assert (all(data['time'][1:] >= data['time'][:-1]))